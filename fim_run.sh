@@ -17,10 +17,14 @@ usage ()
     echo '  -j/--jobLimit   : max number of concurrent jobs to run. Default 1 job at time. 1 outputs'
     echo '                    stdout and stderr to terminal and logs. With >1 outputs progress and logs the rest'
     echo '  -o/--overwrite  : overwrite outputs if already exist'
+    echo '  -r/--resume     : resume an interrupted run. Steps of each HUC that completed are skipped and'
+    echo '                    only incomplete steps are rerun'
     echo '  -p/--production : only save final inundation outputs'
     echo '  -w/--whitelist  : list of files to save in a production run in addition to final inundation outputs'
     echo '                     ex: file1.tif,file2.json,file3.csv'
     echo '  -v/--viz        : compute post-processing on outputs to be used in viz'
+    echo '  -q/--queue      : work-queue mode for several nodes sharing outputDataDir. Start the same command on each'
+    echo '                    node; HUCs are claimed through lease files and finished HUCs are skipped on restart'
     exit
 }
 
@@ -59,6 +63,9 @@ in
     -o|--overwrite)
         overwrite=1
         ;;
+    -r|--resume)
+        resume=1
+        ;;
     -p|--production)
         production=1
         ;;
@@ -69,6 +76,9 @@ in
     -v|--viz)
         viz=1
         ;;
+    -q|--queue)
+        queue=1
+        ;;
     *) ;;
     esac
     shift
@@ -107,6 +117,7 @@ export extent=$extent
 export production=$production
 export whitelist=$whitelist
 export viz=$viz
+export resume=$resume
 logFile=$outputRunDataDir/logs/summary.log
 
 ## Define inputs
@@ -117,20 +128,30 @@ export input_nwm_flows=$inputDataDir/nwm_hydrofabric/nwm_flows.gpkg
 export input_nhd_flowlines=$inputDataDir/nhdplus_vectors_aggregate/agg_nhd_streams_adj.gpkg
 export input_nhd_headwaters=$inputDataDir/nhdplus_vectors_aggregate/agg_nhd_headwaters_adj.gpkg
 export input_GL_boundaries=$inputDataDir/landsea/gl_water_polygons.gpkg
+export input_partitioned_vectors=$inputDataDir/partitioned_vectors # optional, see src/partition_vector_inputs.py
 ## Input handling ##
 $srcDir/check_huc_inputs.py -u "$hucList"
 
 ## Make output and data directories ##
 if [ -d "$outputRunDataDir" ] && [  "$overwrite" -eq 1 ]; then
     rm -rf "$outputRunDataDir"
-elif [ -d "$outputRunDataDir" ] && [ -z "$overwrite" ] ; then
-    echo "$runName data directories already exist. Use -o/--overwrite to continue"
+elif [ -d "$outputRunDataDir" ] && [ -z "$overwrite" ] && [ -z "$queue" ] && [ -z "$resume" ] ; then
+    echo "$runName data directories already exist. Use -o/--overwrite or -r/--resume to continue"
     exit 1
 fi
 mkdir -p $outputRunDataDir/logs
 
 ## RUN ##
-if [ -f "$hucList" ]; then
+if [ "$queue" = "1" ]; then
+    # workers on every node share the queue under $outputRunDataDir/work_queue
+    $srcDir/huc_work_queue.py -d $outputRunDataDir -u "$hucList" -j $jobLimit || true
+
+    # post-processing runs on one node once all HUCs have finished, and again once more HUCs finish on a later run
+    if [[ "$viz" -eq 1 ]]; then
+        $srcDir/huc_work_queue.py -d $outputRunDataDir -f "python3 /foss_fim/src/aggregate_fim_outputs.py -d $outputRunDataDir -j 6"
+    fi
+    exit 0
+elif [ -f "$hucList" ]; then
     if [ "$jobLimit" -eq 1 ]; then
         parallel --verbose --lb  -j $jobLimit --joblog $logFile -- $srcDir/time_and_tee_run_by_unit.sh :::: $hucList
     else
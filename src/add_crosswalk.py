@@ -3,16 +3,210 @@
 import os
 import geopandas as gpd
 import pandas as pd
-from numpy import unique
-from rasterstats import zonal_stats
+import numpy as np
+import rasterio
+from scipy.spatial import cKDTree
 import json
 import argparse
 import sys
 from bathy_rc_adjust import bathy_rc_lookup
 from utils.shared_functions import getDriver
+from utils.src_files import write_src_json, write_src_binary
+from utils.tiled_execution import block_windows, reduce_blocks
 from utils.shared_variables import FIM_ID
 
-def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_fileName,input_bathy_fileName,output_bathy_fileName,output_bathy_streamorder_fileName,output_bathy_thalweg_fileName,output_bathy_xs_lookup_fileName,output_catchments_fileName,output_flows_fileName,output_src_fileName,output_src_json_fileName,output_crosswalk_fileName,output_hydro_table_fileName,input_huc_fileName,input_nwmflows_fileName,input_nwmcatras_fileName,mannings_n,input_nwmcat_fileName,extent,small_segments_filename,calibration_mode=False):
+
+def csr_index(keys, number_of_keys):
+    '''
+    Groups row positions by integer key as compressed sparse rows: the rows of key k are rows[offsets[k]:offsets[k+1]],
+    in table order. Negative keys are left out.
+
+    '''
+
+    keyed = np.flatnonzero(keys >= 0)
+    rows = keyed[np.argsort(keys[keyed], kind='stable')]
+    offsets = np.zeros(number_of_keys + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(keys[keyed], minlength=number_of_keys))
+
+    return(offsets, rows)
+
+
+def csr_rows(offsets, rows, key):
+    ''' Rows of a key of a csr_index (none for a missing key) '''
+
+    if key < 0:
+        return(rows[:0])
+
+    return(rows[offsets[key]:offsets[key + 1]])
+
+
+def short_segment_updates(output_flows, min_catchment_area, min_stream_length):
+    '''
+    Pairs each short segment (small catchment, short length, not in a lake) with the segment whose rating curve replaces
+    its own: the upstream segment of highest stream order (the first one on ties), else the downstream segment of highest
+    stream order, else itself. Neighbours are found through upstream (NextDownID) and node (To_Node, From_Node)
+    adjacency indices.
+
+    Returns a table of short_id, update_id and str_order.
+    '''
+
+    hydro_ids = output_flows['HydroID'].values
+    orders = output_flows['order_'].values
+
+    # HydroIDs and NextDownIDs, and To and From nodes, share one key space
+    id_keys = pd.factorize(np.concatenate([hydro_ids, output_flows['NextDownID'].values]))[0]
+    hydro_keys, next_down_keys = id_keys[:len(output_flows)], id_keys[len(output_flows):]
+    node_keys = pd.factorize(np.concatenate([output_flows['To_Node'].values, output_flows['From_Node'].values]))[0]
+    to_keys, from_keys = node_keys[:len(output_flows)], node_keys[len(output_flows):]
+
+    upstream_offsets, upstream_rows = csr_index(next_down_keys, id_keys.max() + 1 if len(id_keys) else 0)
+    to_node_offsets, to_node_rows = csr_index(to_keys, node_keys.max() + 1 if len(node_keys) else 0)
+    from_node_offsets, from_node_rows = csr_index(from_keys, node_keys.max() + 1 if len(node_keys) else 0)
+
+    short = (output_flows['areasqkm'] < min_catchment_area) & (output_flows['LengthKm'] < min_stream_length) & (output_flows['LakeID'] < 0)
+
+    short_ids, update_ids, str_orders = [], [], []
+    for row in np.flatnonzero(short.values):
+
+        upstream = csr_rows(upstream_offsets, upstream_rows, hydro_keys[row])
+        downstream = csr_rows(from_node_offsets, from_node_rows, to_keys[row])
+
+        # multiple upstream segments
+        if len(upstream) > 1:
+            # drainage area would be better than stream order but we would need to calculate
+            # get the first one on ties (same stream order, without drainage area info it is hard to know which is the main channel)
+            update_id = hydro_ids[upstream[orders[upstream] == orders[upstream].max()][0]]
+
+        # single upstream segments
+        elif len(upstream) == 1:
+            upstream = csr_rows(to_node_offsets, to_node_rows, from_keys[row])
+            if len(upstream) != 1:
+                raise ValueError('HydroID {} has {} segments ending at its From_Node'.format(hydro_ids[row], len(upstream)))
+            update_id = hydro_ids[upstream[0]]
+
+        # no upstream segments; multiple or single downstream segments
+        elif len(downstream) > 0:
+            update_id = hydro_ids[downstream[orders[downstream] == orders[downstream].max()][0]]
+
+        else:
+            update_id = hydro_ids[row]
+
+        short_ids.append(hydro_ids[row])
+        update_ids.append(update_id)
+        str_orders.append(orders[row])
+
+    if len(short_ids) == 0:
+        return(pd.DataFrame())
+
+    return(pd.DataFrame({'short_id' : short_ids, 'update_id' : update_ids, 'str_order' : str_orders}))
+
+
+def update_short_rating_curves(output_src, sml_segs):
+    '''
+    Replaces the discharges of each short segment with those of its update segment at the same stages. Segments are
+    applied in order, so an update segment that is itself a short segment earlier in the table passes on its replaced
+    discharges. Independent segments are applied together with one merge per level of such chains.
+
+    '''
+
+    src_hydro_ids = output_src['HydroID'].values
+    src_stages = output_src['Stage'].values
+    original_discharges = output_src['Discharge (m3s-1)'].values.copy()
+    discharges = output_src['Discharge (m3s-1)'].values.copy()
+
+    # chain level: one more than the level of an earlier short segment used as update segment
+    short_positions = {short_id : position for position, short_id in enumerate(sml_segs['short_id'])}
+    levels = np.zeros(len(sml_segs), dtype=np.int64)
+    for position, update_id in enumerate(sml_segs['update_id']):
+        earlier = short_positions.get(update_id, position)
+        if earlier < position:
+            levels[position] = levels[earlier] + 1
+
+    src_rows = pd.DataFrame({'HydroID' : src_hydro_ids, 'Stage' : src_stages, 'src_row' : np.arange(len(output_src))})
+    src_rows = src_rows.loc[src_rows['Stage'].notna()]
+
+    for level in range(levels.max() + 1):
+        segments = sml_segs.loc[levels == level, ['short_id', 'update_id']]
+        source = src_rows.assign(discharge = (original_discharges if level == 0 else discharges)[src_rows['src_row'].values])
+
+        # discharges of the update segments by short segment and stage (the last row of a repeated stage wins)
+        new_values = segments.merge(source, left_on='update_id', right_on='HydroID').sort_values('src_row', kind='mergesort')
+        new_values = new_values.drop_duplicates(subset=['short_id', 'Stage'], keep='last')[['short_id', 'Stage', 'discharge']]
+
+        targets = src_rows.merge(new_values, left_on=['HydroID', 'Stage'], right_on=['short_id', 'Stage'])
+        discharges[targets['src_row'].values] = targets['discharge'].values
+
+    output_src['Discharge (m3s-1)'] = discharges
+
+    return(output_src)
+
+
+def majority_block(hydroids, feature_ids, hydroid_ndv, feature_id_ndv):
+    ''' Joint (HydroID, feature_id) cell counts of a block, keyed as HydroID * 2**32 + feature_id '''
+
+    valid = (hydroids != hydroid_ndv) & (feature_ids != feature_id_ndv)
+    pairs = (hydroids[valid].astype(np.int64) << 32) | feature_ids[valid].astype(np.uint32).astype(np.int64)
+
+    return(np.unique(pairs, return_counts=True))
+
+
+def majority_crosswalk(catchments_raster_fileName, nwm_catchments_raster_fileName, number_of_jobs=None):
+    '''
+    Majority NWM feature_id of each HydroID from the co-registered HydroID catchment and NWM catchment rasters, read
+    block by block. Ties go to the lowest feature_id, as the rasterstats majority did. HydroIDs without NWM catchment
+    cells are left out.
+
+    Returns a table of HydroID and feature_id.
+    '''
+
+    with rasterio.open(catchments_raster_fileName) as catchments, rasterio.open(nwm_catchments_raster_fileName) as nwm_catchments:
+        if (catchments.shape != nwm_catchments.shape) or (not catchments.transform.almost_equals(nwm_catchments.transform)):
+            raise ValueError('{} and {} are not on the same grid'.format(catchments_raster_fileName, nwm_catchments_raster_fileName))
+        hydroid_ndv, feature_id_ndv = catchments.nodata, nwm_catchments.nodata
+
+    def merge_counts(counts, block_counts):
+        counts.append(block_counts)
+        return(counts)
+
+    block_counts = reduce_blocks(lambda hydroids, feature_ids: majority_block(hydroids, feature_ids, hydroid_ndv, feature_id_ndv),
+                                 [catchments_raster_fileName, nwm_catchments_raster_fileName], block_windows(catchments_raster_fileName),
+                                 merge_counts, [], number_of_jobs)
+
+    pairs = np.concatenate([np.zeros(0, dtype=np.int64)] + [pairs for pairs, counts in block_counts])
+    counts = np.concatenate([np.zeros(0, dtype=np.int64)] + [counts for pairs, counts in block_counts])
+    pairs, inverse = np.unique(pairs, return_inverse=True)
+    counts = np.bincount(inverse.reshape(-1), weights=counts, minlength=len(pairs)).astype(np.int64)
+
+    majorities = pd.DataFrame({'HydroID' : pairs >> 32, 'feature_id' : (pairs & 0xFFFFFFFF).astype(np.uint32).astype(np.int32), 'count' : counts})
+    majorities = majorities.sort_values(['HydroID', 'count', 'feature_id'], ascending=[True, False, True])
+    majorities = majorities.drop_duplicates(subset='HydroID', keep='first').drop(columns='count').reset_index(drop=True)
+
+    return(majorities)
+
+
+def nearest_polygons(points, polygons):
+    '''
+    Position of the polygon closest to each point (the first one on ties, as a scan of all polygons). The distance to the
+    polygon with the nearest representative point bounds the search, and the spatial index of the polygons returns the
+    candidates within that bound.
+
+    '''
+
+    representative_points = polygons.representative_point()
+    _, closest = cKDTree(np.c_[representative_points.x.values, representative_points.y.values]).query(np.c_[points.x.values, points.y.values])
+    sindex = polygons.sindex
+
+    nearest = []
+    for point, candidate in zip(points, closest):
+        bound = point.distance(polygons.iloc[candidate])
+        candidates = np.union1d(list(sindex.intersection((point.x - bound, point.y - bound, point.x + bound, point.y + bound))), [candidate]).astype(np.int64)
+        distances = [point.distance(polygons.iloc[c]) for c in candidates]
+        nearest.append(candidates[np.argmin(distances)])
+
+    return(np.array(nearest, dtype=np.int64))
+
+
+def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_fileName,input_bathy_fileName,output_bathy_fileName,output_bathy_streamorder_fileName,output_bathy_thalweg_fileName,output_bathy_xs_lookup_fileName,output_catchments_fileName,output_flows_fileName,output_src_fileName,output_src_json_fileName,output_crosswalk_fileName,output_hydro_table_fileName,input_huc_fileName,input_nwmflows_fileName,input_nwmcatras_fileName,input_catchments_raster_fileName,mannings_n,input_nwmcat_fileName,extent,small_segments_filename,calibration_mode=False):
 
     input_catchments = gpd.read_file(input_catchments_fileName)
     input_flows = gpd.read_file(input_flows_fileName)
@@ -21,16 +215,14 @@ def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_f
     min_catchment_area = float(os.environ['min_catchment_area']) #0.25#
     min_stream_length = float(os.environ['min_stream_length']) #0.5#
     bathy_src_calc = os.environ['bathy_src_modification'] == "True" # env variable to toggle on/off the bathy calc and src modifications
+    src_binary = os.environ.get('src_binary') == "True" # env variable to also write the rating curves as src.npz
 
     if extent == 'FR':
         ## crosswalk using majority catchment method
 
         # calculate majority catchments
-        majority_calc = zonal_stats(input_catchments, input_nwmcatras_fileName, stats=['majority'], geojson_out=True)
-        input_majorities = gpd.GeoDataFrame.from_features(majority_calc)
-        input_majorities = input_majorities.rename(columns={'majority' : 'feature_id'})
+        input_majorities = majority_crosswalk(input_catchments_raster_fileName, input_nwmcatras_fileName)
 
-        input_majorities = input_majorities[:][input_majorities['feature_id'].notna()]
         if input_majorities.feature_id.dtype != 'int': input_majorities.feature_id = input_majorities.feature_id.astype(int)
         if input_majorities.HydroID.dtype != 'int': input_majorities.HydroID = input_majorities.HydroID.astype(int)
 
@@ -61,33 +253,25 @@ def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_f
         if input_nwmflows.feature_id.dtype != 'int': input_nwmflows.feature_id = input_nwmflows.feature_id.astype(int)
 
         # Get stream midpoint
-        stream_midpoint = []
-        hydroID = []
-        for i,lineString in enumerate(input_flows.geometry):
-            hydroID = hydroID + [input_flows.loc[i,'HydroID']]
-            stream_midpoint = stream_midpoint + [lineString.interpolate(0.5,normalized=True)]
+        stream_midpoint = input_flows.geometry.interpolate(0.5,normalized=True)
 
-        input_flows_midpoint = gpd.GeoDataFrame({'HydroID':hydroID, 'geometry':stream_midpoint}, crs=input_flows.crs, geometry='geometry')
+        input_flows_midpoint = gpd.GeoDataFrame({'HydroID':input_flows['HydroID'].values, 'geometry':stream_midpoint.values}, crs=input_flows.crs, geometry='geometry')
         input_flows_midpoint = input_flows_midpoint.set_index('HydroID')
 
         # Create crosswalk
         crosswalk = gpd.sjoin(input_flows_midpoint, input_nwmcat, how='left', op='within').reset_index()
         crosswalk = crosswalk.rename(columns={"index_right": "feature_id"})
 
-        # fill in missing ms
+        # fill in missing ms with the closest nwm catchment by distance
         crosswalk_missing = crosswalk.loc[crosswalk.feature_id.isna()]
-        for index, stream in crosswalk_missing.iterrows():
-
-            # find closest nwm catchment by distance
-            distances = [stream.geometry.distance(poly) for poly in input_nwmcat.geometry]
-            min_dist = min(distances)
-            nwmcat_index=distances.index(min_dist)
+        if len(crosswalk_missing) > 0:
+            nearest_nwmcat = nearest_polygons(crosswalk_missing.geometry, input_nwmcat.geometry)
+            nearest_feature_ids = pd.Series(input_nwmcat.index.values[nearest_nwmcat], index=crosswalk_missing.HydroID.values)
+            nearest_feature_ids = nearest_feature_ids[~nearest_feature_ids.index.duplicated(keep='last')]
 
             # update crosswalk
-            crosswalk.loc[crosswalk.HydroID==stream.HydroID,'feature_id'] = input_nwmcat.iloc[nwmcat_index].name
-            crosswalk.loc[crosswalk.HydroID==stream.HydroID,'AreaSqKM'] = input_nwmcat.iloc[nwmcat_index].AreaSqKM
-            crosswalk.loc[crosswalk.HydroID==stream.HydroID,'Shape_Length'] = input_nwmcat.iloc[nwmcat_index].Shape_Length
-            crosswalk.loc[crosswalk.HydroID==stream.HydroID,'Shape_Area'] = input_nwmcat.iloc[nwmcat_index].Shape_Area
+            missing_hydroids = crosswalk.HydroID.isin(nearest_feature_ids.index)
+            crosswalk.loc[missing_hydroids,'feature_id'] = crosswalk.loc[missing_hydroids,'HydroID'].map(nearest_feature_ids)
 
         crosswalk = crosswalk.filter(items=['HydroID', 'feature_id'])
         crosswalk = crosswalk.merge(input_nwmflows[['feature_id','order_']],on='feature_id')
@@ -119,61 +303,21 @@ def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_f
 
     # Adjust short model reach rating curves
     print("Adjusting model reach rating curves")
-    sml_segs = pd.DataFrame()
-
-    # replace small segment geometry with neighboring stream
-    for stream_index in output_flows.index:
-
-        if output_flows["areasqkm"][stream_index] < min_catchment_area and output_flows["LengthKm"][stream_index] < min_stream_length and output_flows["LakeID"][stream_index] < 0:
-
-            short_id = output_flows['HydroID'][stream_index]
-            to_node = output_flows['To_Node'][stream_index]
-            from_node = output_flows['From_Node'][stream_index]
-
-            # multiple upstream segments
-            if len(output_flows.loc[output_flows['NextDownID'] == short_id]['HydroID']) > 1:
-                max_order = max(output_flows.loc[output_flows['NextDownID'] == short_id]['order_']) # drainage area would be better than stream order but we would need to calculate
-
-                if len(output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID']) == 1:
-                    update_id = output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID'].item()
-
-                else:
-                    update_id = output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID'].values[0] # get the first one (same stream order, without drainage area info it is hard to know which is the main channel)
-
-            # single upstream segments
-            elif len(output_flows.loc[output_flows['NextDownID'] == short_id]['HydroID']) == 1:
-                update_id = output_flows.loc[output_flows.To_Node==from_node]['HydroID'].item()
-
-            # no upstream segments; multiple downstream segments
-            elif len(output_flows.loc[output_flows.From_Node==to_node]['HydroID']) > 1:
-                max_order = max(output_flows.loc[output_flows.From_Node==to_node]['HydroID']['order_']) # drainage area would be better than stream order but we would need to calculate
-
-                if len(output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID']) == 1:
-                    update_id = output_flows.loc[(output_flows.From_Node==to_node) & (output_flows['order_'] == max_order)]['HydroID'].item()
-
-                else:
-                    update_id = output_flows.loc[(output_flows.From_Node==to_node) & (output_flows['order_'] == max_order)]['HydroID'].values[0] # get the first one (same stream order, without drainage area info it is hard to know which is the main channel)
-
-            # no upstream segments; single downstream segment
-            elif len(output_flows.loc[output_flows.From_Node==to_node]['HydroID']) == 1:
-                    update_id = output_flows.loc[output_flows.From_Node==to_node]['HydroID'].item()
-
-            else:
-                update_id = output_flows.loc[output_flows.HydroID==short_id]['HydroID'].item()
-
-            str_order = output_flows.loc[output_flows.HydroID==short_id]['order_'].item()
-            sml_segs = sml_segs.append({'short_id':short_id, 'update_id':update_id, 'str_order':str_order}, ignore_index=True)
+    sml_segs = short_segment_updates(output_flows, min_catchment_area, min_stream_length)
 
     print("Number of short reaches [{} < {} and {} < {}] = {}".format("areasqkm", min_catchment_area, "LengthKm", min_stream_length, len(sml_segs)))
 
     # calculate src_full
-    input_src_base = pd.read_csv(input_srcbase_fileName, dtype= object)
+    # typed read: the C parser converts the numbers as pd.to_numeric does on a dtype=object read
+    input_src_base = pd.read_csv(input_srcbase_fileName)
     if input_src_base.CatchId.dtype != 'int': input_src_base.CatchId = input_src_base.CatchId.astype(int)
 
     input_src_base = input_src_base.merge(output_flows[['ManningN','HydroID','order_']],left_on='CatchId',right_on='HydroID')
 
     input_src_base = input_src_base.rename(columns=lambda x: x.strip(" "))
-    input_src_base = input_src_base.apply(pd.to_numeric,**{'errors' : 'coerce'})
+    # only text columns need converting (e.g. calibration Manning's n)
+    for text_column in input_src_base.columns[input_src_base.dtypes == object]:
+        input_src_base[text_column] = pd.to_numeric(input_src_base[text_column],errors='coerce')
     input_src_base['TopWidth (m)'] = input_src_base['SurfaceArea (m2)']/input_src_base['LENGTHKM']/1000
     input_src_base['WettedPerimeter (m)'] = input_src_base['BedArea (m2)']/input_src_base['LENGTHKM']/1000
     input_src_base['WetArea (m2)'] = input_src_base['Volume (m3)']/input_src_base['LENGTHKM']/1000
@@ -195,14 +339,7 @@ def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_f
         sml_segs.to_csv(small_segments_filename,index=False)
         print("Update rating curves for short reaches.")
 
-        for index, segment in sml_segs.iterrows():
-
-            short_id = segment[0]
-            update_id= segment[1]
-            new_values = output_src.loc[output_src['HydroID'] == update_id][['Stage', 'Discharge (m3s-1)']]
-
-            for src_index, src_stage in new_values.iterrows():
-                output_src.loc[(output_src['HydroID']== short_id) & (output_src['Stage']== src_stage[0]),['Discharge (m3s-1)']] = src_stage[1]
+        output_src = update_short_rating_curves(output_src, sml_segs)
 
     if extent == 'FR':
         output_src = output_src.merge(input_majorities[['HydroID','feature_id']],on='HydroID')
@@ -242,20 +379,6 @@ def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_f
     if calibration_mode == True:
         output_hydro_table.to_csv(output_hydro_table_fileName,index=False)
     else:
-        # make src json
-        output_src_json = dict()
-        hydroID_list = unique(output_src['HydroID'])
-
-        for hid in hydroID_list:
-            indices_of_hid = output_src['HydroID'] == hid
-            stage_list = output_src['Stage'][indices_of_hid].astype(float)
-            q_list = output_src['Discharge (m3s-1)'][indices_of_hid].astype(float)
-
-            stage_list = stage_list.tolist()
-            q_list = q_list.tolist()
-
-            output_src_json[str(hid)] = { 'q_list' : q_list , 'stage_list' : stage_list }
-
         # write out
         output_catchments.to_file(output_catchments_fileName,driver=getDriver(output_catchments_fileName),index=False)
         output_flows.to_file(output_flows_fileName,driver=getDriver(output_flows_fileName),index=False)
@@ -263,8 +386,12 @@ def add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_f
         output_crosswalk.to_csv(output_crosswalk_fileName,index=False)
         output_hydro_table.to_csv(output_hydro_table_fileName,index=False)
 
-        with open(output_src_json_fileName,'w') as f:
-            json.dump(output_src_json,f,sort_keys=True,indent=2)
+        write_src_json(output_src, output_src_json_fileName)
+        output_src_binary_fileName = os.path.splitext(output_src_json_fileName)[0] + '.npz'
+        if src_binary:
+            write_src_binary(output_src, output_src_binary_fileName)
+        elif os.path.isfile(output_src_binary_fileName):
+            os.remove(output_src_binary_fileName)
 
 if __name__ == '__main__':
 
@@ -286,6 +413,7 @@ if __name__ == '__main__':
     parser.add_argument('-w','--input-huc-fileName',help='HUC8 boundary',required=True)
     parser.add_argument('-b','--input-nwmflows-fileName',help='Subest NWM burnlines',required=True)
     parser.add_argument('-y','--input-nwmcatras-fileName',help='NWM catchment raster',required=False)
+    parser.add_argument('-n','--input-catchments-raster-fileName',help='HydroID catchment raster on the NWM catchment raster grid (FR majority crosswalk)',required=False)
     parser.add_argument('-m','--mannings-n',help='Mannings n. Accepts single parameter set or list of parameter set in calibration mode. Currently input as csv.',required=True)
     parser.add_argument('-z','--input-nwmcat-fileName',help='NWM catchment polygon',required=True)
     parser.add_argument('-p','--extent',help='MS or FR extent',required=True)
@@ -294,6 +422,9 @@ if __name__ == '__main__':
 
     args = vars(parser.parse_args())
 
+    if args['extent'] == 'FR' and (args['input_nwmcatras_fileName'] is None or args['input_catchments_raster_fileName'] is None):
+        parser.error('FR extent requires --input-nwmcatras-fileName and --input-catchments-raster-fileName')
+
     input_catchments_fileName = args['input_catchments_fileName']
     input_flows_fileName = args['input_flows_fileName']
     input_srcbase_fileName = args['input_srcbase_fileName']
@@ -311,10 +442,11 @@ if __name__ == '__main__':
     input_huc_fileName = args['input_huc_fileName']
     input_nwmflows_fileName = args['input_nwmflows_fileName']
     input_nwmcatras_fileName = args['input_nwmcatras_fileName']
+    input_catchments_raster_fileName = args['input_catchments_raster_fileName']
     mannings_n = args['mannings_n']
     input_nwmcat_fileName = args['input_nwmcat_fileName']
     extent = args['extent']
     small_segments_filename = args['small_segments_filename']
     calibration_mode = args['calibration_mode']
 
-    add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_fileName,input_bathy_fileName,output_bathy_fileName,output_bathy_streamorder_fileName,output_bathy_thalweg_fileName,output_bathy_xs_lookup_fileName,output_catchments_fileName,output_flows_fileName,output_src_fileName,output_src_json_fileName,output_crosswalk_fileName,output_hydro_table_fileName,input_huc_fileName,input_nwmflows_fileName,input_nwmcatras_fileName,mannings_n,input_nwmcat_fileName,extent,small_segments_filename,calibration_mode)
+    add_crosswalk(input_catchments_fileName,input_flows_fileName,input_srcbase_fileName,input_bathy_fileName,output_bathy_fileName,output_bathy_streamorder_fileName,output_bathy_thalweg_fileName,output_bathy_xs_lookup_fileName,output_catchments_fileName,output_flows_fileName,output_src_fileName,output_src_json_fileName,output_crosswalk_fileName,output_hydro_table_fileName,input_huc_fileName,input_nwmflows_fileName,input_nwmcatras_fileName,input_catchments_raster_fileName,mannings_n,input_nwmcat_fileName,extent,small_segments_filename,calibration_mode)
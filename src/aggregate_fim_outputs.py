@@ -11,6 +11,7 @@ from rasterio.warp import calculate_default_transform, reproject, Resampling
 import shutil
 import csv
 from utils.shared_variables import PREP_PROJECTION,VIZ_PROJECTION
+from utils.src_files import read_src_binary
 
 def aggregate_fim_outputs(args):
 
@@ -46,9 +47,12 @@ def aggregate_fim_outputs(args):
 
             del hydrotable
 
-            # open src
-            src = open(src_filename)
-            src = json.load(src)
+            # open src (the binary sibling of src.json when it was written)
+            if os.path.isfile(os.path.splitext(src_filename)[0] + '.npz'):
+                src = read_src_binary(os.path.splitext(src_filename)[0] + '.npz')
+            else:
+                src = open(src_filename)
+                src = json.load(src)
 
             # write/append aggregate src
             if os.path.isfile(aggregate_src):
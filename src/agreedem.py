@@ -3,12 +3,83 @@ import rasterio
 import numpy as np
 import os
 import argparse
-from r_grow_distance import r_grow_distance
+from rasterio.windows import Window
+from functools import partial
+from grow_distance import euclidean_allocation, grow_distance_tiled, TILE_BYTES_PER_CELL
+from utils.shared_functions import intermediate_raster_profile
+from utils.tiled_execution import map_blocks, tiled_number_of_jobs
 
+# Approximate bytes per cell of the in-memory path: the DEM, its mask, the smogrid, the four distance/allocation
+# fields and the temporaries of one distance transform (float64 distances and nearest cell indices).
+AGREE_BYTES_PER_CELL = 64
 
-def agreedem(rivers_raster, dem, output_raster, workspace, grass_workspace, buffer_dist, smooth_drop, sharp_drop, delete_intermediate_data):
+# Approximate bytes per cell of one block of rows (the fields read and the float64 temporaries of agree_dem_block).
+BLOCK_BYTES_PER_CELL = 80
+
+
+def agree_scratch(shape, dtype, workspace, name, in_memory):
+    ''' Returns an array for one AGREE field. Memory-mapped under workspace when the fields do not fit the memory limit. '''
+
+    if in_memory:
+        return(np.empty(shape, dtype = dtype))
+
+    return(np.lib.format.open_memmap(os.path.join(workspace, 'agree_{}.npy'.format(name)), mode = 'w+', dtype = dtype, shape = shape))
+
+
+def allocate(read_window, shape, sampling, distance_out, allocation_out, tile_size, max_memory_mb=None):
+    ''' Fills the distance and allocation fields from the (sources, values) returned by read_window '''
+
+    if tile_size is None:
+        distance, allocation = euclidean_allocation(*read_window(Window(0, 0, shape[1], shape[0])), sampling)
+        distance_out[:] = distance
+        allocation_out[:] = allocation
+        return
+
+    for window, distance, allocation in grow_distance_tiled(read_window, shape[0], shape[1], sampling, tile_size, max_memory_mb = max_memory_mb):
+        distance_out[window.toslices()] = distance
+        allocation_out[window.toslices()] = allocation
+
+
+def agree_dem_block(elev_mask_window, bufdist_data_window, bufallo_data_window, vectdist_data_window, vectallo_data_window, river_raw_data_window, sharp_drop, ndv):
+    ''' Steps 6 to 8 of the AGREE methodology for one block of the distance and allocation fields '''
+
+    river_data_window = np.where(elev_mask_window == True, river_raw_data_window, -20.0)
+    #------------------------------------------------------------------
+    # 6. From Hellweger documentation: Compute the smooth modified
+    # elevation grid (smoelev). The cells in the smooth modified
+    # elevation grid store the results of the smooth surface
+    # reconditioning process. Note that for cells outside the buffer the
+    # equation below assigns the original elevation.
+    smoelev_window = vectallo_data_window + ((bufallo_data_window - vectallo_data_window)/(bufdist_data_window + vectdist_data_window)) * vectdist_data_window
+
+    #------------------------------------------------------------------
+    # 7. From Hellweger documentation: Compute the sharp drop/raise grid
+    # (shagrid). The cells in the sharp drop/raise grid corresponding to
+    # the vector lines have an elevation equal to that of the smooth
+    # modified elevation grid (smoelev) plus a certain distance
+    # (sharpdist). All other cells have no data.
+    sharp_dist = -1 * sharp_drop # in meters.
+    shagrid_window = (smoelev_window + sharp_dist) * river_data_window
+
+    #------------------------------------------------------------------
+    # 8. From Hellweger documentation: Compute the modified elevation
+    # grid (elevgrid). The cells in the modified elevation grid store
+    # the results of the surface reconditioning process. Note that for
+    # cells outside the buffer the the equation below assigns the
+    # original elevation.
+    elevgrid_window = np.where(river_data_window == 0, smoelev_window, shagrid_window)
+    agree_dem_window = np.where(elev_mask_window == True, elevgrid_window, ndv)
+
+    return(agree_dem_window.astype('float32'))
+
+
+def agreedem(rivers_raster, dem, output_raster, workspace, buffer_dist, smooth_drop, sharp_drop, max_memory_mb=None, block_rows=512, number_of_jobs=None):
     '''
-    Produces a hydroconditioned raster using the AGREE DEM methodology as described by Ferdi Hellweger (https://www.caee.utexas.edu/prof/maidment/gishydro/ferdi/research/agree/agree.html). The GRASS gis tool r.grow.distance is used to calculate intermediate allocation and proximity rasters.
+    Produces a hydroconditioned raster using the AGREE DEM methodology as described by Ferdi Hellweger (https://www.caee.utexas.edu/prof/maidment/gishydro/ferdi/research/agree/agree.html). Intermediate allocation and proximity fields are calculated with grow_distance (native equivalent of the GRASS gis tool r.grow.distance).
+
+    The smogrid, bufgrid and distance/allocation fields are kept in arrays and only the output raster is written. If the
+    fields do not fit max_memory_mb they are memory-mapped in workspace, the distance transforms run in tiles and the
+    blocks of rows are sized to the limit.
 
     Parameters
     ----------
@@ -19,214 +90,138 @@ def agreedem(rivers_raster, dem, output_raster, workspace, grass_workspace, buff
     output_raster : STR
         Path to output raster. For example, dem_burned.tif
     workspace : STR
-        Path to workspace to save all intermediate files.
-    grass_workspace : STR
-        Path to the temporary workspace for grass inputs. This temporary workspace is deleted once grass datasets are produced and exported to tif files.
+        Path to workspace for the memory-mapped fields. They are deleted upon completion of this function.
     buffer_dist : FLOAT
         AGREE stream buffer distance (in meters) on either side of stream.
     smooth_drop : FLOAT
         Smooth drop distance (in meters). Typically this has been 10m.
     sharp_drop : FLOAT
         Sharp drop distance (in meters). Typically this has been 1000m.
-    delete_intermediate_data: BOOL
-        If True all intermediate data is deleted, if False (default) no intermediate datasets are deleted.
+    max_memory_mb : FLOAT
+        Approximate peak memory. None keeps all fields in memory. MemoryError is raised if the distance transforms
+        cannot be computed within it (see grow_distance_tiled).
+    block_rows : INT
+        Number of rows read and written at a time.
+    number_of_jobs : INT
+        Number of threads computing the output blocks. Defaults to the ncores_tiled environment variable.
 
     Returns
     -------
     None.
 
     '''
-    #------------------------------------------------------------------
-    # 1. From Hellweger documentation: Compute the vector grid
-    # (vectgrid). The cells in the vector grid corresponding to the
-    # lines in the vector coverage have data. All other cells have no
-    # data.
 
     # Import dem layer and river layer and get dem profile.
     elev = rasterio.open(dem)
-    dem_profile = elev.profile
-
     rivers = rasterio.open(rivers_raster)
-
-    # Define smogrid profile and output file
-    smo_profile = dem_profile.copy()
-    smo_profile.update(nodata = 0)
-    smo_profile.update(dtype = 'float32')
-    smo_output = os.path.join(workspace, 'agree_smogrid.tif')
-
-    # Windowed reading/calculating/writing
-    with rasterio.Env():
-        with rasterio.open(smo_output, 'w', **smo_profile) as raster:
-            for ji, window in elev.block_windows(1):
-                # read elevation data and mask information
-                elev_data_window = elev.read(1, window = window)
-                elev_mask_window = elev.read_masks(1, window = window).astype('bool')
-                # Import boolean river raster and apply same NODATA mask as dem
-                # layer. In case rivers extend beyond valid data regions of DEM.
-                river_raw_data_window = rivers.read(1, window = window)
-                river_data_window = np.where(elev_mask_window == True, river_raw_data_window, 0)
-
-                #---------------------------------------------------------------
-                # 2. From Hellweger documentation: Compute the smooth drop/raise
-                # grid (smogrid). The cells in the smooth drop/raise grid
-                # corresponding to the vector lines have an elevation equal to that
-                # of the original DEM (oelevgrid) plus a certain distance
-                # (smoothdist). All other cells have no data.
-
-                # Assign smooth distance and calculate the smogrid.
-                smooth_dist = -1 * smooth_drop # in meters.
-                smogrid_window = river_data_window*(elev_data_window + smooth_dist)
-
-                # Write out raster
-                raster.write(smogrid_window.astype('float32'), indexes = 1, window = window)
-
-    elev.close()
-    rivers.close()
-    raster.close()
-    #------------------------------------------------------------------
-    # 3. From Hellweger documentation: Compute the vector distance grids
-    # (vectdist and vectallo). The cells in the vector distance grid
-    # (vectdist) store the distance to the closest vector cell. The
-    # cells in vector allocation grid (vectallo) store the elevation of
-    # the closest vector cell.
-
-    # Compute allocation and proximity grid using GRASS gis
-    # r.grow.distance tool. Output distance grid in meters. Set datatype
-    # for output allocation and proximity grids to float32.
-    vectdist_grid, vectallo_grid = r_grow_distance(smo_output, grass_workspace, 'Float32', 'Float32')
-
-    #------------------------------------------------------------------
-    # 4. From Hellweger documentation: Compute the buffer grid
-    # (bufgrid2). The cells in the buffer grid outside the buffer
-    # distance (buffer) store the original elevation. The cells in the
-    # buffer grid inside the buffer distance have no data.
-
-    # Open distance, allocation, elevation grids.
-    vectdist = rasterio.open(vectdist_grid)
-    vectallo = rasterio.open(vectallo_grid)
-    elev = rasterio.open(dem)
-
-    # Define bufgrid profile and output file.
-    buf_output = os.path.join(workspace, 'agree_bufgrid.tif')
-    buf_profile = dem_profile.copy()
-    buf_profile.update(dtype = 'float32')
-
-    # Windowed reading/calculating/writing
-    with rasterio.Env():
-        with rasterio.open(buf_output, 'w', **buf_profile) as raster:
-            for ji, window in elev.block_windows(1):
-                # read distance, allocation, and elevation datasets
-                vectdist_data_window = vectdist.read(1, window = window)
-                vectallo_data_window = vectallo.read(1, window = window)
-                elev_data_window = elev.read(1, window = window)
-
-                # Define buffer distance and calculate adjustment to compute the
-                # bufgrid.
-                # half_res adjustment equal to half distance of one cell
-                half_res = elev.res[0]/2
-                final_buffer = buffer_dist - half_res # assume all units in meters.
-
-                # Calculate bufgrid. Assign NODATA to areas where vectdist_data <=
-                # buffered value.
-                bufgrid_window = np.where(vectdist_data_window > final_buffer, elev_data_window, dem_profile['nodata'])
-
-                # Write out raster.
-                raster.write(bufgrid_window.astype('float32'), indexes = 1, window = window)
-
-    vectdist.close()
-    vectallo.close()
-    elev.close()
-    #------------------------------------------------------------------
-    # 5. From Hellweger documentation: Compute the buffer distance grids
-    # (bufdist and bufallo). The cells in the buffer distance grid
-    # (bufdist) store the distance to the closest valued buffer grid
-    # cell (bufgrid2). The cells in buffer allocation grid (bufallo)
-    # store the elevation of the closest valued buffer cell.
-
-    # Compute allocation and proximity grid using GRASS gis
-    # r.grow.distance. Output distance grid in meters. Set datatype for
-    # output allocation and proximity grids to float32.
-    bufdist_grid, bufallo_grid = r_grow_distance(buf_output, grass_workspace, 'Float32', 'Float32')
-
-    # Open distance, allocation, elevation grids.
-    bufdist = rasterio.open(bufdist_grid)
-    bufallo = rasterio.open(bufallo_grid)
-    vectdist = rasterio.open(vectdist_grid)
-    vectallo = rasterio.open(vectallo_grid)
-    rivers = rasterio.open(rivers_raster)
-    elev = rasterio.open(dem)
-
-    # Define profile output file.
-    agree_output = output_raster
-    agree_profile = dem_profile.copy()
-    agree_profile.update(dtype = 'float32')
-
-    # Windowed reading/calculating/writing
-    with rasterio.Env():
-        with rasterio.open(agree_output, 'w', **agree_profile) as raster:
-            for ji, window in elev.block_windows(1):
-                # Read elevation data and mask, distance and allocation grids, and river data.
-                elev_data_window = elev.read(1, window = window)
-                elev_mask_window = elev.read_masks(1, window = window).astype('bool')
-                bufdist_data_window = bufdist.read(1, window = window)
-                bufallo_data_window = bufallo.read(1, window = window)
-                vectdist_data_window = vectdist.read(1, window = window)
-                vectallo_data_window = vectallo.read(1, window = window)
-                river_raw_data_window = rivers.read(1, window = window)
-
-
-                river_data_window = np.where(elev_mask_window == True, river_raw_data_window, -20.0)
-                #------------------------------------------------------------------
-                # 6. From Hellweger documentation: Compute the smooth modified
-                # elevation grid (smoelev). The cells in the smooth modified
-                # elevation grid store the results of the smooth surface
-                # reconditioning process. Note that for cells outside the buffer the
-                # equation below assigns the original elevation.
-
-                # Calculate smoelev.
-                smoelev_window = vectallo_data_window + ((bufallo_data_window - vectallo_data_window)/(bufdist_data_window + vectdist_data_window)) * vectdist_data_window
-
-                #------------------------------------------------------------------
-                # 7. From Hellweger documentation: Compute the sharp drop/raise grid
-                # (shagrid). The cells in the sharp drop/raise grid corresponding to
-                # the vector lines have an elevation equal to that of the smooth
-                # modified elevation grid (smoelev) plus a certain distance
-                # (sharpdist). All other cells have no data.
-
-                # Define sharp drop distance and calculate the sharp drop grid where
-                # only river cells are dropped by the sharp_dist amount.
-                sharp_dist = -1 * sharp_drop # in meters.
-                shagrid_window = (smoelev_window + sharp_dist) * river_data_window
-
-                #------------------------------------------------------------------
-                # 8. From Hellweger documentation: Compute the modified elevation
-                # grid (elevgrid). The cells in the modified elevation grid store
-                # the results of the surface reconditioning process. Note that for
-                # cells outside the buffer the the equation below assigns the
-                # original elevation.
-
-                # Merge sharp drop grid with smoelev grid. Then apply the same
-                # NODATA mask as original elevation grid.
-                elevgrid_window = np.where(river_data_window == 0, smoelev_window, shagrid_window)
-                agree_dem_window = np.where(elev_mask_window == True, elevgrid_window, dem_profile['nodata'])
-
-                # Write out to raster
-                raster.write(agree_dem_window.astype('float32'), indexes = 1, window = window)
-
-    bufdist.close()
-    bufallo.close()
-    vectdist.close()
-    vectallo.close()
-    rivers.close()
-    elev.close()
-    # If the '-t' flag is called, intermediate data is removed.
-    if delete_intermediate_data:
-        os.remove(smo_output)
-        os.remove(buf_output)
-        os.remove(vectdist_grid)
-        os.remove(vectallo_grid)
-        os.remove(bufdist_grid)
-        os.remove(bufallo_grid)
+    dem_profile = elev.profile
+    shape = (elev.height, elev.width)
+    sampling = (abs(elev.transform.e), abs(elev.transform.a))
+
+    in_memory = (max_memory_mb is None) or (shape[0] * shape[1] * AGREE_BYTES_PER_CELL <= max_memory_mb * 1024**2)
+    tile_size, transform_memory_mb = None, None
+    if not in_memory:
+        # A quarter of the limit for the distance transform tiles with their default halo (a quarter tile on each
+        # side), half for the rest of the transforms (cells far from every source) and a quarter for the blocks of
+        # rows, of which at most two per job are in flight.
+        max_bytes = max_memory_mb * 1024**2
+        tile_size = max(int(np.sqrt(max_bytes / 4 / (TILE_BYTES_PER_CELL * 2.25))), 256)
+        transform_memory_mb = max_memory_mb * 3 / 4
+        block_rows = max(min(block_rows, int(max_bytes / 4 / (2 * tiled_number_of_jobs(number_of_jobs) * shape[1] * BLOCK_BYTES_PER_CELL))), 1)
+        os.makedirs(workspace, exist_ok = True)
+        print('Memory-mapping AGREE fields in {} and computing distances in {} cell tiles'.format(workspace, tile_size), flush = True)
+
+    row_windows = [Window(0, row_off, shape[1], min(block_rows, shape[0] - row_off)) for row_off in range(0, shape[0], block_rows)]
+
+    fields = {}
+    try:
+        for name, dtype in [('elev', 'float32'), ('elev_mask', 'bool'), ('smogrid', 'float32'), ('vectdist', 'float32'),
+                            ('vectallo', 'float32'), ('bufdist', 'float32'), ('bufallo', 'float32')]:
+            fields[name] = agree_scratch(shape, dtype, workspace, name, in_memory)
+
+        #------------------------------------------------------------------
+        # 1. From Hellweger documentation: Compute the vector grid
+        # (vectgrid). The cells in the vector grid corresponding to the
+        # lines in the vector coverage have data. All other cells have no
+        # data.
+        for window in row_windows:
+            rows = window.toslices()
+            # read elevation data and mask information
+            elev_data_window = elev.read(1, window = window)
+            elev_mask_window = elev.read_masks(1, window = window).astype('bool')
+            # Import boolean river raster and apply same NODATA mask as dem
+            # layer. In case rivers extend beyond valid data regions of DEM.
+            river_raw_data_window = rivers.read(1, window = window)
+            river_data_window = np.where(elev_mask_window == True, river_raw_data_window, 0)
+
+            #---------------------------------------------------------------
+            # 2. From Hellweger documentation: Compute the smooth drop/raise
+            # grid (smogrid). The cells in the smooth drop/raise grid
+            # corresponding to the vector lines have an elevation equal to that
+            # of the original DEM (oelevgrid) plus a certain distance
+            # (smoothdist). All other cells have no data (0).
+            smooth_dist = -1 * smooth_drop # in meters.
+            fields['smogrid'][rows] = (river_data_window*(elev_data_window + smooth_dist)).astype('float32')
+            fields['elev'][rows] = elev_data_window
+            fields['elev_mask'][rows] = elev_mask_window
+
+        #------------------------------------------------------------------
+        # 3. From Hellweger documentation: Compute the vector distance grids
+        # (vectdist and vectallo). The cells in the vector distance grid
+        # (vectdist) store the distance to the closest vector cell. The
+        # cells in vector allocation grid (vectallo) store the elevation of
+        # the closest vector cell.
+        def read_smogrid(window):
+            smogrid_window = np.asarray(fields['smogrid'][window.toslices()])
+            return((smogrid_window != 0) & ~np.isnan(smogrid_window), smogrid_window)
+
+        allocate(read_smogrid, shape, sampling, fields['vectdist'], fields['vectallo'], tile_size, transform_memory_mb)
+        del fields['smogrid']
+
+        #------------------------------------------------------------------
+        # 4. From Hellweger documentation: Compute the buffer grid
+        # (bufgrid2). The cells in the buffer grid outside the buffer
+        # distance (buffer) store the original elevation. The cells in the
+        # buffer grid inside the buffer distance have no data.
+        # half_res adjustment equal to half distance of one cell
+        half_res = elev.res[0]/2
+        final_buffer = buffer_dist - half_res # assume all units in meters.
+
+        #------------------------------------------------------------------
+        # 5. From Hellweger documentation: Compute the buffer distance grids
+        # (bufdist and bufallo). The cells in the buffer distance grid
+        # (bufdist) store the distance to the closest valued buffer grid
+        # cell (bufgrid2). The cells in buffer allocation grid (bufallo)
+        # store the elevation of the closest valued buffer cell.
+        def read_bufgrid(window):
+            cells = window.toslices()
+            elev_data_window = np.asarray(fields['elev'][cells])
+            sources = (np.asarray(fields['vectdist'][cells]) > final_buffer) & np.asarray(fields['elev_mask'][cells]) & ~np.isnan(elev_data_window)
+            return(sources, elev_data_window)
+
+        allocate(read_bufgrid, shape, sampling, fields['bufdist'], fields['bufallo'], tile_size, transform_memory_mb)
+
+        # Define profile output file.
+        agree_profile = dem_profile.copy()
+        agree_profile.update(dtype = 'float32')
+        agree_profile.update(intermediate_raster_profile())
+
+        with rasterio.open(output_raster, 'w', **agree_profile) as raster:
+            # Read elevation mask, distance and allocation grids, and river data.
+            sources = [fields['elev_mask'], fields['bufdist'], fields['bufallo'], fields['vectdist'], fields['vectallo'], rivers_raster]
+            write_agree_dem = lambda window, agree_dem_window: raster.write(agree_dem_window, indexes = 1, window = window)
+            map_blocks(partial(agree_dem_block, sharp_drop = sharp_drop, ndv = dem_profile['nodata']), sources, row_windows, write_agree_dem, number_of_jobs)
+
+    finally:
+        elev.close()
+        rivers.close()
+        # memory-mapped fields are always removed
+        fields.clear()
+        if not in_memory:
+            for name in ['elev', 'elev_mask', 'smogrid', 'vectdist', 'vectallo', 'bufdist', 'bufallo']:
+                scratch_filename = os.path.join(workspace, 'agree_{}.npy'.format(name))
+                if os.path.exists(scratch_filename):
+                    os.remove(scratch_filename)
 
 
 if __name__ == '__main__':
@@ -235,13 +230,13 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description = 'Calculate AGREE DEM')
     parser.add_argument('-r', '--rivers', help = 'flows grid boolean layer', required = True)
     parser.add_argument('-d', '--dem_m',  help = 'DEM raster in meters', required = True)
-    parser.add_argument('-w', '--workspace', help = 'Workspace', required = True)
-    parser.add_argument('-g', '--grass_workspace', help = 'Temporary GRASS workspace', required = True)
+    parser.add_argument('-w', '--workspace', help = 'Workspace for memory-mapped fields', required = True)
     parser.add_argument('-o',  '--output', help = 'Path to output raster', required = True)
     parser.add_argument('-b',  '--buffer', help = 'Buffer distance (m) on either side of channel', required = True)
     parser.add_argument('-sm', '--smooth', help = 'Smooth drop (m)', required = True)
     parser.add_argument('-sh', '---sharp', help = 'Sharp drop (m)', required = True)
-    parser.add_argument('-t',  '--del',  help = 'Optional flag to delete intermediate datasets', action = 'store_true')
+    parser.add_argument('-j',  '--number_of_jobs', help = 'Number of threads computing the output blocks. Default is the ncores_tiled environment variable', required = False, default = None, type = int)
+    parser.add_argument('-m',  '--max_memory_mb', help = 'Approximate peak memory (MB). Fields are memory-mapped in the workspace above it. Default keeps all fields in memory', required = False, default = None, type = float)
 
     #Extract to dictionary and assign to variables.
     args = vars(parser.parse_args())
@@ -250,12 +245,12 @@ if __name__ == '__main__':
     rivers_raster = args['rivers']
     dem = args['dem_m']
     workspace = args['workspace']
-    grass_workspace = args['grass_workspace']
     output_raster = args['output']
     buffer_dist = float(args['buffer'])
     smooth_drop = float(args['smooth'])
     sharp_drop =  float(args['sharp'])
-    delete_intermediate_data = args['del']
+    max_memory_mb = args['max_memory_mb']
+    number_of_jobs = args['number_of_jobs']
 
     #Run agreedem
-    agreedem(rivers_raster, dem, output_raster, workspace, grass_workspace, buffer_dist, smooth_drop, sharp_drop, delete_intermediate_data)
+    agreedem(rivers_raster, dem, output_raster, workspace, buffer_dist, smooth_drop, sharp_drop, max_memory_mb, number_of_jobs = number_of_jobs)
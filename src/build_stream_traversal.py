@@ -7,6 +7,7 @@ Required Arguments:
         hydro_id       = name of ID column (string)
 '''
 import sys
+import numpy as np
 import pandas as pd
 import argparse
 import geopandas as gpd
@@ -34,7 +35,6 @@ class build_stream_traversal_columns(object):
 
     def execute(self, streams, wbd8, hydro_id):
         try:
-            split_code = 1
             sOK = 'OK'
 
             # check for HydroID; Assign if it doesn't exist
@@ -74,41 +74,26 @@ class build_stream_traversal_columns(object):
             if(bOK==False):
                 # Add fields if not they do not exist.
                 if not from_node in streams.columns:
-                    streams[from_node] = ''
+                    streams[from_node] = pd.Series('', index=streams.index, dtype=object)
 
                 if not to_node in streams.columns:
-                    streams[to_node] = ''
+                    streams[to_node] = pd.Series('', index=streams.index, dtype=object)
 
                 streams = streams.sort_values(by=[hydro_id], ascending=True).copy()
 
-                xy_dict = {}
-                bhasnullshape=False
-                for rows in streams[['geometry', from_node, to_node]].iterrows():
-                    if rows[1][0]:
-                        # From Node
-                        firstx = round(rows[1][0].coords.xy[0][0], 7)
-                        firsty = round(rows[1][0].coords.xy[1][0], 7)
-                        from_key = '{},{}'.format(firstx, firsty)
-                        if from_key in xy_dict:
-                            streams.at[rows[0], from_node,] = xy_dict[from_key]
-                        else:
-                            xy_dict[from_key] = len(xy_dict) + 1
-                            streams.at[rows[0], from_node,] = xy_dict[from_key]
-
-                        # To Node
-                        lastx = round(rows[1][0].coords.xy[0][-1], 7)
-                        lasty = round(rows[1][0].coords.xy[1][-1], 7)
-                        to_key = '{},{}'.format(lastx, lasty)
-                        #if xy_dict.has_key(to_key):
-                        if to_key in xy_dict:
-                            streams.at[rows[0], to_node] = xy_dict[to_key]
-                        else:
-                            xy_dict[to_key] = len(xy_dict) + 1
-                            streams.at[rows[0], to_node] = xy_dict[to_key]
-                    else:
-                         bhasnullshape=True
-
-                if bhasnullshape==True:
+                # From and To node coordinates of every line, rounded as the node keys were (from, to, from, to, ...)
+                has_shape = np.array([bool(lineString) for lineString in streams.geometry])
+                end_coords = [(lineString.coords[0][:2], lineString.coords[-1][:2]) for lineString in streams.geometry[has_shape]]
+                node_xy = np.array([round(coordinate, 7) for nodes in end_coords for node in nodes for coordinate in node], dtype=np.float64).reshape(-1, 2)
+
+                # node ids numbered in order of first appearance
+                if len(node_xy) > 0:
+                    _, first_index, inverse = np.unique(node_xy, axis=0, return_index=True, return_inverse=True)
+                    node_ids = np.argsort(np.argsort(first_index)).astype(np.int64)[inverse.reshape(-1)] + 1
+                    streams.loc[has_shape, from_node] = node_ids[0::2].astype(object)
+                    streams.loc[has_shape, to_node] = node_ids[1::2].astype(object)
+
+                if not has_shape.all():
                     print ("Some of the input features have a null shape.")
                     print (from_node + " and " + to_node + " fields cannot be populated for those features.")
                 else:
@@ -116,50 +101,17 @@ class build_stream_traversal_columns(object):
 
             # Create NextDownID field
             if not next_down_id in streams.columns:
-                streams[next_down_id] = ''
+                streams[next_down_id] = pd.Series('', index=streams.index, dtype=object)
 
-            # Create dict to store from_node values for each HydroID
-            dnodes=dict()
-            lstHydroIDs=[]
-            for row in streams[[from_node,hydro_id]].iterrows():
+            # NextDownID is the first HydroID (in table order) whose From_Node is the To_Node of the segment, -1 for terminal segments
+            first_from_nodes = streams[[from_node, hydro_id]].drop_duplicates(subset=from_node, keep='first')
+            downstream = pd.Index(first_from_nodes[from_node]).get_indexer(streams[to_node])
+            next_down_ids = np.where(downstream >= 0, first_from_nodes[hydro_id].values[downstream], -1)
 
-                if (row[1][0] in dnodes)==False:
-                    lstHydroIDs=[row[1][1]]
-                    dnodes.setdefault(row[1][0],lstHydroIDs)
-                else:
-                    lstHydroIDs = dnodes[row[1][0]]
-                    lstHydroIDs.append(row[1][1])
-
-            # for each stream segment, search dict for HydroID downstream and
-            for urow in streams[[next_down_id, to_node, from_node, hydro_id]].iterrows():
-                tonodecol = urow[1][1]
-                nextdownIDcol = urow[1][0]
-                hydroIDcol = urow[1][3]
-                try:
-                    next_down_ids = dnodes[tonodecol]
-                except:
-                    next_down_ids=[]
-                splits = len(next_down_ids)
-                if splits == 0: # terminal segment
-                    nextdownIDcol = -1
-                elif splits == 1:
-                    nextdownIDcol = next_down_ids[0]
-                else: # either muliple inflows or
-                    i = 0
-                    for nid in next_down_ids:
-                        # Set the split code in the NextDownID field.
-                        if split_code < 0: # set terminal NextDownID field to -1; this should never happen..
-                            if i == 0:
-                                nextdownIDcol = split_code
-                        else: # muliple inflows
-                            if i == 0:
-                                nextdownIDcol = nid
-                        i += 1
-                try:
-                    if next_down_ids:del next_down_ids
-                except:
-                    pass
-                streams.loc[streams[hydro_id]== hydroIDcol,[next_down_id]] = nextdownIDcol
+            # segments sharing a HydroID all get the value of the last one
+            next_down_ids = pd.Series(next_down_ids, index=streams[hydro_id].values)
+            next_down_ids = next_down_ids[~next_down_ids.index.duplicated(keep='last')]
+            streams[next_down_id] = next_down_ids.reindex(streams[hydro_id].values).values.astype(object)
 
             tReturns = (sOK, streams)
         except Exception:
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import argparse
+import numpy as np
+import pandas as pd
+import rasterio
+from utils.tiled_execution import block_windows, reduce_blocks
+
+SRC_BASE_COLUMNS = ['CatchId', 'Stage', 'Number of Cells', 'SurfaceArea (m2)', 'BedArea (m2)', 'Volume (m3)', 'SLOPE', 'LENGTHKM', 'AREASQKM']
+
+
+def read_stages(stages_fileName):
+    ''' Reads the stages written by make_stages_and_catchlist.py '''
+
+    return(pd.read_csv(stages_fileName)['Stage'].values.astype('float64'))
+
+
+def read_catchment_list(catchlist_fileName):
+    ''' Reads the HydroID, slope, length (km) and area (km2) of each catchment written by make_stages_and_catchlist.py '''
+
+    return(pd.read_csv(catchlist_fileName, sep=' ', skiprows=1, header=None, names=['CatchId', 'SLOPE', 'LENGTHKM', 'AREASQKM']))
+
+
+def hydraulic_geometry_block(hand_window, catchments_window, slope_window, catch_ids, number_of_stages, stages, hand_ndv, slope_ndv):
+    '''
+    Histograms of the cells of one block by catchment (row) and by the first stage above their HAND (column). Returns
+    the cell counts, the sums of the bed area factor sqrt(1 + slope^2) and the sums of HAND.
+
+    '''
+
+    # catchments in the list (catch_ids is sorted) with valid HAND and slope
+    catch_index = np.minimum(np.searchsorted(catch_ids, catchments_window), len(catch_ids) - 1)
+    valid = (catch_ids[catch_index] == catchments_window) & (hand_window != hand_ndv) & ~np.isnan(hand_window) & (slope_window != slope_ndv)
+
+    hand = hand_window[valid].astype('float64')
+    slope = slope_window[valid].astype('float64')
+    # a cell is inundated at every stage above its HAND
+    bins = catch_index[valid] * (number_of_stages + 1) + np.searchsorted(stages, hand, side='right')
+    size = len(catch_ids) * (number_of_stages + 1)
+
+    return(np.stack([np.bincount(bins, minlength=size).astype('float64'),
+                     np.bincount(bins, weights=np.sqrt(1 + slope**2), minlength=size),
+                     np.bincount(bins, weights=hand, minlength=size)]))
+
+
+def catchment_hydraulic_geometry(hand_fileName, catchments_fileName, slopes_fileName, stages, catchment_list, number_of_jobs=None):
+    '''
+    Computes the hydraulic geometry of each catchment at each stage (the src_base.csv table of TauDEM catchhydrogeo).
+    HAND, catchments and slopes are read once: the cells are binned by catchment and by the first stage above their
+    HAND, and cumulative sums over the stages give the inundated cells at every stage.
+
+    Parameters
+    ----------
+    hand_fileName : str
+        HAND raster (rem_zeroed_masked.tif).
+    catchments_fileName : str
+        HydroID catchment raster (gw_catchments_reaches_filtered_addedAttributes.tif).
+    slopes_fileName : str
+        Slope raster (slopes_d8_dem_meters_masked.tif).
+    stages : numpy.ndarray
+        Increasing stages in meters.
+    catchment_list : pandas.DataFrame
+        CatchId, SLOPE, LENGTHKM and AREASQKM of the catchments (see read_catchment_list).
+    number_of_jobs : int
+        Number of threads processing blocks. Defaults to the ncores_tiled environment variable.
+
+    Returns
+    -------
+    src_base : pandas.DataFrame
+        One row per catchment and stage, in catchment list then stage order, with the SRC_BASE_COLUMNS.
+
+    '''
+
+    with rasterio.open(hand_fileName) as hand, rasterio.open(slopes_fileName) as slopes:
+        cell_area = abs(hand.transform.a * hand.transform.e)
+        hand_ndv, slope_ndv = hand.nodata, slopes.nodata
+
+    catch_ids = np.unique(catchment_list['CatchId'].values)
+    number_of_stages = len(stages)
+
+    def kernel(hand_window, catchments_window, slope_window):
+        return(hydraulic_geometry_block(hand_window, catchments_window, slope_window, catch_ids, number_of_stages, stages, hand_ndv, slope_ndv))
+
+    histograms = reduce_blocks(kernel, [hand_fileName, catchments_fileName, slopes_fileName], block_windows(hand_fileName),
+                               np.add, np.zeros((3, len(catch_ids) * (number_of_stages + 1))), number_of_jobs)
+
+    # cumulative sums over the stages, the last column holds cells above the highest stage
+    cell_count, bed_factor, hand_sum = np.cumsum(histograms.reshape(3, len(catch_ids), number_of_stages + 1), axis=2)[:, :, :number_of_stages]
+
+    # rows in catchment list order
+    rows = np.searchsorted(catch_ids, catchment_list['CatchId'].values)
+    cell_count, bed_factor, hand_sum = cell_count[rows].ravel(), bed_factor[rows].ravel(), hand_sum[rows].ravel()
+    stage = np.tile(stages, len(rows))
+
+    src_base = pd.DataFrame({'CatchId' : np.repeat(catchment_list['CatchId'].values, number_of_stages),
+                             'Stage' : stage,
+                             'Number of Cells' : cell_count.astype('int64'),
+                             'SurfaceArea (m2)' : cell_count * cell_area,
+                             'BedArea (m2)' : bed_factor * cell_area,
+                             'Volume (m3)' : (stage * cell_count - hand_sum) * cell_area})
+    for column in ['SLOPE', 'LENGTHKM', 'AREASQKM']:
+        src_base[column] = np.repeat(catchment_list[column].values, number_of_stages)
+
+    return(src_base[SRC_BASE_COLUMNS])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Catchment hydraulic geometry by stage (replaces TauDEM catchhydrogeo)')
+    parser.add_argument('-r','--hand',help='HAND raster (rem_zeroed_masked.tif)',required=True)
+    parser.add_argument('-c','--catchments',help='HydroID catchment raster',required=True)
+    parser.add_argument('-l','--catchlist',help='Catchment list text file from make_stages_and_catchlist.py',required=True)
+    parser.add_argument('-s','--slopes',help='Slope raster masked to the catchments',required=True)
+    parser.add_argument('-t','--stages',help='Stage text file from make_stages_and_catchlist.py',required=True)
+    parser.add_argument('-o','--table',help='Output src_base.csv',required=True)
+    parser.add_argument('-j','--number_of_jobs',help='Number of threads processing blocks. Default is the ncores_tiled environment variable',required=False,default=None,type=int)
+
+    args = vars(parser.parse_args())
+
+    src_base = catchment_hydraulic_geometry(args['hand'], args['catchments'], args['slopes'], read_stages(args['stages']),
+                                            read_catchment_list(args['catchlist']), args['number_of_jobs'])
+    src_base.to_csv(args['table'], index=False)
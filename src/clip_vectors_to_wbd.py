@@ -6,8 +6,9 @@ import argparse
 from os.path import splitext
 from shapely.geometry import MultiPolygon,Polygon,Point
 from utils.shared_functions import getDriver
+from partition_vector_inputs import read_vector_subset
 
-def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_lakes_filename,nld_lines_filename,nwm_catchments_filename,nhd_headwaters_filename,landsea_filename,wbd_filename,wbd_buffer_filename,subset_nhd_streams_filename,subset_nld_lines_filename,subset_nwm_lakes_filename,subset_nwm_catchments_filename,subset_nhd_headwaters_filename,subset_nwm_streams_filename,subset_landsea_filename,extent,great_lakes_filename,wbd_buffer_distance,lake_buffer_distance,dissolveLinks=False):
+def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_lakes_filename,nld_lines_filename,nwm_catchments_filename,nhd_headwaters_filename,landsea_filename,wbd_filename,wbd_buffer_filename,subset_nhd_streams_filename,subset_nld_lines_filename,subset_nwm_lakes_filename,subset_nwm_catchments_filename,subset_nhd_headwaters_filename,subset_nwm_streams_filename,subset_landsea_filename,extent,great_lakes_filename,wbd_buffer_distance,lake_buffer_distance,dissolveLinks=False,partition_dir=None):
 
     hucUnitLength = len(str(hucCode))
 
@@ -17,7 +18,7 @@ def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_l
     wbd_buffer.geometry = wbd.geometry.buffer(wbd_buffer_distance,resolution=32)
     projection = wbd_buffer.crs
 
-    great_lakes = gpd.read_file(great_lakes_filename, mask = wbd_buffer).reset_index(drop=True)
+    great_lakes = read_vector_subset(great_lakes_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir).reset_index(drop=True)
 
     if not great_lakes.empty:
         print("Masking Great Lakes for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
@@ -40,14 +41,14 @@ def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_l
     del great_lakes
 
     # Clip ocean water polygon for future masking ocean areas (where applicable)
-    landsea = gpd.read_file(landsea_filename, mask = wbd_buffer)
+    landsea = read_vector_subset(landsea_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
     if not landsea.empty:
         landsea.to_file(subset_landsea_filename,driver=getDriver(subset_landsea_filename),index=False)
     del landsea
 
     # Find intersecting lakes and writeout
     print("Subsetting NWM Lakes for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nwm_lakes = gpd.read_file(nwm_lakes_filename, mask = wbd_buffer)
+    nwm_lakes = read_vector_subset(nwm_lakes_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
     nwm_lakes = nwm_lakes.loc[nwm_lakes.Shape_Area < 18990454000.0]
 
     if not nwm_lakes.empty:
@@ -62,14 +63,14 @@ def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_l
 
     # Find intersecting levee lines
     print("Subsetting NLD levee lines for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nld_lines = gpd.read_file(nld_lines_filename, mask = wbd_buffer)
+    nld_lines = read_vector_subset(nld_lines_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
     if not nld_lines.empty:
         nld_lines.to_file(subset_nld_lines_filename,driver=getDriver(subset_nld_lines_filename),index=False)
     del nld_lines
 
     # Subset nhd headwaters
     print("Subsetting NHD Headwater Points for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nhd_headwaters = gpd.read_file(nhd_headwaters_filename, mask = wbd_buffer)
+    nhd_headwaters = read_vector_subset(nhd_headwaters_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
     if extent == 'MS':
         nhd_headwaters = nhd_headwaters.loc[nhd_headwaters.mainstem==1]
 
@@ -82,7 +83,7 @@ def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_l
 
     # Subset nhd streams
     print("Querying NHD Streams for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nhd_streams = gpd.read_file(nhd_streams_filename, mask = wbd_buffer)
+    nhd_streams = read_vector_subset(nhd_streams_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
 
     if extent == 'MS':
         nhd_streams = nhd_streams.loc[nhd_streams.mainstem==1]
@@ -105,7 +106,7 @@ def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_l
 
     # Find intersecting nwm_catchments
     print("Subsetting NWM Catchments for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nwm_catchments = gpd.read_file(nwm_catchments_filename, mask = wbd_buffer)
+    nwm_catchments = read_vector_subset(nwm_catchments_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
     if extent == 'MS':
         nwm_catchments = nwm_catchments.loc[nwm_catchments.mainstem==1]
 
@@ -118,7 +119,7 @@ def subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_l
 
     # Subset nwm streams
     print("Subsetting NWM Streams and deriving headwaters for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nwm_streams = gpd.read_file(nwm_streams_filename, mask = wbd_buffer)
+    nwm_streams = read_vector_subset(nwm_streams_filename, wbd_buffer, hucCode, wbd_buffer_distance, partition_dir)
     if extent == 'MS':
         nwm_streams = nwm_streams.loc[nwm_streams.mainstem==1]
     nwm_streams.to_file(subset_nwm_streams_filename,driver=getDriver(subset_nwm_streams_filename),index=False)
@@ -149,6 +150,7 @@ if __name__ == '__main__':
     parser.add_argument('-wb','--wbd-buffer-distance',help='WBD Mask buffer distance',required=True,type=int)
     parser.add_argument('-lb','--lake-buffer-distance',help='Great Lakes Mask buffer distance',required=True,type=int)
     parser.add_argument('-o','--dissolve-links',help='remove multi-line strings',action="store_true",default=False)
+    parser.add_argument('-p','--partition-dir',help='Partitioned national inputs (see partition_vector_inputs.py). Layers not in the store are read from the national files',required=False,default=None)
 
 
     args = vars(parser.parse_args())
@@ -175,5 +177,6 @@ if __name__ == '__main__':
     wbd_buffer_distance = args['wbd_buffer_distance']
     lake_buffer_distance  = args['lake_buffer_distance']
     dissolveLinks = args['dissolve_links']
+    partition_dir = args['partition_dir']
 
-    subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_lakes_filename,nld_lines_filename,nwm_catchments_filename,nhd_headwaters_filename,landsea_filename,wbd_filename,wbd_buffer_filename,subset_nhd_streams_filename,subset_nld_lines_filename,subset_nwm_lakes_filename,subset_nwm_catchments_filename,subset_nhd_headwaters_filename,subset_nwm_streams_filename,subset_landsea_filename,extent,great_lakes_filename,wbd_buffer_distance,lake_buffer_distance,dissolveLinks)
+    subset_vector_layers(hucCode,nwm_streams_filename,nhd_streams_filename,nwm_lakes_filename,nld_lines_filename,nwm_catchments_filename,nhd_headwaters_filename,landsea_filename,wbd_filename,wbd_buffer_filename,subset_nhd_streams_filename,subset_nld_lines_filename,subset_nwm_lakes_filename,subset_nwm_catchments_filename,subset_nhd_headwaters_filename,subset_nwm_streams_filename,subset_landsea_filename,extent,great_lakes_filename,wbd_buffer_distance,lake_buffer_distance,dissolveLinks,partition_dir)
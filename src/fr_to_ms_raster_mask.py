@@ -6,8 +6,13 @@
 
 import sys
 import os
+import numpy as np
 import geopandas as gpd
+import rasterio
 import rasterio.mask
+from rasterio.windows import Window
+from utils.shared_functions import intermediate_raster_profile
+from utils.tiled_execution import map_blocks
 
 split_flows_fileName    = sys.argv[1]
 fdr_fr                  = sys.argv[2]
@@ -28,56 +33,47 @@ print ("Limiting rasters to buffer area ({} meters) around model streams".format
 
 split_flows_ms_buffer = split_flows.unary_union.buffer(ms_buffer_dist)
 
-print('Writing raster outputs ...')
-
-# Mask nhddem
+# The rasters share the DEM grid, so the buffer is rasterized and the crop window computed once
+# (the same window and mask as rasterio.mask.mask with crop=True).
 with rasterio.open(dem_fr) as src:
-    out_image, out_transform = rasterio.mask.mask(src, [split_flows_ms_buffer], crop=True)
-    out_meta = src.meta
-
-out_meta.update({"driver": "GTiff",
-     "height": out_image.shape[1],
-     "width": out_image.shape[2],
-     "transform": out_transform})
-
-with rasterio.open(os.path.join(os.path.dirname(dem_fr), dem_ms_filename), "w", **out_meta) as dest:
-    dest.write(out_image)
-
-# Mask fdr
-with rasterio.open(fdr_fr) as src:
-    out_image, out_transform = rasterio.mask.mask(src, [split_flows_ms_buffer], crop=True)
-    out_meta = src.meta
-
-out_meta.update({"driver": "GTiff",
-     "height": out_image.shape[1],
-     "width": out_image.shape[2],
-     "transform": out_transform})
+    outside_buffer, out_transform, crop_window = rasterio.mask.raster_geometry_mask(src, [split_flows_ms_buffer], crop=True)
 
-with rasterio.open(os.path.join(os.path.dirname(fdr_fr), fdr_ms_filename), "w", **out_meta) as dest:
-    dest.write(out_image)
-
-# Mask slope
-with rasterio.open(slope_fr) as src:
-    out_image, out_transform = rasterio.mask.mask(src, [split_flows_ms_buffer], crop=True)
-    out_meta = src.meta
-
-out_meta.update({"driver": "GTiff",
-     "height": out_image.shape[1],
-     "width": out_image.shape[2],
-     "transform": out_transform})
-
-with rasterio.open(os.path.join(os.path.dirname(slope_fr), slope_ms_filename), "w", **out_meta) as dest:
-    dest.write(out_image)
-
-# Mask stream pixels
-with rasterio.open(str_pixel_fr) as src:
-    out_image, out_transform = rasterio.mask.mask(src, [split_flows_ms_buffer], crop=True)
-    out_meta = src.meta
-
-out_meta.update({"driver": "GTiff",
-     "height": out_image.shape[1],
-     "width": out_image.shape[2],
-     "transform": out_transform})
+print('Writing raster outputs ...')
 
-with rasterio.open(os.path.join(os.path.dirname(str_pixel_fr), str_pixel_ms_filename), "w", **out_meta) as dest:
-    dest.write(out_image)
+inputs = [dem_fr, fdr_fr, slope_fr, str_pixel_fr]
+outputs = [os.path.join(os.path.dirname(fr), ms) for fr, ms in zip(inputs, [dem_ms_filename, fdr_ms_filename, slope_ms_filename, str_pixel_ms_filename])]
+
+fill_values, profiles = [], []
+for fr in inputs:
+    with rasterio.open(fr) as src:
+        out_meta = src.meta.copy()
+    out_meta.update({"driver": "GTiff",
+         "height": outside_buffer.shape[0],
+         "width": outside_buffer.shape[1],
+         "transform": out_transform})
+    out_meta.update(intermediate_raster_profile())
+    profiles.append(out_meta)
+    # rasterio.mask.mask fills with 0 without nodata
+    fill_values.append(out_meta['nodata'] if out_meta['nodata'] is not None else 0)
+
+# Blocks of the output grid, read from the inputs at the crop window offset
+block_size = intermediate_raster_profile()['blockysize']
+row_off, col_off = int(crop_window.row_off), int(crop_window.col_off)
+windows = [Window(col_off + col, row_off + row, min(block_size, outside_buffer.shape[1] - col), min(block_size, outside_buffer.shape[0] - row))
+           for row in range(0, outside_buffer.shape[0], block_size) for col in range(0, outside_buffer.shape[1], block_size)]
+
+def mask_block(*input_windows, window):
+    outside = outside_buffer[window.row_off - row_off:window.row_off - row_off + window.height, window.col_off - col_off:window.col_off - col_off + window.width]
+    return([np.where(outside, fill_value, input_window).astype(input_window.dtype) for input_window, fill_value in zip(input_windows, fill_values)])
+
+destinations = [rasterio.open(ms, "w", **profile) for ms, profile in zip(outputs, profiles)]
+try:
+    def write_blocks(window, masked_windows):
+        out_window = Window(window.col_off - col_off, window.row_off - row_off, window.width, window.height)
+        for dest, masked_window in zip(destinations, masked_windows):
+            dest.write(masked_window, indexes=1, window=out_window)
+
+    map_blocks(mask_block, inputs, windows, write_blocks, window_argument=True)
+finally:
+    for dest in destinations:
+        dest.close()
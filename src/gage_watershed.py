@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.windows import Window
+from utils.shared_functions import intermediate_raster_profile
+from utils.tiled_execution import map_blocks
+
+# TauDEM D8 flow directions (1 = east, counter clockwise to 8 = south east) as row and column offsets. Index 0 is unused.
+D8_ROW_OFFSETS = np.array([0, 0, -1, -1, -1, 0, 1, 1, 1])
+D8_COL_OFFSETS = np.array([0, 1, 1, 0, -1, -1, -1, 0, 1])
+
+# nodata of the TauDEM gagewatershed output
+GAGE_WATERSHED_NODATA = -2147483647
+
+# Default tile size in cells. Labeling takes about 40 bytes of temporaries per tile cell.
+GAGE_WATERSHED_TILE_SIZE = 4096
+
+# Labels while resolving. Seed ids are positive, UNRESOLVED cells still follow their pointer and NO_SEED cells drain to
+# nodata or off the raster. Labels below NO_SEED are tile exits -(2 + g) into the cell of global flat index g.
+UNRESOLVED = 0
+NO_SEED = -1
+
+
+def resolve_pointers(label, pointer):
+    '''
+    Pointer jumping: each UNRESOLVED cell takes the label of the cell its pointer chain ends in. Pointers are doubled
+    every round so chains of length L resolve in log2(L) rounds. Cells still unresolved after that are on a flow
+    direction loop and get NO_SEED.
+
+    '''
+
+    unresolved = np.flatnonzero(label == UNRESOLVED)
+    for _ in range(int(np.ceil(np.log2(max(len(label), 2)))) + 2):
+        if unresolved.size == 0:
+            break
+        target = pointer[unresolved]
+        target_label = label[target]
+        resolved = target_label != UNRESOLVED
+        label[unresolved[resolved]] = target_label[resolved]
+        unresolved, target = unresolved[~resolved], target[~resolved]
+        pointer[unresolved] = pointer[target]
+
+    label[unresolved] = NO_SEED
+
+    return(label)
+
+
+def label_window(flowdir, seeds, flowdir_ndv, window, height, width):
+    '''
+    Labels each cell of a window of a height x width grid with the id of the seed it drains to within the window.
+    Cells draining to nodata or off the raster get NO_SEED and cells leaving the window get -(2 + g), g being the
+    global flat index of the cell they flow into.
+
+    '''
+
+    window_height, window_width = flowdir.shape
+    valid = (flowdir >= 1) & (flowdir <= 8)
+    if flowdir_ndv is not None:
+        valid &= (flowdir != flowdir_ndv)
+    direction = np.where(valid, flowdir, 0).astype(np.intp)
+
+    # global row and column of the downstream cell
+    down_row = np.arange(window.row_off, window.row_off + window_height)[:, None] + D8_ROW_OFFSETS[direction]
+    down_col = np.arange(window.col_off, window.col_off + window_width)[None, :] + D8_COL_OFFSETS[direction]
+    on_raster = valid & (down_row >= 0) & (down_row < height) & (down_col >= 0) & (down_col < width)
+    in_window = on_raster & (down_row >= window.row_off) & (down_row < window.row_off + window_height) & \
+                (down_col >= window.col_off) & (down_col < window.col_off + window_width)
+
+    label = np.where(in_window, UNRESOLVED, NO_SEED).astype(np.int64)
+    leaving = on_raster & ~in_window
+    label[leaving] = -(2 + down_row[leaving].astype(np.int64) * width + down_col[leaving])
+    # seeds on valid flow directions label themselves
+    seeded = valid & (seeds > 0)
+    label[seeded] = seeds[seeded]
+
+    pointer = np.where(in_window, (down_row - window.row_off) * window_width + (down_col - window.col_off), 0).ravel()
+    del down_row, down_col, direction, on_raster, in_window
+
+    return(resolve_pointers(label.ravel(), pointer).reshape(window_height, window_width))
+
+
+def stream_pixel_offsets(stream_raster, windows, tile_columns, number_of_jobs):
+    '''
+    Number of stream pixels (>= 1) before each row of each tile column in row-major order, so stream pixels are
+    numbered 1..N as reachID_grid_to_vector_points.py numbers its featureID points.
+
+    '''
+
+    with rasterio.open(stream_raster) as streams:
+        counts = np.zeros((streams.height, len(tile_columns)), dtype=np.int64)
+
+    def write_counts(window, row_counts):
+        counts[window.row_off:window.row_off + window.height, tile_columns.index(window.col_off)] = row_counts
+
+    map_blocks(lambda stream_window: (stream_window >= 1).sum(axis=1), [stream_raster], windows, write_counts, number_of_jobs)
+
+    return((np.cumsum(counts.ravel()) - counts.ravel()).reshape(counts.shape))
+
+
+def gage_watershed(flowdir_fileName, output_fileName, seed_raster=None, seed_points=None, number_seeds=False, tile_size=None, number_of_jobs=None):
+    '''
+    Labels each cell with the id of the seed (gage) it drains to following D8 flow directions, as TauDEM gagewatershed.
+
+    Parameters
+    ----------
+    flowdir_fileName : str
+        TauDEM D8 flow direction raster.
+    output_fileName : str
+        Output int32 label raster (nodata where no seed is reached).
+    seed_raster : str
+        Raster of positive seed ids on the flow direction grid. With number_seeds its cells >= 1 are numbered 1..N in
+        row-major order instead (the stream pixel ids).
+    seed_points : str
+        Point layer of seeds with an id attribute (e.g. the split points). Used when seed_raster is not set.
+    number_seeds : bool
+        Number the seed raster cells, see seed_raster.
+    tile_size : int
+        Cells are labeled in tiles of tile_size cells (about 40 bytes of temporaries per tile cell). Tile exits are
+        resolved over the tile edges and the tiles labeled again. Defaults to the gage_watershed_tile_size environment
+        variable, or GAGE_WATERSHED_TILE_SIZE.
+    number_of_jobs : int
+        Number of threads processing tiles. Defaults to the ncores_tiled environment variable.
+
+    '''
+
+    if tile_size is None:
+        tile_size = int(os.environ.get('gage_watershed_tile_size') or GAGE_WATERSHED_TILE_SIZE)
+
+    with rasterio.open(flowdir_fileName) as flowdir:
+        profile = flowdir.profile.copy()
+        height, width, flowdir_ndv, transform = flowdir.height, flowdir.width, flowdir.nodata, flowdir.transform
+
+    tile_columns = list(range(0, width, tile_size))
+    windows = [Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+               for row_off in range(0, height, tile_size) for col_off in tile_columns]
+
+    sources = [flowdir_fileName]
+    if seed_raster is not None:
+        sources.append(seed_raster)
+        if number_seeds:
+            offsets = stream_pixel_offsets(seed_raster, windows, tile_columns, number_of_jobs)
+    else:
+        points = gpd.read_file(seed_points)
+        point_rows, point_cols = rasterio.transform.rowcol(transform, points.geometry.x.values, points.geometry.y.values)
+        point_rows, point_cols, point_ids = np.asarray(point_rows), np.asarray(point_cols), points['id'].values.astype(np.int64)
+
+    def window_seeds(seed_window, window):
+        if seed_raster is None:
+            seeds = np.zeros((window.height, window.width), dtype=np.int64)
+            inside = (point_rows >= window.row_off) & (point_rows < window.row_off + window.height) & \
+                     (point_cols >= window.col_off) & (point_cols < window.col_off + window.width)
+            seeds[point_rows[inside] - window.row_off, point_cols[inside] - window.col_off] = point_ids[inside]
+            return(seeds)
+        if number_seeds:
+            stream_cells = seed_window >= 1
+            row_offsets = offsets[window.row_off:window.row_off + window.height, tile_columns.index(window.col_off)]
+            return(np.where(stream_cells, row_offsets[:, None] + np.cumsum(stream_cells, axis=1), 0))
+        return(seed_window)
+
+    def kernel(flowdir_window, *seed_window, window):
+        seeds = window_seeds(seed_window[0] if seed_window else None, window)
+        return(label_window(flowdir_window, seeds, flowdir_ndv, window, height, width))
+
+    # tile edge labels, with the exits resolved over the edges of all tiles
+    edge_cells, edge_labels = [], []
+    if len(windows) > 1:
+        def collect_edges(window, label):
+            edge = np.zeros(label.shape, dtype=bool)
+            edge[[0, -1], :] = True
+            edge[:, [0, -1]] = True
+            rows, cols = np.nonzero(edge)
+            edge_cells.append((rows + window.row_off).astype(np.int64) * width + cols + window.col_off)
+            edge_labels.append(label[rows, cols])
+
+        map_blocks(kernel, sources, windows, collect_edges, number_of_jobs, window_argument=True)
+
+        edge_cells, edge_labels = np.concatenate(edge_cells), np.concatenate(edge_labels)
+        order = np.argsort(edge_cells)
+        edge_cells, edge_labels = edge_cells[order], edge_labels[order]
+        # every exit is into a cell on the edge of the neighbouring tile, so exits are pointers into the edge cells
+        edge_pointer = np.arange(len(edge_cells))
+        exits = edge_labels < NO_SEED
+        edge_pointer[exits] = np.searchsorted(edge_cells, -(edge_labels[exits] + 2))
+        edge_labels[exits] = UNRESOLVED
+        edge_labels = resolve_pointers(edge_labels, edge_pointer)
+
+    profile.update(dtype='int32', nodata=GAGE_WATERSHED_NODATA)
+    profile.update(intermediate_raster_profile())
+
+    with rasterio.open(output_fileName, 'w', **profile) as output:
+        def write_labels(window, label):
+            exits = label < NO_SEED
+            if exits.any():
+                label[exits] = edge_labels[np.searchsorted(edge_cells, -(label[exits] + 2))]
+            output.write(np.where(label == NO_SEED, GAGE_WATERSHED_NODATA, label).astype('int32'), indexes=1, window=window)
+
+        map_blocks(kernel, sources, windows, write_labels, number_of_jobs, window_argument=True)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Label cells with the seed they drain to (native TauDEM gagewatershed)')
+    parser.add_argument('-f','--flowdir',help='D8 flow direction raster',required=True)
+    parser.add_argument('-o','--output',help='Output gage watershed raster',required=True)
+    parser.add_argument('-s','--seed_raster',help='Raster of seed ids (or of stream pixels with -n)',required=False,default=None)
+    parser.add_argument('-p','--seed_points',help='Point layer of seeds with an id attribute',required=False,default=None)
+    parser.add_argument('-n','--number_seeds',help='Number the seed raster cells >= 1 in row-major order',required=False,default=False,action='store_true')
+    parser.add_argument('-t','--tile_size',help='Label in tiles of this many cells. Default is the gage_watershed_tile_size environment variable or 4096',required=False,default=None,type=int)
+    parser.add_argument('-j','--number_of_jobs',help='Number of threads processing tiles. Default is the ncores_tiled environment variable',required=False,default=None,type=int)
+
+    args = vars(parser.parse_args())
+
+    if (args['seed_raster'] is None) == (args['seed_points'] is None):
+        parser.error('One of --seed_raster or --seed_points is required')
+
+    gage_watershed(args['flowdir'], args['output'], args['seed_raster'], args['seed_points'], args['number_seeds'], args['tile_size'], args['number_of_jobs'])
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from scipy.ndimage import distance_transform_edt
+from scipy.spatial import cKDTree
+from utils.shared_functions import intermediate_raster_profile
+
+# Approximate bytes per cell of one distance transform tile with its halo (values and sources read, float64 distances,
+# nearest cell indices and allocation).
+TILE_BYTES_PER_CELL = 40
+
+# Approximate bytes per boundary source cell kept to resolve cells far from every source (coordinates, value and k-d tree).
+SOURCE_BYTES = 64
+
+# Far cells are looked up in the k-d tree at most this many at a time (about 48 bytes each).
+FAR_CHUNK_CELLS = 2**16
+
+
+def euclidean_allocation(sources, values, sampling):
+    '''
+    Computes the distance to, and the value of, the nearest source cell for every cell of an array.
+
+    Parameters
+    ----------
+    sources : NUMPY.NDARRAY
+        Boolean array. True for source (non-null) cells.
+    values : NUMPY.NDARRAY
+        Values of the cells. Only source cells are allocated.
+    sampling : TUPLE
+        Cell height and width in map units.
+
+    Returns
+    -------
+    distance : NUMPY.NDARRAY
+        Distance between cell centers in map units. NaN everywhere if there are no source cells.
+    allocation : NUMPY.NDARRAY
+        Value of the nearest source cell.
+
+    '''
+
+    if not sources.any():
+        return(np.full(sources.shape, np.nan), np.full(sources.shape, np.nan))
+
+    distance, (rows, cols) = distance_transform_edt(~sources, sampling = sampling, return_indices = True)
+
+    return(distance, values[rows, cols])
+
+
+def read_sources(raster, window=None):
+    ''' Reads raster values and the mask of its non-null cells (the source cells of r.grow.distance) '''
+
+    values = raster.read(1, window = window)
+    sources = raster.read_masks(1, window = window) > 0
+    if np.issubdtype(values.dtype, np.floating):
+        sources &= ~np.isnan(values)
+
+    return(sources, values)
+
+
+def allocation_values(allocated, distance, allocation_profile):
+    ''' Casts allocated to the allocation dtype. Cells without any source (NaN distance) are set to nodata. '''
+
+    return(np.where(np.isnan(distance), allocation_profile['nodata'], allocated).astype(allocation_profile['dtype']))
+
+
+def grow_distance(input_raster, proximity_dtype, allocation_dtype, tile_size=None):
+    '''
+    Native replacement of the GRASS r.grow.distance tool (-m flag). Given an input raster it produces the proximity
+    (distance in map units to the nearest non-null cell) and the euclidean allocation (value of the nearest non-null
+    cell) rasters.
+
+    Parameters
+    ----------
+    input_raster : STR
+        Path to input raster. For example, see flows_grid_boolean.tif
+    proximity_dtype: STR
+        Data type for the proximity output. Typically 'Float32'.
+    allocation_dtype: STR
+        Data type for the allocation output. Typically 'Float32' (AGREE processing) or 'Int32' (stream pixel ids for thalweg adjustment processing)
+    tile_size : INT
+        If set, the raster is processed in tiles of tile_size cells with a halo, and the cells farther than the halo
+        from every source are resolved from the boundary sources of the raster (see grow_distance_tiled). Defaults to
+        the grow_distance_tile_size environment variable. Empty processes the whole raster at once.
+
+    Returns
+    -------
+    output_proximity_path : STR
+        The path to the output proximity (or distance) raster (in tif format).
+    output_allocation_path : STR
+        The path to the output euclidian allocation raster (in tif format).
+
+    '''
+
+    if tile_size is None and os.environ.get('grow_distance_tile_size'):
+        tile_size = int(os.environ['grow_distance_tile_size'])
+
+    # Saved to same directory as input raster, as r_grow_distance.py does.
+    input_raster_directory = os.path.dirname(input_raster)
+    input_raster_name = os.path.splitext(os.path.basename(input_raster))[0]
+    output_proximity_path = os.path.join(input_raster_directory, input_raster_name + '_dist.tif')
+    output_allocation_path = os.path.join(input_raster_directory, input_raster_name + '_allo.tif')
+
+    with rasterio.open(input_raster) as raster:
+        profile = raster.profile.copy()
+        profile.update(intermediate_raster_profile())
+        sampling = (abs(raster.transform.e), abs(raster.transform.a))
+
+        proximity_profile = profile.copy()
+        proximity_profile.update(dtype = proximity_dtype.lower(), nodata = np.nan)
+        allocation_profile = profile.copy()
+        allocation_profile.update(dtype = allocation_dtype.lower(), nodata = np.nan)
+        if not np.issubdtype(np.dtype(allocation_profile['dtype']), np.floating):
+            # integer allocations (e.g. stream pixel ids) keep the nodata value of the input raster
+            allocation_profile.update(nodata = raster.nodata)
+
+        with rasterio.open(output_proximity_path, 'w', **proximity_profile) as proximity, rasterio.open(output_allocation_path, 'w', **allocation_profile) as allocation:
+            if tile_size is None:
+                sources, values = read_sources(raster)
+                distance, allocated = euclidean_allocation(sources, values, sampling)
+                proximity.write(distance.astype(proximity_profile['dtype']), indexes = 1)
+                allocation.write(allocation_values(allocated, distance, allocation_profile), indexes = 1)
+            else:
+                read_window = lambda window: read_sources(raster, window)
+                for window, distance, allocated in grow_distance_tiled(read_window, raster.height, raster.width, sampling, tile_size):
+                    proximity.write(distance.astype(proximity_profile['dtype']), indexes = 1, window = window)
+                    allocation.write(allocation_values(allocated, distance, allocation_profile), indexes = 1, window = window)
+
+    return output_proximity_path, output_allocation_path
+
+
+def tile_windows(height, width, tile_size):
+
+    return([Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+            for row_off in range(0, height, tile_size) for col_off in range(0, width, tile_size)])
+
+
+def boundary_sources(read_window, height, width, tile_size, sampling, max_bytes=None):
+    '''
+    Returns a k-d tree (in map units) of the source cells with a non-source neighbour, and their values, read tile by
+    tile, or None if there is no source. Only these can be nearest to a non-source cell: a source whose four neighbours
+    are sources has a neighbour nearer to any cell outside. Raises MemoryError if they would take more than max_bytes.
+
+    '''
+
+    points, source_values, count = [], [], 0
+    for window in tile_windows(height, width, tile_size):
+        row_start, col_start = max(window.row_off - 1, 0), max(window.col_off - 1, 0)
+        row_stop = min(window.row_off + window.height + 1, height)
+        col_stop = min(window.col_off + window.width + 1, width)
+        sources, values = read_window(Window(col_start, row_start, col_stop - col_start, row_stop - row_start))
+
+        # sources whose four neighbours are sources (cells beyond the grid count as sources)
+        interior = sources.copy()
+        interior[1:] &= sources[:-1]
+        interior[:-1] &= sources[1:]
+        interior[:, 1:] &= sources[:, :-1]
+        interior[:, :-1] &= sources[:, 1:]
+
+        core = (slice(window.row_off - row_start, window.row_off - row_start + window.height), slice(window.col_off - col_start, window.col_off - col_start + window.width))
+        rows, cols = np.nonzero(sources[core] & ~interior[core])
+
+        count += len(rows)
+        if (max_bytes is not None) and (count * SOURCE_BYTES > max_bytes):
+            raise MemoryError('Over {} boundary source cells, which need more than the {:.0f} MB left to resolve cells far from every source'.format(count, max_bytes / 1024**2))
+
+        points.append(np.column_stack([(rows + window.row_off) * sampling[0], (cols + window.col_off) * sampling[1]]))
+        source_values.append(values[core][rows, cols])
+
+    if count == 0:
+        return(None)
+
+    return(cKDTree(np.concatenate(points)), np.concatenate(source_values))
+
+
+def resolve_far_cells(far_sources, far, distance, allocated, row_off, col_off, sampling):
+    ''' Sets the distance and allocation of the far cells of a tile to those of their nearest boundary source '''
+
+    tree, source_values = far_sources
+    strip_rows = max(FAR_CHUNK_CELLS // far.shape[1], 1)
+
+    for strip_start in range(0, far.shape[0], strip_rows):
+        strip = slice(strip_start, strip_start + strip_rows)
+        rows, cols = np.nonzero(far[strip])
+        if len(rows) == 0:
+            continue
+
+        rows += strip_start
+        far_distance, nearest = tree.query(np.column_stack([(rows + row_off) * sampling[0], (cols + col_off) * sampling[1]]))
+        distance[rows, cols] = far_distance
+        allocated[rows, cols] = source_values[nearest]
+
+
+def grow_distance_tiled(read_window, height, width, sampling, tile_size, halo=None, max_memory_mb=None):
+    '''
+    Yields (window, distance, allocation) for each tile of a height x width grid. read_window(window) returns the
+    (sources, values) arrays of a window (see read_sources). Each tile is read with a halo of surrounding cells. The
+    result of a tile cell is exact once its distance is no more than the halo width, since any source outside the halo
+    is farther away. The other (far) cells, e.g. in areas without streams, are looked up among the boundary sources of
+    the whole grid (see boundary_sources), gathered in one extra pass the first time a tile has far cells. Memory is
+    therefore bounded by one tile with its halo plus the boundary sources, however far the cells are from a source.
+    Where several sources are equally near, a far cell may be allocated another of them than a whole-raster transform.
+
+    If max_memory_mb is set, raises MemoryError rather than exceeding it.
+
+    '''
+
+    if halo is None:
+        halo = max(tile_size // 4, 1)
+
+    max_bytes = None
+    if max_memory_mb is not None:
+        tile_bytes = (tile_size + 2 * halo)**2 * TILE_BYTES_PER_CELL + FAR_CHUNK_CELLS * 48
+        max_bytes = max_memory_mb * 1024**2 - tile_bytes
+        if max_bytes < 0:
+            raise MemoryError('Distance transform tiles of {} cells with a {} cell halo need about {:.0f} MB, more than the {} MB limit'.format(tile_size, halo, tile_bytes / 1024**2, max_memory_mb))
+
+    far_sources, far_sources_read = None, False
+    for window in tile_windows(height, width, tile_size):
+        row_start, col_start = max(window.row_off - halo, 0), max(window.col_off - halo, 0)
+        row_stop = min(window.row_off + window.height + halo, height)
+        col_stop = min(window.col_off + window.width + halo, width)
+
+        sources, values = read_window(Window(col_start, row_start, col_stop - col_start, row_stop - row_start))
+        distance, allocated = euclidean_allocation(sources, values, sampling)
+
+        core = (slice(window.row_off - row_start, window.row_off - row_start + window.height), slice(window.col_off - col_start, window.col_off - col_start + window.width))
+        distance, allocated = distance[core].copy(), allocated[core].copy()
+
+        # NaN distances mean there is no source within the halo
+        far = ~(distance <= halo * min(sampling))
+        if far.any():
+            if not far_sources_read:
+                far_sources, far_sources_read = boundary_sources(read_window, height, width, tile_size, sampling, max_bytes), True
+
+            if far_sources is not None:
+                resolve_far_cells(far_sources, far, distance, allocated, window.row_off, window.col_off, sampling)
+
+        yield window, distance, allocated
+
+
+if __name__ == '__main__':
+
+    #Parse arguments
+    parser = argparse.ArgumentParser(description = 'Euclidean proximity and allocation rasters (native r.grow.distance)')
+    parser.add_argument('-i', '--in_raster', help = 'raster to compute proximity and allocation for', required = True)
+    parser.add_argument('-p', '--prox_dtype', help = 'Output proximity raster datatype', required = True)
+    parser.add_argument('-a', '--allo_dtype', help = 'Output allocation raster datatype', required = True)
+    parser.add_argument('-t', '--tile_size', help = 'Process in tiles of this many cells (with halos). Default processes the whole raster', required = False, default = None, type = int)
+
+    # Extract to dictionary and assign to variables.
+    args = vars(parser.parse_args())
+
+    # Run grow_distance
+    grow_distance(args['in_raster'], args['prox_dtype'], args['allo_dtype'], args['tile_size'])
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+
+'''
+Description:
+    Shared-filesystem work queue for running HUCs on several nodes. Every node starts a worker pointed at the same
+    outputRunDataDir (e.g. on NFS). Workers claim HUCs through lease files, renew their leases with a heartbeat while
+    the HUC runs and take over HUCs whose lease has expired. Completed HUCs are recorded so that a restarted run
+    resumes where it stopped. No broker is needed: all coordination uses link(), rename() and mtimes, which are
+    atomic on POSIX filesystems and NFS.
+
+    Each lease holds its owner and a unique token. A lease is only ever replaced (taken over) or removed (released)
+    by the worker that first links its retired marker, so a worker acting on a stale view of a lease cannot replace
+    the lease that took it over.
+
+    <outputRunDataDir>/work_queue/
+        hucs.lst            HUCs of the run (written once by the first worker)
+        leases/<item>       lease held by a worker; mtime is the heartbeat
+        retired/<item>.<id> marker of a lease that was taken over or released
+        done/<huc>          completion marker with the exit status
+        done/_finalize      HUCs covered by the last completed post-processing
+        failed/<huc>        failure marker with the exit status
+        abandoned/          partial HUC directories of attempts whose lease was taken over
+'''
+
+import os
+import sys
+import time
+import uuid
+import socket
+import hashlib
+import argparse
+import signal
+import threading
+import subprocess
+
+QUEUE_DIRNAME = 'work_queue'
+FINALIZE_ITEM = '_finalize'
+
+
+class HucWorkQueue(object):
+    '''File based HUC work queue rooted in a run's output directory.'''
+
+    def __init__(self, output_run_dir, lease_timeout=600, heartbeat_interval=60):
+
+        self.output_run_dir = output_run_dir
+        self.queue_dir = os.path.join(output_run_dir, QUEUE_DIRNAME)
+        self.lease_dir = os.path.join(self.queue_dir, 'leases')
+        self.retired_dir = os.path.join(self.queue_dir, 'retired')
+        self.done_dir = os.path.join(self.queue_dir, 'done')
+        self.failed_dir = os.path.join(self.queue_dir, 'failed')
+        self.abandoned_dir = os.path.join(self.queue_dir, 'abandoned')
+        self.huc_list_fileName = os.path.join(self.queue_dir, 'hucs.lst')
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = '{}.{}'.format(socket.gethostname(), os.getpid())
+
+        for directory in (self.lease_dir, self.retired_dir, self.done_dir, self.failed_dir, self.abandoned_dir):
+            os.makedirs(directory, exist_ok=True)
+
+
+    def _write_temp(self, fileName, text):
+        ''' Writes text to a temporary file next to fileName and returns its name '''
+
+        temp_fileName = '{}.tmp.{}.{}'.format(fileName, self.worker_id, threading.get_ident())
+        with open(temp_fileName, 'w') as f:
+            f.write(text)
+
+        return(temp_fileName)
+
+
+    def _write_atomic(self, fileName, text):
+        ''' Writes text to a temporary file and renames it into place '''
+
+        os.rename(self._write_temp(fileName, text), fileName)
+
+
+    def initialize(self, hucs):
+        ''' Writes the HUC list of the run. Only the first worker's list is kept. '''
+
+        if os.path.isfile(self.huc_list_fileName):
+            return(self.hucs())
+
+        if not hucs:
+            raise ValueError('Work queue in {} is not initialized. Pass the HUC list.'.format(self.queue_dir))
+
+        temp_fileName = self._write_temp(self.huc_list_fileName, '\n'.join(hucs) + '\n')
+
+        try:
+            os.link(temp_fileName, self.huc_list_fileName)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_fileName)
+
+        return(self.hucs())
+
+
+    def hucs(self):
+
+        with open(self.huc_list_fileName, 'r') as f:
+            return(f.read().split())
+
+
+    def _server_now(self):
+        ''' Current time according to the filesystem clock. Avoids clock skew between nodes when comparing lease mtimes. '''
+
+        clock_fileName = os.path.join(self.lease_dir, '.clock.{}.{}'.format(self.worker_id, threading.get_ident()))
+        with open(clock_fileName, 'w'):
+            pass
+        now = os.stat(clock_fileName).st_mtime
+        os.remove(clock_fileName)
+
+        return(now)
+
+
+    def read_lease(self, item):
+        '''
+        Returns the lease on item and its age in seconds (content and mtime of the same file), or (None, None) if
+        nobody holds it.
+
+        '''
+
+        try:
+            with open(os.path.join(self.lease_dir, item), 'r') as f:
+                lease = f.read().strip()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return(None, None)
+
+        return(lease, self._server_now() - mtime)
+
+
+    def lease_owner(self, item):
+
+        lease, _ = self.read_lease(item)
+
+        return(lease.split()[0] if lease else None)
+
+
+    def _retire(self, item, old_lease, lease):
+        '''
+        Links the retired marker of old_lease. Succeeds for exactly one caller per lease, which is then the only one
+        allowed to replace or remove old_lease.
+
+        '''
+
+        marker_fileName = os.path.join(self.retired_dir, '{}.{}'.format(item, hashlib.sha1(old_lease.encode()).hexdigest()))
+        temp_fileName = self._write_temp(marker_fileName, lease)
+
+        try:
+            os.link(temp_fileName, marker_fileName)
+            retired = True
+        except FileExistsError:
+            # link() on NFS may report failure after succeeding on retransmit, so confirm by content.
+            with open(marker_fileName, 'r') as f:
+                retired = f.read() == lease
+        finally:
+            os.remove(temp_fileName)
+
+        return(retired)
+
+
+    def claim(self, item, owner):
+        '''
+        Tries to acquire the lease on item. A free item is claimed by link(), which fails if another worker created
+        the lease first. An expired lease is taken over by the worker that retires it, which renames its own lease
+        over it.
+
+        Returns
+        -------
+        lease : STR
+            Lease now held by owner (owner and a unique token), or None.
+
+        '''
+
+        lease_fileName = os.path.join(self.lease_dir, item)
+        lease = '{} {}'.format(owner, uuid.uuid4().hex)
+
+        current_lease, lease_age = self.read_lease(item)
+
+        if current_lease is None:
+            temp_fileName = self._write_temp(lease_fileName, lease)
+            try:
+                os.link(temp_fileName, lease_fileName)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temp_fileName)
+
+        elif lease_age > self.lease_timeout and self._retire(item, current_lease, lease):
+            # Nobody else can change the lease file while current_lease is retired by us.
+            self._write_atomic(lease_fileName, lease)
+            print('Lease on {} expired {:.0f} sec ago. Re-queued.'.format(item, lease_age), flush=True)
+
+        # Confirm by content (also covers link() reporting failure after succeeding on NFS retransmit).
+        return(lease if self.read_lease(item)[0] == lease else None)
+
+
+    def renew(self, item, lease):
+        ''' Heartbeat. Returns False if the lease was lost. '''
+
+        if self.read_lease(item)[0] != lease:
+            return(False)
+
+        try:
+            os.utime(os.path.join(self.lease_dir, item), None)
+        except FileNotFoundError:
+            return(False)
+
+        return(True)
+
+
+    def release(self, item, lease):
+
+        if self.read_lease(item)[0] == lease and self._retire(item, lease, lease):
+            try:
+                os.remove(os.path.join(self.lease_dir, item))
+            except FileNotFoundError:
+                pass
+
+
+    def is_done(self, huc):
+
+        return(os.path.isfile(os.path.join(self.done_dir, huc)))
+
+
+    def is_failed(self, huc):
+
+        return(os.path.isfile(os.path.join(self.failed_dir, huc)))
+
+
+    def mark(self, huc, exit_status, owner):
+
+        status_dir = self.done_dir if exit_status == 0 else self.failed_dir
+        self._write_atomic(os.path.join(status_dir, huc), '{} {} {}\n'.format(exit_status, owner, time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())))
+
+
+    def status(self):
+
+        hucs = self.hucs()
+        done = [h for h in hucs if self.is_done(h)]
+        failed = [h for h in hucs if self.is_failed(h) and not self.is_done(h)]
+        running = [h for h in hucs if h not in done and self.lease_owner(h) is not None]
+
+        return({'total' : len(hucs), 'done' : len(done), 'failed' : len(failed), 'running' : len(running),
+                'pending' : len(hucs) - len(done) - len(failed) - len(running)})
+
+
+    def done_signature(self):
+        ''' Identifies the set of done HUCs, to tell whether post-processing has already covered them '''
+
+        done = sorted(h for h in self.hucs() if self.is_done(h))
+
+        return('{} {}'.format(len(done), hashlib.sha1('\n'.join(done).encode()).hexdigest()))
+
+
+    def finalized_signature(self):
+
+        try:
+            with open(os.path.join(self.done_dir, FINALIZE_ITEM), 'r') as f:
+                return(f.read().strip())
+        except FileNotFoundError:
+            return(None)
+
+
+    def mark_finalized(self, signature):
+
+        self._write_atomic(os.path.join(self.done_dir, FINALIZE_ITEM), signature + '\n')
+
+
+def _heartbeat(queue, item, lease, stop_event, lost_event):
+
+    while not stop_event.wait(queue.heartbeat_interval):
+        if not queue.renew(item, lease):
+            print('Lost lease on {}'.format(item), flush=True)
+            lost_event.set()
+            return
+
+
+def run_leased(queue, item, lease, command):
+    '''
+    Runs command while renewing the lease on item. The command is stopped if the lease is lost.
+
+    Returns
+    -------
+    exit_status : INT
+        Exit status of command, or None if the lease was lost.
+
+    '''
+
+    stop_event, lost_event = threading.Event(), threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(queue, item, lease, stop_event, lost_event), daemon=True)
+    heartbeat.start()
+
+    try:
+        # New session so the whole process group (time, tee, mpiexec...) can be stopped.
+        process = subprocess.Popen(command, start_new_session=True)
+        while process.poll() is None:
+            if lost_event.wait(1):
+                # Another worker has taken over this item.
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait()
+                return(None)
+        exit_status = process.returncode
+    finally:
+        stop_event.set()
+        heartbeat.join()
+
+    if lost_event.is_set():
+        return(None)
+
+    return(exit_status)
+
+
+def run_huc(queue, huc, lease, command):
+    '''
+    Runs command for one HUC while renewing its lease. A HUC directory left by an earlier attempt whose lease was
+    taken over is moved to work_queue/abandoned since run_by_unit.sh expects to create it, unless the run is resumed
+    (resume=1) in which case the completed steps of that attempt are kept. It is not deleted: the worker of that
+    attempt may still be running until its next heartbeat finds the lease lost.
+
+    '''
+
+    huc_dir = os.path.join(queue.output_run_dir, huc)
+    if os.path.isdir(huc_dir) and os.environ.get('resume') != '1':
+        abandoned_dir = os.path.join(queue.abandoned_dir, '{}.{}'.format(huc, lease.split()[1]))
+        print('Moving partial outputs of a previous attempt at {} to {}'.format(huc, abandoned_dir), flush=True)
+        os.rename(huc_dir, abandoned_dir)
+
+    exit_status = run_leased(queue, huc, lease, command + [huc])
+
+    # The lease may have been taken over after the last heartbeat. The new owner records the outcome.
+    if exit_status is None or queue.read_lease(huc)[0] != lease:
+        return(None)
+
+    queue.mark(huc, exit_status, lease.split()[0])
+    queue.release(huc, lease)
+
+    return(exit_status)
+
+
+def worker_loop(queue, slot, command, retry_failed, poll_interval):
+    '''
+    Claims and runs HUCs until every HUC of the run is done (or failed). While other workers hold the remaining
+    HUCs, waits so that expired leases can be taken over.
+
+    '''
+
+    owner = '{}.{}'.format(queue.worker_id, slot)
+
+    while True:
+        remaining = [h for h in queue.hucs() if not queue.is_done(h) and (retry_failed or not queue.is_failed(h))]
+        if not remaining:
+            return
+
+        ran_one = False
+        for huc in remaining:
+            if queue.is_done(huc):
+                continue
+
+            lease = queue.claim(huc, owner)
+            if lease is None:
+                continue
+
+            # The HUC may have completed between listing and claiming.
+            if queue.is_done(huc):
+                queue.release(huc, lease)
+                continue
+
+            print('{} running {}'.format(owner, huc), flush=True)
+            exit_status = run_huc(queue, huc, lease, command)
+            print('{} finished {} with exit status {}'.format(owner, huc, exit_status), flush=True)
+            ran_one = True
+            break
+
+        if not ran_one:
+            time.sleep(poll_interval)
+
+
+def huc_work_queue(output_run_dir, hucs, command, number_of_jobs=1, lease_timeout=600, heartbeat_interval=60, retry_failed=False, poll_interval=30):
+    '''
+    Starts a worker on this node with number_of_jobs concurrent HUC slots.
+
+    Parameters
+    ----------
+    output_run_dir : STR
+        Run output directory shared by all nodes (outputRunDataDir).
+    hucs : LIST
+        HUCs of the run. Ignored if another worker already initialized the queue.
+    command : LIST
+        Command run per HUC. The HUC is appended as the last argument.
+    number_of_jobs : INT
+        Number of HUCs this worker runs concurrently.
+    lease_timeout : INT
+        Seconds without a heartbeat after which a lease is considered expired and the HUC is re-queued.
+    heartbeat_interval : INT
+        Seconds between lease renewals. Must be well below lease_timeout.
+    retry_failed : BOOL
+        If True, HUCs recorded as failed are run again.
+    poll_interval : INT
+        Seconds to wait before looking for expired leases when all remaining HUCs are claimed.
+
+    Returns
+    -------
+    status : DICT
+        Counts of done, failed, running and pending HUCs.
+
+    '''
+
+    if heartbeat_interval >= lease_timeout:
+        raise ValueError('Heartbeat interval ({}) must be less than the lease timeout ({})'.format(heartbeat_interval, lease_timeout))
+
+    queue = HucWorkQueue(output_run_dir, lease_timeout, heartbeat_interval)
+    queue.initialize(hucs)
+
+    if retry_failed:
+        for huc in os.listdir(queue.failed_dir):
+            os.remove(os.path.join(queue.failed_dir, huc))
+
+    slots = [threading.Thread(target=worker_loop, args=(queue, slot, command, retry_failed, poll_interval)) for slot in range(number_of_jobs)]
+    for slot in slots:
+        slot.start()
+    for slot in slots:
+        slot.join()
+
+    status = queue.status()
+    print('Work queue status: {}'.format(status), flush=True)
+
+    return(status)
+
+
+def finalize(output_run_dir, command, lease_timeout=600, heartbeat_interval=60):
+    '''
+    Runs post-processing (e.g. viz aggregation) on one caller once all HUCs are done or failed. It runs under an
+    ordinary lease, so it is taken over if the finalizing node dies, and it is recorded as done for the set of done
+    HUCs it covered: it runs again if more HUCs complete later (e.g. after retry_failed), and is repeated by the
+    finalizing caller itself if HUCs complete while it runs.
+
+    Returns
+    -------
+    exit_status : INT
+        Exit status of command, or 0 if there was nothing to do here (HUCs still running, already finalized or
+        being finalized by another caller).
+
+    '''
+
+    queue = HucWorkQueue(output_run_dir, lease_timeout, heartbeat_interval)
+    owner = '{}.finalize'.format(queue.worker_id)
+
+    while True:
+        status = queue.status()
+        if status['done'] + status['failed'] < status['total']:
+            return(0)
+
+        signature = queue.done_signature()
+        if queue.finalized_signature() == signature:
+            return(0)
+
+        lease = queue.claim(FINALIZE_ITEM, owner)
+        if lease is None:
+            return(0)
+
+        exit_status = run_leased(queue, FINALIZE_ITEM, lease, command)
+        if exit_status is None:
+            return(0)
+
+        if exit_status == 0:
+            queue.mark_finalized(signature)
+        queue.release(FINALIZE_ITEM, lease)
+
+        if exit_status != 0:
+            return(exit_status)
+
+
+def read_hucs(hucs):
+    ''' Accepts a list of HUCs or a single line-delimited HUC list file '''
+
+    if len(hucs) == 1 and os.path.isfile(hucs[0]):
+        with open(hucs[0], 'r') as f:
+            return(f.read().split())
+
+    return([h for huc in hucs for h in huc.split()])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run HUCs from a work queue shared by several nodes through the output directory')
+    parser.add_argument('-d', '--output-run-dir', help='Run output directory on the shared filesystem', required=True)
+    parser.add_argument('-u', '--hucs', help='HUCs or line-delimited HUC file. Only used by the first worker of a run.', required=False, nargs='+', default=[])
+    parser.add_argument('-c', '--command', help='Command to run per HUC. Default is $srcDir/time_and_tee_run_by_unit.sh', required=False, default=None)
+    parser.add_argument('-j', '--number-of-jobs', help='Number of HUCs run concurrently by this worker. Default is 1.', required=False, default=1, type=int)
+    parser.add_argument('-l', '--lease-timeout', help='Seconds without heartbeat before a HUC is re-queued. Default is 600.', required=False, default=600, type=int)
+    parser.add_argument('-b', '--heartbeat-interval', help='Seconds between lease renewals. Default is 60.', required=False, default=60, type=int)
+    parser.add_argument('-p', '--poll-interval', help='Seconds between checks for expired leases. Default is 30.', required=False, default=30, type=int)
+    parser.add_argument('-r', '--retry-failed', help='Run HUCs recorded as failed again', action='store_true')
+    parser.add_argument('-f', '--finalize', help='Post-processing command to run on one node once all HUCs have finished (instead of running HUCs)', required=False, default=None)
+
+    args = vars(parser.parse_args())
+
+    if args['finalize'] is not None:
+        sys.exit(finalize(args['output_run_dir'], args['finalize'].split(), args['lease_timeout'], args['heartbeat_interval']))
+
+    command = args['command']
+    if command is None:
+        command = os.path.join(os.environ['srcDir'], 'time_and_tee_run_by_unit.sh')
+
+    status = huc_work_queue(args['output_run_dir'], read_hucs(args['hucs']), command.split(), args['number_of_jobs'],
+                            args['lease_timeout'], args['heartbeat_interval'], args['retry_failed'], args['poll_interval'])
+
+    sys.exit(0 if status['failed'] == 0 else 1)
@@ -31,6 +31,7 @@ def output_cleanup(huc_number, output_folder_path, additional_whitelist, is_prod
         'gw_catchments_reaches_filtered_addedAttributes.tif',
         'hydroTable.csv',
         'src.json',
+        'src.npz',
         'small_segments.csv',
         'bathy_crosswalk_calcs.csv',
         'bathy_stream_order_calcs.csv',
@@ -49,6 +50,7 @@ def output_cleanup(huc_number, output_folder_path, additional_whitelist, is_prod
         'gw_catchments_reaches_filtered_addedAttributes.tif',
         'hydroTable.csv',
         'src.json',
+        'src.npz',
         'small_segments.csv'
     ]
 
@@ -70,7 +72,8 @@ def whitelist_directory(directory_path, whitelist, additional_whitelist):
     directory = os.fsencode(directory_path)
     for file in os.listdir(directory_path):
         filename = os.fsdecode(file)
-        if filename not in whitelist:
+        # directories (e.g. the .steps completion markers of resumable runs) are kept
+        if filename not in whitelist and not os.path.isdir(os.path.join(directory_path, filename)):
             os.remove(os.path.join(directory_path, filename))
 
 
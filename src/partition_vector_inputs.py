@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from os.path import splitext, basename
+from concurrent.futures import ProcessPoolExecutor
+
+PARTITION_FID = 'partition_fid'
+INDEX_FILENAME = 'partition_index.csv'
+SCHEMA_FILENAME = 'schema.gpkg'
+
+
+def morton_order(bounds, bits=16):
+    ''' Returns the order sorting features along a Z-order curve of their bounding box centers '''
+
+    x = (bounds[:,0] + bounds[:,2]) / 2
+    y = (bounds[:,1] + bounds[:,3]) / 2
+
+    scale = 2**bits - 1
+    x = ((x - x.min()) / max(x.max() - x.min(), 1e-9) * scale).astype(np.uint64)
+    y = ((y - y.min()) / max(y.max() - y.min(), 1e-9) * scale).astype(np.uint64)
+
+    codes = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(bits):
+        codes |= ((x >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2*bit)
+        codes |= ((y >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2*bit + 1)
+
+    return(np.argsort(codes, kind='stable'))
+
+
+def partition_layer(vector_filename, wbd_filename, output_dir, huc_level=4, margin=10000):
+    '''
+    Splits one national vector layer into one GeoPackage per HUC. A feature is written to every HUC it intersects once
+    the HUC is buffered by margin, so any HUC inside a partition buffered by up to margin only needs that partition.
+
+    Parameters
+    ----------
+    vector_filename : STR
+        National vector layer, e.g. nwm_flows.gpkg.
+    wbd_filename : STR
+        WBD_National.gpkg.
+    output_dir : STR
+        Root of the partitioned store. The layer is written to output_dir/<layer name>.
+    huc_level : INT
+        HUC level of the partitions (4 or 6).
+    margin : FLOAT
+        Distance the HUCs are buffered by before assigning features. Must be at least the wbd_buffer parameter.
+
+    Returns
+    -------
+    index : DataFrame
+        Partition index (HUC, bounding box of the partition features and feature count).
+
+    '''
+
+    layer_name = splitext(basename(vector_filename))[0]
+    layer_dir = os.path.join(output_dir, layer_name)
+    os.makedirs(layer_dir, exist_ok=True)
+
+    print('Partitioning {} by HUC{}'.format(layer_name, huc_level), flush=True)
+
+    huc_field = 'HUC{}'.format(huc_level)
+    hucs = gpd.read_file(wbd_filename, layer='WBDHU{}'.format(huc_level))[[huc_field, 'geometry']]
+    hucs.geometry = hucs.geometry.buffer(margin)
+
+    features = gpd.read_file(vector_filename)
+    features[PARTITION_FID] = np.arange(len(features))
+    if hucs.crs != features.crs:
+        hucs = hucs.to_crs(features.crs)
+
+    # one feature is kept to recreate the layer schema for partitions without features
+    features.iloc[:1].to_file(os.path.join(layer_dir, SCHEMA_FILENAME), driver='GPKG', index=False)
+
+    valid = features.loc[~(features.geometry.isna() | features.geometry.is_empty), [PARTITION_FID, 'geometry']]
+    joined = gpd.sjoin(valid, hucs, how='inner', op='intersects')
+    partition_groups = joined.groupby(huc_field).groups
+
+    records = []
+    for huc in sorted(hucs[huc_field].unique()):
+        if huc not in partition_groups:
+            records.append({'huc' : huc, 'minx' : np.nan, 'miny' : np.nan, 'maxx' : np.nan, 'maxy' : np.nan, 'feature_count' : 0, 'margin' : margin})
+            continue
+
+        partition = features.loc[np.unique(partition_groups[huc])]
+        partition = partition.iloc[morton_order(partition.geometry.bounds.to_numpy())]
+
+        # written under a temporary name so readers never open a partial partition
+        partition_filename = os.path.join(layer_dir, '{}.gpkg'.format(huc))
+        temp_filename = os.path.join(layer_dir, '{}_tmp.gpkg'.format(huc))
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        partition.to_file(temp_filename, driver='GPKG', index=False)
+        os.replace(temp_filename, partition_filename)
+
+        minx, miny, maxx, maxy = partition.total_bounds
+        records.append({'huc' : huc, 'minx' : minx, 'miny' : miny, 'maxx' : maxx, 'maxy' : maxy, 'feature_count' : len(partition), 'margin' : margin})
+
+    index = pd.DataFrame(records)
+    index.to_csv(os.path.join(layer_dir, INDEX_FILENAME), index=False)
+
+    return(index)
+
+
+def has_partitions(partition_dir, vector_filename):
+    ''' True if the partitioned store holds the layer of vector_filename '''
+
+    if partition_dir is None:
+        return(False)
+
+    layer_name = splitext(basename(vector_filename))[0]
+    return(os.path.isfile(os.path.join(partition_dir, layer_name, INDEX_FILENAME)))
+
+
+def read_partitioned_vector(partition_dir, vector_filename, mask, huc_code, mask_distance):
+    '''
+    Reads the features of a national layer intersecting mask from its partitions. Same result as
+    gpd.read_file(vector_filename, mask=mask), with rows in the national layer order.
+
+    Parameters
+    ----------
+    partition_dir : STR
+        Root of the partitioned store.
+    vector_filename : STR
+        National vector layer. Its basename selects the partitioned layer.
+    mask : GeoDataFrame
+        Buffered WBD.
+    huc_code : STR
+        HUC being processed.
+    mask_distance : FLOAT
+        Distance the HUC was buffered by to build mask.
+
+    Returns
+    -------
+    subset : GeoDataFrame
+        Features intersecting mask.
+
+    '''
+
+    layer_dir = os.path.join(partition_dir, splitext(basename(vector_filename))[0])
+    index = pd.read_csv(os.path.join(layer_dir, INDEX_FILENAME), dtype={'huc' : str})
+    schema = gpd.read_file(os.path.join(layer_dir, SCHEMA_FILENAME))
+
+    huc_code = str(huc_code)
+    huc_level = len(index.huc.iloc[0])
+    own_huc = huc_code[:huc_level]
+
+    # a HUC buffered by no more than the partition margin is contained in its own partition
+    if (len(huc_code) >= huc_level) and (mask_distance <= index.margin.iloc[0]) and (own_huc in index.huc.values):
+        selected = index.loc[index.huc == own_huc]
+    else:
+        minx, miny, maxx, maxy = mask.to_crs(schema.crs).total_bounds
+        selected = index.loc[(index.minx <= maxx) & (index.maxx >= minx) & (index.miny <= maxy) & (index.maxy >= miny)]
+
+    selected = selected.loc[selected.feature_count > 0]
+
+    partitions = [gpd.read_file(os.path.join(layer_dir, '{}.gpkg'.format(huc)), mask=mask) for huc in selected.huc]
+    partitions = [partition for partition in partitions if not partition.empty]
+
+    if partitions:
+        subset = pd.concat(partitions, ignore_index=True)
+        subset = subset.drop_duplicates(PARTITION_FID).sort_values(PARTITION_FID)
+    else:
+        subset = schema.iloc[0:0]
+
+    subset = gpd.GeoDataFrame(subset.drop(columns=PARTITION_FID).reset_index(drop=True), geometry='geometry', crs=schema.crs)
+
+    return(subset)
+
+
+def read_vector_subset(vector_filename, mask, huc_code, mask_distance, partition_dir=None):
+    ''' Reads the features of vector_filename intersecting mask, from the partitioned store when it holds the layer '''
+
+    if has_partitions(partition_dir, vector_filename):
+        return(read_partitioned_vector(partition_dir, vector_filename, mask, huc_code, mask_distance))
+
+    return(gpd.read_file(vector_filename, mask=mask))
+
+
+def partition_vector_inputs(vector_filenames, wbd_filename, output_dir, huc_level=4, margin=10000, number_of_jobs=1):
+    ''' Partitions each national vector layer by HUC (see partition_layer) '''
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=number_of_jobs) as executor:
+        futures = [executor.submit(partition_layer, vector_filename, wbd_filename, output_dir, huc_level, margin) for vector_filename in vector_filenames]
+        for future in futures:
+            future.result()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Partition national vector inputs by HUC4/HUC6 so each HUC only reads the partitions it needs')
+    parser.add_argument('-v','--vectors', help='National vector layers to partition', required=True, nargs='+')
+    parser.add_argument('-w','--wbd', help='WBD_National.gpkg', required=True)
+    parser.add_argument('-o','--output-dir', help='Output directory of the partitioned store', required=True)
+    parser.add_argument('-l','--huc-level', help='HUC level of the partitions (4 or 6). Default is 4', required=False, default=4, type=int)
+    parser.add_argument('-m','--margin', help='Distance HUCs are buffered by before assigning features. Must be at least wbd_buffer. Default is 10000', required=False, default=10000, type=float)
+    parser.add_argument('-j','--number-of-jobs', help='Number of layers to partition concurrently', required=False, default=1, type=int)
+
+    args = vars(parser.parse_args())
+
+    partition_vector_inputs(args['vectors'], args['wbd'], args['output_dir'], args['huc_level'], args['margin'], args['number_of_jobs'])
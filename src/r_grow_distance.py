@@ -4,6 +4,7 @@ import os
 import shutil 
 import grass.script as gscript
 import argparse
+from utils.shared_functions import intermediate_raster_creation_options
 
 def r_grow_distance(input_raster, grass_workspace, proximity_dtype, allocation_dtype):
     '''
@@ -58,17 +59,20 @@ def r_grow_distance(input_raster, grass_workspace, proximity_dtype, allocation_d
     allocation_grass_name = 'allocation@'+ grass_mapset
     gscript.run_command('r.grow.distance', flags = 'm', input = imported_grass_raster, distance = proximity_grass_name, value = allocation_grass_name, quiet = True)
     
+    # Intermediate codec (see intermediate_compress in the params file).
+    createopt = ','.join(intermediate_raster_creation_options())
+
     # Export proximity raster. Saved to same directory as input raster. 
     # Dtype for proximity always float32.
     proximity_filename = input_raster_name + '_dist.tif'
     output_proximity_path=os.path.join(input_raster_directory,proximity_filename)
-    gscript.run_command('r.out.gdal', flags = 'cf', input = proximity_grass_name, output = output_proximity_path, format = 'GTiff', quiet = True, type = proximity_dtype, createopt = 'COMPRESS=LZW')
+    gscript.run_command('r.out.gdal', flags = 'cf', input = proximity_grass_name, output = output_proximity_path, format = 'GTiff', quiet = True, type = proximity_dtype, createopt = createopt)
 
     # Export allocation raster. Saved to same directory as input raster. 
     # Dtype assigned via the allocation_dtype input.
     allocation_filename = input_raster_name + '_allo.tif'
     output_allocation_path = os.path.join(input_raster_directory, allocation_filename)
-    gscript.run_command('r.out.gdal', flags = 'cf', input = allocation_grass_name, output = output_allocation_path, format = 'GTiff', quiet = True, type = allocation_dtype, createopt = 'COMPRESS=LZW')
+    gscript.run_command('r.out.gdal', flags = 'cf', input = allocation_grass_name, output = output_allocation_path, format = 'GTiff', quiet = True, type = allocation_dtype, createopt = createopt)
     
     # Close down temporary session and remove temporary workspace.
     temporary_session.close()
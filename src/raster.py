@@ -84,6 +84,8 @@ class Raster:
 	--------
 	Load Raster
 	>>> rasterData = fldpln.Raster('path/to/raster')
+	Read the array on first access only
+	>>> rasterData = fldpln.Raster('path/to/raster',loadArray=False)
 
 	"""
 
@@ -114,6 +116,8 @@ class Raster:
 		----------
 		fileName : str
 			File path to single band raster
+		loadArray : Boolean, optional
+			Read the array on initialization. If False the array is read on first access of the array attribute (Default Value = True)
 		dtype : numpy datatype or int, optional
 			Numpy, GDT, or integer code data type used to override the data type on the file when imported to array (Default Value = None, None sets to the numpy array data type to the one in the raster file)
 
@@ -132,9 +136,6 @@ class Raster:
 		self.nrows,self.ncols = stream.RasterYSize , stream.RasterXSize
 		self.nbands = stream.RasterCount
 
-		if loadArray:
-			self.array = stream.ReadAsArray()
-
 		self.gt = stream.GetGeoTransform()
 		self.proj = stream.GetProjection()
 
@@ -146,6 +147,7 @@ class Raster:
 		self.ndv = band.GetNoDataValue()
 
 		# set data type
+		self._arrayDtype = None
 		if dtype is not None: # override raster file type
 
 			# sets dt to dtype integer code
@@ -157,12 +159,12 @@ class Raster:
 			# sets array data type
 			if isinstance(dtype,type): # if dtype is a numpy data tpe
 
-				self.array = self.array.astype(dtype)
+				self._arrayDtype = dtype
 
 			else: # if dtype is an integer code of GDAL GDT variable
 
 				try:
-					self.array = self.array.astype(self.dataTypeConversion_integer_to_name[dtype])
+					self._arrayDtype = self.dataTypeConversion_integer_to_name[dtype]
 				except KeyError:
 					raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from raster'.format(dtype))
 
@@ -170,9 +172,7 @@ class Raster:
 
 			self.dt = band.DataType
 
-			try:
-				self.array.astype(self.dataTypeConversion_integer_to_name[self.dt])
-			except KeyError:
+			if self.dt not in self.dataTypeConversion_integer_to_name:
 				raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from raster'.format(self.dt))
 
 		try:
@@ -190,6 +190,42 @@ class Raster:
 
 		stream,band = None,None
 
+		if loadArray:
+			self._loadArray()
+
+
+	@property
+	def array(self):
+		""" Raster data. Read on first access when the raster was initialized with loadArray=False """
+
+		if not hasattr(self,'_array'):
+			self._loadArray()
+
+		return(self._array)
+
+
+	@array.setter
+	def array(self,array):
+		self._array = array
+
+
+	@property
+	def isLoaded(self):
+		""" True once the array has been read or assigned """
+		return(hasattr(self,'_array'))
+
+
+	def _loadArray(self):
+
+		stream = gdal.Open(self.fileName,gdal.GA_ReadOnly)
+		array = stream.ReadAsArray()
+		stream = None
+
+		if self._arrayDtype is not None:
+			array = array.astype(self._arrayDtype)
+
+		self._array = array
+
 
 	@property
 	def dim(self):
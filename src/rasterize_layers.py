@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+from concurrent.futures import ThreadPoolExecutor
+from utils.shared_functions import intermediate_raster_profile
+
+
+def parse_layer_spec(spec_string):
+    '''
+    Parses a layer specification string of comma separated key=value pairs. For example: "vector=flows.gpkg,output=flows.tif,burn=1,dtype=int32,init=0".
+
+    Parameters
+    ----------
+    spec_string : STR
+        Layer specification. Accepted keys are vector, output, layer, attribute, burn, dtype, nodata, init and all_touched. burn=z burns the interpolated z value of lines into every cell they touch (same as gdal_rasterize -3d -at).
+
+    Returns
+    -------
+    spec : DICT
+        Dictionary of the layer specification.
+
+    '''
+
+    spec = {'layer' : None, 'attribute' : None, 'burn' : None, 'dtype' : 'int32', 'nodata' : None, 'init' : None, 'all_touched' : False}
+
+    for item in spec_string.split(','):
+        key, _, value = item.partition('=')
+        key = key.strip()
+
+        if key not in spec and key not in ('vector', 'output'):
+            raise ValueError('{} is not a valid layer specification key'.format(key))
+
+        if key == 'all_touched':
+            spec[key] = value.strip().lower() in ('', 'true', 'yes', '1')
+        else:
+            spec[key] = value.strip()
+
+    if ('vector' not in spec) or ('output' not in spec):
+        raise ValueError('Layer specification requires vector and output keys: {}'.format(spec_string))
+
+    if (spec['attribute'] is None) == (spec['burn'] is None):
+        raise ValueError('Layer specification requires exactly one of attribute or burn: {}'.format(spec_string))
+
+    return(spec)
+
+
+def clip_to_dtype(value, dtype):
+    ''' Clips a burn, init or nodata value to the range of dtype (matches GDAL casting of out of range values) '''
+
+    if value is None:
+        return(None)
+
+    value = float(value)
+
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        info = np.iinfo(dtype)
+        value = int(np.clip(value, info.min, info.max))
+
+    return(value)
+
+
+def line_cells(geometries, transform):
+    '''
+    Returns the rows, columns and z values of the cells touched by 3D lines, as gdal_rasterize -3d -at burns them: every cell a segment passes through (corners included) gets the z value interpolated at the middle of the part of the segment inside the cell. Where lines cross, the cell keeps the value of the last segment drawn.
+
+    '''
+
+    starts, ends = [], []
+    for geometry in geometries:
+        if geometry is None or geometry.is_empty:
+            continue
+
+        lines = getattr(geometry, 'geoms', [geometry])
+        for line in lines:
+            coords = np.asarray(line.coords)
+            if coords.shape[0] < 2 or coords.shape[1] < 3:
+                continue
+
+            starts.append(coords[:-1, :3])
+            ends.append(coords[1:, :3])
+
+    if not starts:
+        return(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+
+    start, end = np.concatenate(starts), np.concatenate(ends)
+    number_of_segments = len(start)
+
+    # segments in (fractional) pixel coordinates
+    start_cols, start_rows = ~transform * (start[:, 0], start[:, 1])
+    end_cols, end_rows = ~transform * (end[:, 0], end[:, 1])
+
+    # positions (0 to 1) along each segment of its ends and of every column and row boundary it crosses
+    positions = [np.zeros(number_of_segments), np.ones(number_of_segments)]
+    segment_ids = [np.arange(number_of_segments), np.arange(number_of_segments)]
+    for first, last in ((start_cols, end_cols), (start_rows, end_rows)):
+        first_cell, last_cell = np.floor(first), np.floor(last)
+        crossings = np.abs(last_cell - first_cell).astype(np.int64)
+        segment = np.repeat(np.arange(number_of_segments), crossings)
+        step = np.arange(crossings.sum()) - np.repeat(np.cumsum(crossings) - crossings, crossings)
+        boundary = np.where(last[segment] > first[segment], first_cell[segment] + 1 + step, first_cell[segment] - step)
+        positions.append((boundary - first[segment]) / (last[segment] - first[segment]))
+        segment_ids.append(segment)
+
+    positions, segment_ids = np.concatenate(positions), np.concatenate(segment_ids)
+    order = np.lexsort((positions, segment_ids))
+    positions, segment_ids = positions[order], segment_ids[order]
+
+    # each stretch between consecutive positions of a segment lies in one cell
+    stretch = (segment_ids[1:] == segment_ids[:-1]) & (positions[1:] > positions[:-1])
+    segment = segment_ids[:-1][stretch]
+    middle = (positions[:-1][stretch] + positions[1:][stretch]) / 2
+
+    cols = np.floor(start_cols[segment] + middle * (end_cols - start_cols)[segment]).astype(np.int64)
+    rows = np.floor(start_rows[segment] + middle * (end_rows - start_rows)[segment]).astype(np.int64)
+    z = start[segment, 2] + middle * (end[segment, 2] - start[segment, 2])
+
+    return(rows, cols, z)
+
+
+def build_shapes(spec, vector_cache):
+    ''' Builds the (geometry, value) pairs and spatial index for a layer specification '''
+
+    features = vector_cache[(spec['vector'], spec['layer'])]
+
+    if spec['attribute'] is not None:
+        values = features[spec['attribute']].to_numpy()
+    else:
+        values = np.full(len(features), clip_to_dtype(spec['burn'], spec['dtype']))
+
+    valid = ~(features.geometry.isna() | features.geometry.is_empty).to_numpy()
+    geometries = features.geometry[valid].reset_index(drop=True)
+    shapes = list(zip(geometries, values[valid]))
+
+    sindex = geometries.sindex if len(geometries) > 0 else None
+
+    return(shapes, sindex)
+
+
+def build_cells(spec, vector_cache, profile, windows):
+    '''
+    Builds the touched cells and z values of a burn=z layer (see line_cells), keeping the last value of each cell, and groups them by block. Returns the cells sorted by block and, for each window, the slice of its cells.
+
+    '''
+
+    features = vector_cache[(spec['vector'], spec['layer'])]
+    rows, cols, z = line_cells(features.geometry, profile['transform'])
+
+    inside = (rows >= 0) & (rows < profile['height']) & (cols >= 0) & (cols < profile['width'])
+    rows, cols, z = rows[inside], cols[inside], z[inside]
+
+    # last value drawn in each cell
+    _, last = np.unique((rows * profile['width'] + cols)[::-1], return_index=True)
+    last = len(rows) - 1 - last
+    rows, cols, z = rows[last], cols[last], z[last]
+
+    block_height, block_width = windows[0].height, windows[0].width
+    blocks_per_row = -(-profile['width'] // block_width)
+    block_ids = (rows // block_height) * blocks_per_row + (cols // block_width)
+    order = np.argsort(block_ids, kind='stable')
+    rows, cols, z, block_ids = rows[order], cols[order], z[order], block_ids[order]
+
+    window_ids = np.array([(window.row_off // block_height) * blocks_per_row + (window.col_off // block_width) for window in windows], dtype=np.int64)
+    bounds = zip(np.searchsorted(block_ids, window_ids, side='left'), np.searchsorted(block_ids, window_ids, side='right'))
+
+    return(rows, cols, z, [slice(lower, upper) for lower, upper in bounds])
+
+
+def rasterize_layer(spec, profile, windows, vector_cache):
+    '''
+    Rasterizes one layer specification block by block onto the shared grid. Only the features whose bounding boxes intersect a block are burned into it.
+
+    '''
+
+    dtype = spec['dtype']
+    nodata = clip_to_dtype(spec['nodata'], dtype)
+    init = clip_to_dtype(spec['init'], dtype)
+    if init is None:
+        init = nodata if nodata is not None else 0
+
+    burn_z = spec['burn'] is not None and spec['burn'].lower() == 'z'
+    if burn_z:
+        rows, cols, z, block_cells = build_cells(spec, vector_cache, profile, windows)
+    else:
+        shapes, sindex = build_shapes(spec, vector_cache)
+
+    layer_profile = profile.copy()
+    layer_profile.update(dtype = dtype, nodata = nodata)
+
+    with rasterio.open(spec['output'], 'w', **layer_profile) as raster:
+        for window_index, window in enumerate(windows):
+            block = np.full((window.height, window.width), init, dtype = dtype)
+
+            if burn_z:
+                cells = block_cells[window_index]
+                block[rows[cells] - window.row_off, cols[cells] - window.col_off] = z[cells]
+            else:
+                # Spatial index query by block extent.
+                block_bounds = window_bounds(window, profile['transform'])
+                if sindex is not None:
+                    block_shapes = [shapes[i] for i in sorted(sindex.intersection(block_bounds))]
+                else:
+                    block_shapes = []
+
+                if block_shapes:
+                    block = rasterize(block_shapes, out = block, transform = window_transform(window, profile['transform']), all_touched = spec['all_touched'], dtype = dtype)
+
+            raster.write(block, indexes = 1, window = window)
+
+    return(spec['output'])
+
+
+def rasterize_layers(template_raster, layer_specs, number_of_jobs=None, blocksize=512, overwrite=False, intermediate=False):
+    '''
+    Rasterizes several vector layers against one shared grid definition. Replaces the sequence of gdal_rasterize calls that each re-scanned the same -te/-ts grid.
+
+    Parameters
+    ----------
+    template_raster : STR
+        Path to the raster defining the grid (extent, resolution and CRS). For example, dem_meters.tif.
+    layer_specs : LIST
+        List of layer specifications (see parse_layer_spec).
+    number_of_jobs : INT
+        Number of layers to rasterize and write concurrently. Defaults to one job per layer.
+    blocksize : INT
+        Block size of the outputs and of the rasterization windows.
+    overwrite : BOOL
+        If False, layers whose output already exists are skipped.
+    intermediate : BOOL
+        If True, outputs are written with the intermediate raster codec instead of LZW.
+
+    Returns
+    -------
+    outputs : LIST
+        Paths of the written rasters.
+
+    '''
+
+    with rasterio.open(template_raster) as template:
+        profile = {'driver' : 'GTiff', 'count' : 1, 'width' : template.width, 'height' : template.height,
+                   'crs' : template.crs, 'transform' : template.transform,
+                   'tiled' : True, 'blockxsize' : blocksize, 'blockysize' : blocksize,
+                   'compress' : 'lzw', 'BIGTIFF' : 'YES'}
+
+    if intermediate:
+        profile.update(intermediate_raster_profile())
+        profile.update(blockxsize = blocksize, blockysize = blocksize)
+
+    windows = [Window(col_off, row_off, min(blocksize, profile['width'] - col_off), min(blocksize, profile['height'] - row_off))
+               for row_off in range(0, profile['height'], blocksize)
+               for col_off in range(0, profile['width'], blocksize)]
+
+    specs_to_run = []
+    for spec in layer_specs:
+        if not os.path.isfile(spec['vector']):
+            print('{} does not exist. Skipping {}'.format(spec['vector'], spec['output']))
+            continue
+        if os.path.isfile(spec['output']) and not overwrite:
+            continue
+        specs_to_run.append(spec)
+
+    # Layers sharing an input vector are only read once.
+    vector_cache = {}
+    for spec in specs_to_run:
+        key = (spec['vector'], spec['layer'])
+        if key not in vector_cache:
+            vector_cache[key] = gpd.read_file(spec['vector'], layer=spec['layer'])
+
+    if not specs_to_run:
+        return([])
+
+    if number_of_jobs is None:
+        number_of_jobs = len(specs_to_run)
+
+    with ThreadPoolExecutor(max_workers = number_of_jobs) as executor:
+        outputs = list(executor.map(lambda spec: rasterize_layer(spec, profile, windows, vector_cache), specs_to_run))
+
+    return(outputs)
+
+
+if __name__ == '__main__':
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description = 'Rasterize multiple vector layers onto a shared grid in one pass')
+    parser.add_argument('-g', '--template-raster', help = 'Raster defining the output grid', required = True)
+    parser.add_argument('-l', '--layer', help = 'Layer specification, e.g. "vector=in.gpkg,output=out.tif,burn=1,dtype=int32,init=0". May be repeated.', required = True, action = 'append')
+    parser.add_argument('-j', '--number-of-jobs', help = 'Number of layers to write concurrently. Default is one job per layer.', required = False, default = None, type = int)
+    parser.add_argument('-b', '--blocksize', help = 'Output block size', required = False, default = 512, type = int)
+    parser.add_argument('-o', '--overwrite', help = 'Overwrite existing outputs', action = 'store_true')
+    parser.add_argument('-i', '--intermediate', help = 'Write outputs with the intermediate raster codec', action = 'store_true')
+
+    # Extract to dictionary and assign to variables.
+    args = vars(parser.parse_args())
+
+    template_raster = args['template_raster']
+    layer_specs = [parse_layer_spec(spec) for spec in args['layer']]
+    number_of_jobs = args['number_of_jobs']
+    blocksize = args['blocksize']
+    overwrite = args['overwrite']
+    intermediate = args['intermediate']
+
+    rasterize_layers(template_raster, layer_specs, number_of_jobs, blocksize, overwrite, intermediate)
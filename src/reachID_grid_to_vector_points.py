@@ -1,85 +1,81 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8
 
-from osgeo import gdal
-import numpy as np
-import osgeo.ogr
-import osgeo.osr
 import sys
-
-import cProfile
-from tqdm import tqdm
+import numpy as np
+import rasterio
 import geopandas as gpd
-from shapely.geometry import Point
-from raster import Raster
 from utils.shared_functions import getDriver
+from utils.tiled_execution import block_windows, map_blocks
 
 """
 USAGE:
 ./reachID_grid_to_vector_points.py <flows_grid_IDs raster file> <flows_points vector file> <reachID or featureID>
 
+Stream pixels can also be used as gages without vectorizing them (see gage_watershed.py -n).
+
 """
 
-path = sys.argv[1]
-outputFileName = sys.argv[2]
-writeOption = sys.argv[3]
 
-#r = gdal.Open(path)
-#band = r.GetRasterBand(1)
-boolean=Raster(path)
+def stream_pixel_cells(stream_raster, number_of_jobs=None):
+    '''
+    Returns the global flat indices and values of the stream pixels (>= 1) in row-major order, reading the raster
+    block by block.
+
+    '''
+
+    with rasterio.open(stream_raster) as streams:
+        width = streams.width
+
+    cells, values = [], []
+    def collect_cells(window, block_cells):
+        rows, cols, block_values = block_cells
+        cells.append((rows + window.row_off).astype(np.int64) * width + cols + window.col_off)
+        values.append(block_values)
+
+    def stream_cells(stream_window):
+        rows, cols = np.nonzero(stream_window >= 1)
+        return(rows, cols, stream_window[rows, cols])
+
+    map_blocks(stream_cells, [stream_raster], block_windows(stream_raster), collect_cells, number_of_jobs)
 
-#(upper_left_x, x_size, x_rotation, upper_left_y, y_rotation, y_size) = r.GetGeoTransform()
-(upper_left_x, x_size, x_rotation, upper_left_y, y_rotation, y_size) = boolean.gt
+    cells, values = np.concatenate(cells), np.concatenate(values)
+    order = np.argsort(cells, kind='stable')
 
-#a = band.ReadAsArray().astype(np.float)
+    return(cells[order], values[order])
 
-# indices = np.nonzero(a != band.GetNoDataValue())
-indices = np.nonzero(boolean.array >= 1)
 
-# Init the shapefile stuff..
-#srs = osgeo.osr.SpatialReference()
-#srs.ImportFromWkt(r.GetProjection())
+def reachID_grid_to_vector_points(stream_raster, output_fileName, write_option):
+    '''
+    Writes a point at the center of each stream pixel. The id attribute is the pixel value (reachID) or the position of
+    the pixel in row-major order starting at 1 (featureID or pixelID).
 
-#driver = osgeo.ogr.GetDriverByName('GPKG')
-#shapeData = driver.CreateDataSource(outputFileName)
+    '''
 
-#layer = shapeData.CreateLayer('ogr_pts', srs, osgeo.ogr.wkbPoint)
-#layerDefinition = layer.GetLayerDefn()
+    with rasterio.open(stream_raster) as streams:
+        transform, crs, width = streams.transform, streams.crs, streams.width
 
-#idField = osgeo.ogr.FieldDefn("id", osgeo.ogr.OFTInteger)
-#layer.CreateField(idField)
+    cells, values = stream_pixel_cells(stream_raster)
 
-id =[None] * len(indices[0]);points = [None]*len(indices[0])
+    # pixel centers
+    x = transform.c + (cells % width + 0.5) * transform.a
+    y = transform.f + (cells // width + 0.5) * transform.e
 
-# Iterate over the Numpy points..
-i = 1
-for y_index,x_index in tqdm(zip(*indices),total=len(indices[0])):
-    x = x_index * x_size + upper_left_x + (x_size / 2) #add half the cell size
-    y = y_index * y_size + upper_left_y + (y_size / 2) #to centre the point
+    if write_option == 'reachID':
+        ids = values
+    elif (write_option == 'featureID') | (write_option == 'pixelID'):
+        ids = np.arange(1, len(cells) + 1)
 
-    # get raster value
-    #reachID = a[y_index,x_index]
+    pointGDF = gpd.GeoDataFrame({'id' : ids}, geometry=gpd.points_from_xy(x, y), crs=crs)
+    pointGDF.to_file(output_fileName,driver=getDriver(output_fileName),index=False)
 
-    #point = osgeo.ogr.Geometry(osgeo.ogr.wkbPoint)
-    #point.SetPoint(0, x, y)
-    points[i-1] = Point(x,y)
 
-    #feature = osgeo.ogr.Feature(layerDefinition)
-    #feature.SetGeometry(point)
-    #feature.SetFID(i)
-    if writeOption == 'reachID':
-        reachID = a[y_index,x_index]
-        id[i-1] = reachID
-	#feature.SetField("id",reachID)
-    elif (writeOption == 'featureID') |( writeOption == 'pixelID'):
-        #feature.SetField("id",i)
-        id[i-1] = i
-    #layer.CreateFeature(feature)
+if __name__ == '__main__':
 
-    i += 1
+    path = sys.argv[1]
+    outputFileName = sys.argv[2]
+    writeOption = sys.argv[3]
 
-pointGDF = gpd.GeoDataFrame({'id' : id, 'geometry' : points},crs=boolean.proj,geometry='geometry')
-pointGDF.to_file(outputFileName,driver=getDriver(outputFileName),index=False)
+    reachID_grid_to_vector_points(path, outputFileName, writeOption)
 
-print("Complete")
-#shapeData.Destroy()
+    print("Complete")
@@ -1,17 +1,72 @@
 #!/usr/bin/env python3
 
-from numba import njit, typeof, typed, types
+from numba import njit
 import rasterio
 import numpy as np
 import argparse
 import os
 import pandas as pd
+from functools import partial
 from osgeo import ogr, gdal
 import geopandas as gpd
-from utils.shared_functions import getDriver
+from utils.shared_functions import getDriver, intermediate_raster_profile
+from utils.tiled_execution import block_windows, map_blocks, reduce_blocks
 
 
-def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, thalweg_raster, hydroid_fileName, dem_reaches_filename):
+# ------------------------------------------- Block kernels ------------------------------------------------------------ #
+# The kernels release the GIL so blocks run concurrently (see utils/tiled_execution.py). Pixel catchment ids are the
+# contiguous stream pixel ids (see reachID_grid_to_vector_points.py), so zonal values are kept in arrays indexed by id.
+def thalweg_cells_block(dem_window, catchments_window, hydroid_window, thalweg_window):
+    # Only allow reference elevations and hydroids to be within thalweg.
+    thalweg_cells = (thalweg_window == 1) & (catchments_window >= 0)
+    return(catchments_window[thalweg_cells].astype(np.int64), dem_window[thalweg_cells], hydroid_window[thalweg_cells].astype(np.int64))
+
+
+def merge_thalweg_cells(accumulated_cells, block_cells):
+    accumulated_cells.append(block_cells)
+    return(accumulated_cells)
+
+
+@njit
+def make_catchment_arrays(catchments, elevations, hydroids, number_of_catchments):
+
+    catchment_min = np.zeros(number_of_catchments, dtype=np.float32)
+    catchment_hydroid = np.zeros(number_of_catchments, dtype=np.int64)
+    catchment_found = np.zeros(number_of_catchments, dtype=np.bool_)
+    for i in range(len(catchments)):
+        cm = catchments[i]
+        # If the catchment has already been found, compare elevation values.
+        if catchment_found[cm]:
+            if elevations[i] < catchment_min[cm]:
+                catchment_min[cm] = elevations[i]
+        else:
+            catchment_found[cm] = True
+            catchment_min[cm] = elevations[i]
+        # later thalweg cells overwrite earlier ones
+        catchment_hydroid[cm] = hydroids[i]
+    return(catchment_min, catchment_hydroid, catchment_found)
+
+
+@njit(nogil=True)
+def calculate_rem(flat_dem,catchment_min,catchment_found,flat_catchments,ndv):
+    rem_window = np.zeros(len(flat_dem),dtype=np.float32)
+    for i,cm in enumerate(flat_catchments):
+        if (cm >= 0) and (cm < len(catchment_found)) and catchment_found[cm]:
+            if catchment_min[cm] == ndv:
+                rem_window[i] = ndv
+            else:
+                rem_window[i] = flat_dem[i] - catchment_min[cm]
+
+    return(rem_window)
+
+
+def rem_block(dem_window, catchments_window, catchment_min, catchment_found, ndv):
+    rem_window = calculate_rem(dem_window.ravel(), catchment_min, catchment_found, catchments_window.ravel(), ndv)
+    return(rem_window.reshape(dem_window.shape).astype(np.float32))
+# ------------------------------------------------------------------------------------------------------------------------ #
+
+
+def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, thalweg_raster, hydroid_fileName, dem_reaches_filename, number_of_jobs=None):
     """
         Calculates REM/HAND/Detrended DEM
 
@@ -27,92 +82,34 @@ def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, thalweg_raste
             File name of the hydroid raster (i.e. gw_catchments_reaches.tif)
         dem_reaches_filename
             File name of the reaches layer to populate HAND elevation attribute values and overwrite as output
+        number_of_jobs : int
+            Number of threads processing blocks. Defaults to the ncores_tiled environment variable.
 
     """
 
-    # ------------------------------------------- Get catchment_hydroid_dict --------------------------------------------------- #
-    # The following creates a dictionary of the catchment ids (key) and their hydroid along the thalweg (value).
-    # This is needed to produce a HAND zero reference elevation by hydroid dataframe (helpful for evaluating rating curves & bathy properties)
-    @njit
-    def make_catchment_hydroid_dict(flat_value_raster, catchment_hydroid_dict, flat_catchments, thalweg_window):
-
-        for i,cm in enumerate(flat_catchments):
-            if thalweg_window[i] == 1:  # Only allow reference hydroid to be within thalweg.
-                catchment_hydroid_dict[cm] = flat_value_raster[i]
-        return(catchment_hydroid_dict)
-
-    # Open the masked gw_catchments_pixels_masked, hydroid_raster, and dem_thalwegCond_masked.
-    gw_catchments_pixels_masked_object = rasterio.open(pixel_watersheds_fileName)
-    hydroid_pixels_object = rasterio.open(hydroid_fileName)
-    thalweg_raster_object = rasterio.open(thalweg_raster)
+    # ------------------------------------------- Get catchment hydroids and minimums --------------------------------------- #
+    # One pass over the thalweg cells gives the hydroid (value) of each catchment id (index) along the thalweg, needed to
+    # produce a HAND zero reference elevation by hydroid dataframe (helpful for evaluating rating curves & bathy properties),
+    # and the minimum elevation (value) of each catchment id (index) along the thalweg.
+    dem_windows = block_windows(dem_fileName)
+    thalweg_cells = reduce_blocks(thalweg_cells_block, [dem_fileName, pixel_watersheds_fileName, hydroid_fileName, thalweg_raster],
+                                  dem_windows, merge_thalweg_cells, [], number_of_jobs)
+    catchments, elevations, hydroids = [np.concatenate(cells) for cells in zip(*thalweg_cells)]
+    del thalweg_cells
+    number_of_catchments = int(catchments.max()) + 1 if len(catchments) > 0 else 0
+    catchment_min, catchment_hydroid, catchment_found = make_catchment_arrays(catchments, elevations, hydroids, number_of_catchments)
+    del catchments, elevations, hydroids
 
     # Specify raster object metadata.
-    meta = hydroid_pixels_object.meta.copy()
-    meta['tiled'], meta['compress'] = True, 'lzw'
-
-    # -- Create catchment_hydroid_dict -- #
-    catchment_hydroid_dict = typed.Dict.empty(types.int64,types.int64)  # Initialize an empty dictionary to store the catchment hydroid.
-    # Update catchment_hydroid_dict with each pixel sheds hydroid.
-    # Creating dictionary containing catchment ids (key) and corresponding hydroid within the thalweg...
-    for ji, window in hydroid_pixels_object.block_windows(1):  # Iterate over windows, using dem_rasterio_object as template.
-        hydroid_window = hydroid_pixels_object.read(1,window=window).ravel()  # Define hydroid_window.
-        catchments_window = gw_catchments_pixels_masked_object.read(1,window=window).ravel()  # Define catchments_window.
-        thalweg_window = thalweg_raster_object.read(1, window=window).ravel()  # Define cost_window.
-
-        # Call numba-optimized function to update catchment_hydroid_dict with pixel sheds overlapping hydroid.
-        catchment_hydroid_dict = make_catchment_hydroid_dict(hydroid_window, catchment_hydroid_dict, catchments_window, thalweg_window)
-
-    hydroid_pixels_object.close()
-    gw_catchments_pixels_masked_object.close()
-    thalweg_raster_object.close()
-    # ------------------------------------------- Get catchment_min_dict --------------------------------------------------- #
-    # The following creates a dictionary of the catchment ids (key) and their elevation along the thalweg (value).
-    @njit
-    def make_catchment_min_dict(flat_dem, catchment_min_dict, flat_catchments, thalweg_window):
-
-        for i,cm in enumerate(flat_catchments):
-            if thalweg_window[i] == 1:  # Only allow reference elevation to be within thalweg.
-                # If the catchment really exists in the dictionary, compare elevation values.
-                if (cm in catchment_min_dict):
-                    if (flat_dem[i] < catchment_min_dict[cm]):
-                        # If the flat_dem's elevation value is less than the catchment_min_dict min, update the catchment_min_dict min.
-                        catchment_min_dict[cm] = flat_dem[i]
-                else:
-                    catchment_min_dict[cm] = flat_dem[i]
-        return(catchment_min_dict)
-
-    # Open the masked gw_catchments_pixels_masked and dem_thalwegCond_masked.
-    gw_catchments_pixels_masked_object = rasterio.open(pixel_watersheds_fileName)
-    dem_thalwegCond_masked_object = rasterio.open(dem_fileName)
-    thalweg_raster_object = rasterio.open(thalweg_raster)
+    with rasterio.open(dem_fileName) as dem_thalwegCond_masked_object:
+        meta = dem_thalwegCond_masked_object.meta.copy()
+    meta.update(intermediate_raster_profile())
 
-    # Specify raster object metadata.
-    meta = dem_thalwegCond_masked_object.meta.copy()
-    meta['tiled'], meta['compress'] = True, 'lzw'
-
-    # -- Create catchment_min_dict -- #
-    catchment_min_dict = typed.Dict.empty(types.int64,types.float32)  # Initialize an empty dictionary to store the catchment minimums.
-    # Update catchment_min_dict with pixel sheds minimum.
-    # Creating dictionary containing catchment ids (key) and corresponding elevation within the thalweg (value)...
-    for ji, window in dem_thalwegCond_masked_object.block_windows(1):  # Iterate over windows, using dem_rasterio_object as template.
-        dem_window = dem_thalwegCond_masked_object.read(1,window=window).ravel()  # Define dem_window.
-        catchments_window = gw_catchments_pixels_masked_object.read(1,window=window).ravel()  # Define catchments_window.
-        thalweg_window = thalweg_raster_object.read(1, window=window).ravel()  # Define cost_window.
-
-        # Call numba-optimized function to update catchment_min_dict with pixel sheds minimum.
-        catchment_min_dict = make_catchment_min_dict(dem_window, catchment_min_dict, catchments_window, thalweg_window)
-
-    dem_thalwegCond_masked_object.close()
-    gw_catchments_pixels_masked_object.close()
-    thalweg_raster_object.close()
-
-    # Merge and export dictionary to to_csv
-    catchment_min_dict_df = pd.DataFrame.from_dict(catchment_min_dict, orient='index') # convert dict to dataframe
-    catchment_min_dict_df.columns = ['Median_Thal_Elev_m']
-    catchment_hydroid_dict_df = pd.DataFrame.from_dict(catchment_hydroid_dict, orient='index') # convert dict to dataframe
-    catchment_hydroid_dict_df.columns = ['HydroID']
-    merge_df = catchment_hydroid_dict_df.merge(catchment_min_dict_df, left_index=True, right_index=True)
-    merge_df.index.name = 'pixelcatch_id'
+    # Export catchment arrays to dataframe
+    found_catchments = np.nonzero(catchment_found)[0]
+    merge_df = pd.DataFrame({'HydroID' : catchment_hydroid[found_catchments], 'Median_Thal_Elev_m' : catchment_min[found_catchments]},
+                            index=pd.Index(found_catchments, name='pixelcatch_id'))
+    del catchment_hydroid
 
     # Merge the HAND reference elevation by HydroID dataframe with the demDerived_reaches layer (add new layer attribute)
     min_by_hydroid = merge_df.groupby(['HydroID']).min() # min value of all med_thal_elev for pixel catchments in each HydroID reach
@@ -122,46 +119,26 @@ def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, thalweg_raste
     max_by_hydroid = merge_df.groupby(['HydroID']).max() # max value of all med_thal_elev for pixel catchments in each HydroID reach
     max_by_hydroid.columns = ['max_thal_elev']
     input_reaches = gpd.read_file(dem_reaches_filename)
+    input_reaches = input_reaches.drop(columns=['min_thal_elev','med_thal_elev','max_thal_elev'], errors='ignore') # attributes from an interrupted earlier attempt
     input_reaches = input_reaches.merge(min_by_hydroid, on='HydroID') # merge dataframes by HydroID variable
     input_reaches = input_reaches.merge(med_by_hydroid, on='HydroID') # merge dataframes by HydroID variable
     input_reaches = input_reaches.merge(max_by_hydroid, on='HydroID') # merge dataframes by HydroID variable
-    input_reaches.to_file(dem_reaches_filename,driver=getDriver(dem_reaches_filename),index=False)
+    # write next to the input and rename over it so the reach layer is never left half written
+    root, ext = os.path.splitext(dem_reaches_filename)
+    temp_reaches_filename = root + '_tmp' + ext
+    if os.path.exists(temp_reaches_filename):
+        os.remove(temp_reaches_filename)
+    input_reaches.to_file(temp_reaches_filename,driver=getDriver(dem_reaches_filename),index=False)
+    os.replace(temp_reaches_filename, dem_reaches_filename)
     # ------------------------------------------------------------------------------------------------------------------------ #
 
 
     # ------------------------------------------- Produce relative elevation model ------------------------------------------- #
-    @njit
-    def calculate_rem(flat_dem,catchmentMinDict,flat_catchments,ndv):
-        rem_window = np.zeros(len(flat_dem),dtype=np.float32)
-        for i,cm in enumerate(flat_catchments):
-            if cm in catchmentMinDict:
-                if catchmentMinDict[cm] == ndv:
-                    rem_window[i] = ndv
-                else:
-                    rem_window[i] = flat_dem[i] - catchmentMinDict[cm]
-
-        return(rem_window)
-
-    rem_rasterio_object = rasterio.open(rem_fileName,'w',**meta)  # Open rem_rasterio_object for writing to rem_fileName.
-    pixel_catchments_rasterio_object = rasterio.open(pixel_watersheds_fileName)  # Open pixel_catchments_rasterio_object
-    dem_rasterio_object = rasterio.open(dem_fileName)
-
     # Producing relative elevation model raster
-    for ji, window in dem_rasterio_object.block_windows(1):
-        dem_window = dem_rasterio_object.read(1,window=window)
-        window_shape = dem_window.shape
-
-        dem_window = dem_window.ravel()
-        catchments_window = pixel_catchments_rasterio_object.read(1,window=window).ravel()
-
-        rem_window = calculate_rem(dem_window, catchment_min_dict, catchments_window, meta['nodata'])
-        rem_window = rem_window.reshape(window_shape).astype(np.float32)
-
-        rem_rasterio_object.write(rem_window, window=window, indexes=1)
-
-    dem_rasterio_object.close()
-    pixel_catchments_rasterio_object.close()
-    rem_rasterio_object.close()
+    with rasterio.open(rem_fileName,'w',**meta) as rem_rasterio_object:
+        write_rem = lambda window, rem_window: rem_rasterio_object.write(rem_window, window=window, indexes=1)
+        map_blocks(partial(rem_block, catchment_min=catchment_min, catchment_found=catchment_found, ndv=meta['nodata']), [dem_fileName, pixel_watersheds_fileName],
+                   dem_windows, write_rem, number_of_jobs)
     # ------------------------------------------------------------------------------------------------------------------------ #
 
 
@@ -175,6 +152,7 @@ if __name__ == '__main__':
     parser.add_argument('-o','--rem',help='Output REM raster',required=True)
     parser.add_argument('-i','--hydroid', help='HydroID raster to use within project path', required=True)
     parser.add_argument('-s','--dem_reaches_in_out',help='DEM derived reach layer to join HAND reference elevation attribute',required=True)
+    parser.add_argument('-j','--number-of-jobs',help='Number of threads processing blocks. Default is the ncores_tiled environment variable',required=False,default=None,type=int)
 
 
     # extract to dictionary
@@ -187,5 +165,6 @@ if __name__ == '__main__':
     thalweg_raster = args['thalweg_raster']
     hydroid_fileName = args['hydroid']
     dem_reaches_filename = args['dem_reaches_in_out']
+    number_of_jobs = args['number_of_jobs']
 
-    rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, thalweg_raster, hydroid_fileName, dem_reaches_filename)
+    rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, thalweg_raster, hydroid_fileName, dem_reaches_filename, number_of_jobs)
@@ -20,12 +20,32 @@ echo -e "ms_buffer_dist=$ms_buffer_dist"
 echo -e "ncores_gw=$ncores_gw"
 echo -e "ncores_fd=$ncores_fd"
 echo -e "default_max_jobs=$default_max_jobs"
-echo -e "memfree=$memfree"$stopDiv
+echo -e "memfree=$memfree"
+echo -e "intermediate_compress=$intermediate_compress"
+echo -e "intermediate_compress_level=$intermediate_compress_level"
+echo -e "scratch_dir=$scratch_dir"$stopDiv
+
+## SET INTERMEDIATE RASTER CREATION OPTIONS ##
+# deliverables (rem_zeroed_masked.tif, gw_catchments_reaches_filtered_addedAttributes.tif) keep LZW
+intermediate_compress=${intermediate_compress:-LZW}
+intermediate_co=( -co "TILED=YES" -co "BLOCKXSIZE=512" -co "BLOCKYSIZE=512" -co "BIGTIFF=YES" -co "COMPRESS=$intermediate_compress" )
+if [ -n "$intermediate_compress_level" ]; then
+  case $intermediate_compress in
+    ZSTD|LERC_ZSTD) intermediate_co+=( -co "ZSTD_LEVEL=$intermediate_compress_level" ) ;;
+    DEFLATE) intermediate_co+=( -co "ZLEVEL=$intermediate_compress_level" ) ;;
+  esac
+fi
+[[ $intermediate_compress == LERC* ]] && intermediate_co+=( -co "MAX_Z_ERROR=${intermediate_max_z_error:-0}" )
+intermediate_calc_co=( "${intermediate_co[@]/-co/--co}" )
 
 ## SET OUTPUT DIRECTORY FOR UNIT ##
 hucNumber="$1"
 outputHucDataDir=$outputRunDataDir/$hucNumber
-mkdir $outputHucDataDir
+if [ "$resume" = "1" ]; then
+  mkdir -p $outputHucDataDir
+else
+  mkdir $outputHucDataDir
+fi
 
 ## SET VARIABLES AND FILE INPUTS ##
 hucUnitLength=${#hucNumber}
@@ -47,16 +67,23 @@ fi
 echo -e $startDiv"Get WBD $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/wbd.gpkg ] && \
-ogr2ogr -f GPKG $outputHucDataDir/wbd.gpkg $input_WBD_gdb $input_NHD_WBHD_layer -where "HUC$hucUnitLength='$hucNumber'"
+if step_begin get_wbd $outputHucDataDir/wbd.gpkg; then
+  ogr2ogr -f GPKG $outputHucDataDir/wbd.gpkg $input_WBD_gdb $input_NHD_WBHD_layer -where "HUC$hucUnitLength='$hucNumber'"
+  step_end get_wbd
+fi
 Tcount
 
 ## Subset Vector Layers ##
 echo -e $startDiv"Get Vector Layers and Subset $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/NHDPlusBurnLineEvent_subset.gpkg ] && \
-$srcDir/clip_vectors_to_wbd.py -d $hucNumber -w $input_nwm_flows -s $input_nhd_flowlines -l $input_nwm_lakes -r $input_NLD -g $outputHucDataDir/wbd.gpkg -f $outputHucDataDir/wbd_buffered.gpkg -m $input_nwm_catchments -y $input_nhd_headwaters -v $input_LANDSEA -c $outputHucDataDir/NHDPlusBurnLineEvent_subset.gpkg -z $outputHucDataDir/nld_subset_levees.gpkg -a $outputHucDataDir/nwm_lakes_proj_subset.gpkg -n $outputHucDataDir/nwm_catchments_proj_subset.gpkg -e $outputHucDataDir/nhd_headwater_points_subset.gpkg -b $outputHucDataDir/nwm_subset_streams.gpkg -x $outputHucDataDir/LandSea_subset.gpkg -extent $extent -gl $input_GL_boundaries -lb $lakes_buffer_dist_meters -wb $wbd_buffer
+# read national layers from the partitioned store if it was built
+partition_args=()
+[ -d "$input_partitioned_vectors" ] && partition_args+=( -p $input_partitioned_vectors )
+if step_begin subset_vectors $outputHucDataDir/wbd_buffered.gpkg $outputHucDataDir/NHDPlusBurnLineEvent_subset.gpkg $outputHucDataDir/nld_subset_levees.gpkg $outputHucDataDir/nwm_lakes_proj_subset.gpkg $outputHucDataDir/nwm_catchments_proj_subset.gpkg $outputHucDataDir/nhd_headwater_points_subset.gpkg $outputHucDataDir/nwm_subset_streams.gpkg $outputHucDataDir/LandSea_subset.gpkg; then
+  $srcDir/clip_vectors_to_wbd.py -d $hucNumber -w $input_nwm_flows -s $input_nhd_flowlines -l $input_nwm_lakes -r $input_NLD -g $outputHucDataDir/wbd.gpkg -f $outputHucDataDir/wbd_buffered.gpkg -m $input_nwm_catchments -y $input_nhd_headwaters -v $input_LANDSEA -c $outputHucDataDir/NHDPlusBurnLineEvent_subset.gpkg -z $outputHucDataDir/nld_subset_levees.gpkg -a $outputHucDataDir/nwm_lakes_proj_subset.gpkg -n $outputHucDataDir/nwm_catchments_proj_subset.gpkg -e $outputHucDataDir/nhd_headwater_points_subset.gpkg -b $outputHucDataDir/nwm_subset_streams.gpkg -x $outputHucDataDir/LandSea_subset.gpkg -extent $extent -gl $input_GL_boundaries -lb $lakes_buffer_dist_meters -wb $wbd_buffer "${partition_args[@]}"
+  step_end subset_vectors
+fi
 Tcount
 
 if [ "$extent" = "MS" ]; then
@@ -71,63 +98,65 @@ fi
 echo -e $startDiv"Clip WBD8"$stopDiv
 date -u
 Tstart
-ogr2ogr -f GPKG -clipsrc $outputHucDataDir/wbd_buffered.gpkg $outputHucDataDir/wbd8_clp.gpkg $inputDataDir/wbd/WBD_National.gpkg WBDHU8
+if step_begin clip_wbd8 $outputHucDataDir/wbd8_clp.gpkg; then
+  ogr2ogr -f GPKG -clipsrc $outputHucDataDir/wbd_buffered.gpkg $outputHucDataDir/wbd8_clp.gpkg $inputDataDir/wbd/WBD_National.gpkg WBDHU8
+  step_end clip_wbd8
+fi
 Tcount
 
 ## CLIP DEM ##
 echo -e $startDiv"Clip DEM $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/dem_meters.tif ] && \
-gdalwarp -cutline $outputHucDataDir/wbd_buffered.gpkg -crop_to_cutline -ot Float32 -r bilinear -of "GTiff" -overwrite -co "BLOCKXSIZE=512" -co "BLOCKYSIZE=512" -co "TILED=YES" -co "COMPRESS=LZW" -co "BIGTIFF=YES" $input_DEM $outputHucDataDir/dem_meters.tif
+if step_begin clip_dem $outputHucDataDir/dem_meters.tif; then
+  gdalwarp -cutline $outputHucDataDir/wbd_buffered.gpkg -crop_to_cutline -ot Float32 -r bilinear -of "GTiff" -overwrite "${intermediate_co[@]}" $input_DEM $outputHucDataDir/dem_meters.tif
+  step_end clip_dem
+fi
 Tcount
 
+## SET SCRATCH DIRECTORY ##
+# intermediate workspaces go to scratch_dir (e.g. tmpfs) for HUCs whose DEM is under the size threshold
+scratchHucDataDir=$outputHucDataDir
+if [ -n "$scratch_dir" ] && [ $(stat -c %s $outputHucDataDir/dem_meters.tif) -le $(( ${scratch_max_dem_size_mb:-2048} * 1024 * 1024 )) ]; then
+  scratchHucDataDir=$scratch_dir/$(basename $outputRunDataDir)/$hucNumber
+  mkdir -p $scratchHucDataDir
+  trap "rm -rf $scratchHucDataDir" EXIT
+  echo -e "Using scratch directory $scratchHucDataDir"
+fi
+
 ## GET RASTER METADATA
 echo -e $startDiv"Get DEM Metadata $hucNumber"$stopDiv
 date -u
 Tstart
 read fsize ncols nrows ndv xmin ymin xmax ymax cellsize_resx cellsize_resy<<<$($srcDir/getRasterInfoNative.py $outputHucDataDir/dem_meters.tif)
 
-## RASTERIZE NLD MULTILINES ##
-echo -e $startDiv"Rasterize all NLD multilines using zelev vertices"$stopDiv
+## RASTERIZE NLD MULTILINES, REACH BOOLEAN (1 & 0), NHD HEADWATERS (1 & 0) AND NWM CATCHMENTS (FR) ##
+echo -e $startDiv"Rasterize NLD levees, Reach Boolean, NHD Headwaters and NWM Catchments $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/nld_rasterized_elev.tif ] && [ -f $outputHucDataDir/nld_subset_levees.gpkg ] && \
-gdal_rasterize -l nld_subset_levees -3d -at -a_nodata $ndv -te $xmin $ymin $xmax $ymax -ts $ncols $nrows -ot Float32 -of GTiff -co "BLOCKXSIZE=512" -co "BLOCKYSIZE=512" -co "COMPRESS=LZW" -co "BIGTIFF=YES" -co "TILED=YES" $outputHucDataDir/nld_subset_levees.gpkg $outputHucDataDir/nld_rasterized_elev.tif
-Tcount
-
-## RASTERIZE REACH BOOLEAN (1 & 0) ##
-echo -e $startDiv"Rasterize Reach Boolean $hucNumber"$stopDiv
-date -u
-Tstart
-[ ! -f $outputHucDataDir/flows_grid_boolean.tif ] && \
-gdal_rasterize -ot Int32 -burn 1 -init 0 -co "COMPRESS=LZW" -co "BIGTIFF=YES" -co "TILED=YES" -te $xmin $ymin $xmax $ymax -ts $ncols $nrows $outputHucDataDir/NHDPlusBurnLineEvent_subset.gpkg $outputHucDataDir/flows_grid_boolean.tif
-Tcount
-
-## RASTERIZE NHD HEADWATERS (1 & 0) ##
-echo -e $startDiv"Rasterize NHD Headwaters $hucNumber"$stopDiv
-date -u
-Tstart
-[ ! -f $outputHucDataDir/headwaters.tif ] && \
-gdal_rasterize -ot Int32 -burn 1 -init 0 -co "COMPRESS=LZW" -co "BIGTIFF=YES" -co "TILED=YES" -te $xmin $ymin $xmax $ymax -ts $ncols $nrows $outputHucDataDir/nhd_headwater_points_subset.gpkg $outputHucDataDir/headwaters.tif
-Tcount
-
-if [ "$extent" = "FR" ]; then
-  # RASTERIZE NWM CATCHMENTS ##
-  echo -e $startDiv"Raster NWM Catchments $hucNumber"$stopDiv
-  date -u
-  Tstart
-  [ ! -f $outputHucDataDir/nwm_catchments_proj_subset.tif ] && \
-  gdal_rasterize -ot Int32 -a ID -a_nodata 0 -init 0 -co "COMPRESS=LZW" -co "BIGTIFF=YES" -co "TILED=YES" -te $xmin $ymin $xmax $ymax -ts $ncols $nrows $outputHucDataDir/nwm_catchments_proj_subset.gpkg $outputHucDataDir/nwm_catchments_proj_subset.tif
-  Tcount
+rasterize_layers=( -l "vector=$outputHucDataDir/nld_subset_levees.gpkg,output=$outputHucDataDir/nld_rasterized_elev.tif,burn=z,dtype=float32,nodata=$ndv,all_touched" )
+rasterize_layers+=( -l "vector=$outputHucDataDir/NHDPlusBurnLineEvent_subset.gpkg,output=$outputHucDataDir/flows_grid_boolean.tif,burn=1,dtype=int32,init=0" )
+rasterize_layers+=( -l "vector=$outputHucDataDir/nhd_headwater_points_subset.gpkg,output=$outputHucDataDir/headwaters.tif,burn=1,dtype=int32,init=0" )
+[ "$extent" = "FR" ] && \
+rasterize_layers+=( -l "vector=$outputHucDataDir/nwm_catchments_proj_subset.gpkg,output=$outputHucDataDir/nwm_catchments_proj_subset.tif,attribute=ID,dtype=int32,nodata=0,init=0" )
+if step_begin rasterize_layers $outputHucDataDir/nld_rasterized_elev.tif $outputHucDataDir/flows_grid_boolean.tif $outputHucDataDir/headwaters.tif $outputHucDataDir/nwm_catchments_proj_subset.tif; then
+  $srcDir/rasterize_layers.py -g $outputHucDataDir/dem_meters.tif -i "${rasterize_layers[@]}"
+  step_end rasterize_layers
 fi
+Tcount
 
 ## BURN LEVEES INTO DEM ##
 echo -e $startDiv"Burn nld levees into dem & convert nld elev to meters (*Overwrite dem_meters.tif output) $hucNumber"$stopDiv
 date -u
 Tstart
-[ -f $outputHucDataDir/nld_rasterized_elev.tif ] && \
-$srcDir/burn_in_levees.py -dem $outputHucDataDir/dem_meters.tif -nld $outputHucDataDir/nld_rasterized_elev.tif -out $outputHucDataDir/dem_meters.tif
+# written next to dem_meters.tif and renamed over it so an interrupted burn never leaves a truncated DEM behind
+if step_begin burn_levees $outputHucDataDir/dem_meters_levees.tif; then
+  if [ -f $outputHucDataDir/nld_rasterized_elev.tif ]; then
+    $srcDir/burn_in_levees.py -dem $outputHucDataDir/dem_meters.tif -nld $outputHucDataDir/nld_rasterized_elev.tif -out $outputHucDataDir/dem_meters_levees.tif
+    mv -f $outputHucDataDir/dem_meters_levees.tif $outputHucDataDir/dem_meters.tif
+  fi
+  step_end burn_levees
+fi
 Tcount
 
 ## DEM Reconditioning ##
@@ -137,24 +166,32 @@ Tcount
 echo -e $startDiv"Creating AGREE DEM using $agree_DEM_buffer meter buffer"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/dem_burned.tif ] && \
-$srcDir/agreedem.py -r $outputHucDataDir/flows_grid_boolean.tif -d $outputHucDataDir/dem_meters.tif -w $outputHucDataDir -g $outputHucDataDir/temp_work -o $outputHucDataDir/dem_burned.tif -b $agree_DEM_buffer -sm 10 -sh 1000
+agree_args=()
+[ -n "$agree_max_memory_mb" ] && agree_args+=( -m $agree_max_memory_mb )
+if step_begin agreedem $outputHucDataDir/dem_burned.tif; then
+  $srcDir/agreedem.py -r $outputHucDataDir/flows_grid_boolean.tif -d $outputHucDataDir/dem_meters.tif -w $scratchHucDataDir -o $outputHucDataDir/dem_burned.tif -b $agree_DEM_buffer -sm 10 -sh 1000 "${agree_args[@]}"
+  step_end agreedem
+fi
 Tcount
 
 ## PIT REMOVE BURNED DEM ##
 echo -e $startDiv"Pit remove Burned DEM $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/dem_burned_filled.tif ] && \
-rd_depression_filling $outputHucDataDir/dem_burned.tif $outputHucDataDir/dem_burned_filled.tif
+if step_begin pit_remove $outputHucDataDir/dem_burned_filled.tif; then
+  rd_depression_filling $outputHucDataDir/dem_burned.tif $outputHucDataDir/dem_burned_filled.tif
+  step_end pit_remove
+fi
 Tcount
 
 ## D8 FLOW DIR ##
 echo -e $startDiv"D8 Flow Directions on Burned DEM $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/flowdir_d8_burned_filled.tif ] && \
-mpiexec -n $ncores_fd $taudemDir2/d8flowdir -fel $outputHucDataDir/dem_burned_filled.tif -p $outputHucDataDir/flowdir_d8_burned_filled.tif
+if step_begin d8_flowdir $outputHucDataDir/flowdir_d8_burned_filled.tif; then
+  mpiexec -n $ncores_fd $taudemDir2/d8flowdir -fel $outputHucDataDir/dem_burned_filled.tif -p $outputHucDataDir/flowdir_d8_burned_filled.tif
+  step_end d8_flowdir
+fi
 Tcount
 
 ## DINF FLOW DIR ##
@@ -169,67 +206,98 @@ Tcount
 echo -e $startDiv"D8 Flow Accumulations $hucNumber"$stopDiv
 date -u
 Tstart
-$taudemDir/aread8 -p $outputHucDataDir/flowdir_d8_burned_filled.tif -ad8  $outputHucDataDir/flowaccum_d8_burned_filled.tif -wg  $outputHucDataDir/headwaters.tif -nc
+if step_begin flow_accumulation $outputHucDataDir/flowaccum_d8_burned_filled.tif; then
+  $taudemDir/aread8 -p $outputHucDataDir/flowdir_d8_burned_filled.tif -ad8  $outputHucDataDir/flowaccum_d8_burned_filled.tif -wg  $outputHucDataDir/headwaters.tif -nc
+  step_end flow_accumulation
+fi
 Tcount
 
 # THRESHOLD ACCUMULATIONS ##
 echo -e $startDiv"Threshold Accumulations $hucNumber"$stopDiv
 date -u
 Tstart
-$taudemDir/threshold -ssa $outputHucDataDir/flowaccum_d8_burned_filled.tif -src  $outputHucDataDir/demDerived_streamPixels.tif -thresh 1
+if step_begin threshold_accumulation $outputHucDataDir/demDerived_streamPixels.tif; then
+  $taudemDir/threshold -ssa $outputHucDataDir/flowaccum_d8_burned_filled.tif -src  $outputHucDataDir/demDerived_streamPixels.tif -thresh 1
+  step_end threshold_accumulation
+fi
 Tcount
 
 ## PREPROCESSING FOR LATERAL THALWEG ADJUSTMENT ###
 echo -e $startDiv"Preprocessing for lateral thalweg adjustment $hucNumber"$stopDiv
 date -u
 Tstart
-$srcDir/unique_pixel_and_allocation.py -s $outputHucDataDir/demDerived_streamPixels.tif -o $outputHucDataDir/demDerived_streamPixels_ids.tif -g $outputHucDataDir/temp_grass
+if step_begin thalweg_preprocessing $outputHucDataDir/demDerived_streamPixels_ids.tif $outputHucDataDir/demDerived_streamPixels_ids_allo.tif $outputHucDataDir/demDerived_streamPixels_ids_dist.tif; then
+  $srcDir/unique_pixel_and_allocation.py -s $outputHucDataDir/demDerived_streamPixels.tif -o $outputHucDataDir/demDerived_streamPixels_ids.tif
+  step_end thalweg_preprocessing
+fi
 Tcount
 
 ## ADJUST THALWEG MINIMUM USING LATERAL ZONAL MINIMUM ##
 echo -e $startDiv"Performing lateral thalweg adjustment $hucNumber"$stopDiv
 date -u
 Tstart
-$srcDir/adjust_thalweg_lateral.py -e $outputHucDataDir/dem_meters.tif -s $outputHucDataDir/demDerived_streamPixels.tif -a $outputHucDataDir/demDerived_streamPixels_ids_allo.tif -d $outputHucDataDir/demDerived_streamPixels_ids_dist.tif -t 50 -o $outputHucDataDir/dem_lateral_thalweg_adj.tif
+if step_begin thalweg_lateral_adjustment $outputHucDataDir/dem_lateral_thalweg_adj.tif; then
+  $srcDir/adjust_thalweg_lateral.py -e $outputHucDataDir/dem_meters.tif -s $outputHucDataDir/demDerived_streamPixels.tif -a $outputHucDataDir/demDerived_streamPixels_ids_allo.tif -d $outputHucDataDir/demDerived_streamPixels_ids_dist.tif -t 50 -o $outputHucDataDir/dem_lateral_thalweg_adj.tif
+  step_end thalweg_lateral_adjustment
+fi
 Tcount
 
 ## MASK BURNED DEM FOR STREAMS ONLY ###
 echo -e $startDiv"Mask Burned DEM for Thalweg Only $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/flowdir_d8_burned_filled_flows.tif ] && \
-gdal_calc.py --quiet --type=Int32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $outputHucDataDir/flowdir_d8_burned_filled.tif -B $outputHucDataDir/demDerived_streamPixels.tif --calc="A/B" --outfile="$outputHucDataDir/flowdir_d8_burned_filled_flows.tif" --NoDataValue=0
+if step_begin mask_flowdir_streams $outputHucDataDir/flowdir_d8_burned_filled_flows.tif; then
+  gdal_calc.py --quiet --type=Int32 --overwrite "${intermediate_calc_co[@]}" -A $outputHucDataDir/flowdir_d8_burned_filled.tif -B $outputHucDataDir/demDerived_streamPixels.tif --calc="A/B" --outfile="$outputHucDataDir/flowdir_d8_burned_filled_flows.tif" --NoDataValue=0
+  step_end mask_flowdir_streams
+fi
 Tcount
 
 ## FLOW CONDITION STREAMS ##
 echo -e $startDiv"Flow Condition Thalweg $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/dem_thalwegCond.tif ] && \
-$taudemDir/flowdircond -p $outputHucDataDir/flowdir_d8_burned_filled_flows.tif -z $outputHucDataDir/dem_lateral_thalweg_adj.tif -zfdc $outputHucDataDir/dem_thalwegCond.tif
+if step_begin flow_condition $outputHucDataDir/dem_thalwegCond.tif; then
+  $taudemDir/flowdircond -p $outputHucDataDir/flowdir_d8_burned_filled_flows.tif -z $outputHucDataDir/dem_lateral_thalweg_adj.tif -zfdc $outputHucDataDir/dem_thalwegCond.tif
+  step_end flow_condition
+fi
 Tcount
 
 ## D8 SLOPES ##
 echo -e $startDiv"D8 Slopes from DEM $hucNumber"$stopDiv
 date -u
 Tstart
-mpiexec -n $ncores_fd $taudemDir2/d8flowdir -fel $outputHucDataDir/dem_lateral_thalweg_adj.tif -sd8 $outputHucDataDir/slopes_d8_dem_meters.tif
+if step_begin d8_slopes $outputHucDataDir/slopes_d8_dem_meters.tif; then
+  mpiexec -n $ncores_fd $taudemDir2/d8flowdir -fel $outputHucDataDir/dem_lateral_thalweg_adj.tif -sd8 $outputHucDataDir/slopes_d8_dem_meters.tif
+  step_end d8_slopes
+fi
 Tcount
 
 # STREAMNET FOR REACHES ##
 echo -e $startDiv"Stream Net for Reaches $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/demDerived_reaches.shp ] && \
-$taudemDir/streamnet -p $outputHucDataDir/flowdir_d8_burned_filled.tif -fel $outputHucDataDir/dem_thalwegCond.tif -ad8 $outputHucDataDir/flowaccum_d8_burned_filled.tif -src $outputHucDataDir/demDerived_streamPixels.tif -ord $outputHucDataDir/streamOrder.tif -tree $outputHucDataDir/treeFile.txt -coord $outputHucDataDir/coordFile.txt -w $outputHucDataDir/sn_catchments_reaches.tif -net $outputHucDataDir/demDerived_reaches.shp
+if step_begin streamnet $outputHucDataDir/streamOrder.tif $outputHucDataDir/treeFile.txt $outputHucDataDir/coordFile.txt $outputHucDataDir/sn_catchments_reaches.tif $outputHucDataDir/demDerived_reaches.{shp,shx,dbf,prj}; then
+  $taudemDir/streamnet -p $outputHucDataDir/flowdir_d8_burned_filled.tif -fel $outputHucDataDir/dem_thalwegCond.tif -ad8 $outputHucDataDir/flowaccum_d8_burned_filled.tif -src $outputHucDataDir/demDerived_streamPixels.tif -ord $outputHucDataDir/streamOrder.tif -tree $outputHucDataDir/treeFile.txt -coord $outputHucDataDir/coordFile.txt -w $outputHucDataDir/sn_catchments_reaches.tif -net $outputHucDataDir/demDerived_reaches.shp
+  step_end streamnet
+fi
 Tcount
 
 ## SPLIT DERIVED REACHES ##
 echo -e $startDiv"Split Derived Reaches $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/demDerived_reaches_split.gpkg ] && \
-$srcDir/split_flows.py $outputHucDataDir/demDerived_reaches.shp $outputHucDataDir/dem_thalwegCond.tif $outputHucDataDir/demDerived_reaches_split.gpkg $outputHucDataDir/demDerived_reaches_split_points.gpkg $outputHucDataDir/wbd8_clp.gpkg $outputHucDataDir/nwm_lakes_proj_subset.gpkg
+# FR seeds are written as a raster on the DEM grid; MS flow directions are cropped to the stream buffer, so MS seeds stay points
+if [ "$extent" = "MS" ]; then
+  split_points=$outputHucDataDir/demDerived_reaches_split_points.gpkg
+  gw_reaches_seeds="-p $split_points"
+else
+  split_points=$outputHucDataDir/demDerived_reaches_split_points.tif
+  gw_reaches_seeds="-s $split_points"
+fi
+if step_begin split_reaches $outputHucDataDir/demDerived_reaches_split.gpkg $split_points; then
+  $srcDir/split_flows.py $outputHucDataDir/demDerived_reaches.shp $outputHucDataDir/dem_thalwegCond.tif $outputHucDataDir/demDerived_reaches_split.gpkg $split_points $outputHucDataDir/wbd8_clp.gpkg $outputHucDataDir/nwm_lakes_proj_subset.gpkg
+  step_end split_reaches
+fi
 Tcount
 
 if [[ ! -f $outputHucDataDir/demDerived_reaches_split.gpkg ]] ; then
@@ -243,7 +311,10 @@ if [ "$extent" = "MS" ]; then
   echo -e $startDiv"Mask Rasters with Stream Buffer $hucNumber"$stopDiv
   date -u
   Tstart
-  $srcDir/fr_to_ms_raster_mask.py $outputHucDataDir/demDerived_reaches_split.gpkg $outputHucDataDir/flowdir_d8_burned_filled.tif $outputHucDataDir/dem_thalwegCond.tif $outputHucDataDir/slopes_d8_dem_meters.tif $outputHucDataDir/flowdir_d8_MS.tif $outputHucDataDir/dem_thalwegCond_MS.tif $outputHucDataDir/slopes_d8_dem_metersMS.tif $outputHucDataDir/demDerived_streamPixels.tif $outputHucDataDir/demDerived_streamPixelsMS.tif
+  if step_begin ms_raster_mask $outputHucDataDir/flowdir_d8_MS.tif $outputHucDataDir/dem_thalwegCond_MS.tif $outputHucDataDir/slopes_d8_dem_metersMS.tif $outputHucDataDir/demDerived_streamPixelsMS.tif; then
+    $srcDir/fr_to_ms_raster_mask.py $outputHucDataDir/demDerived_reaches_split.gpkg $outputHucDataDir/flowdir_d8_burned_filled.tif $outputHucDataDir/dem_thalwegCond.tif $outputHucDataDir/slopes_d8_dem_meters.tif $outputHucDataDir/flowdir_d8_MS.tif $outputHucDataDir/dem_thalwegCond_MS.tif $outputHucDataDir/slopes_d8_dem_metersMS.tif $outputHucDataDir/demDerived_streamPixels.tif $outputHucDataDir/demDerived_streamPixelsMS.tif
+    step_end ms_raster_mask
+  fi
   Tcount
 
   if [[ ! -f $outputHucDataDir/dem_thalwegCond_MS.tif ]] ; then
@@ -267,32 +338,31 @@ fi
 echo -e $startDiv"Gage Watershed for Reaches $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/gw_catchments_reaches.tif ] && \
-mpiexec -n $ncores_gw $taudemDir/gagewatershed -p $flowdir_d8_burned_filled -gw $outputHucDataDir/gw_catchments_reaches.tif -o $outputHucDataDir/demDerived_reaches_split_points.gpkg -id $outputHucDataDir/idFile.txt
-Tcount
-
-## VECTORIZE FEATURE ID CENTROIDS ##
-echo -e $startDiv"Vectorize Pixel Centroids $hucNumber"$stopDiv
-date -u
-Tstart
-[ ! -f $outputHucDataDir/flows_points_pixels.gpkg ] && \
-$srcDir/reachID_grid_to_vector_points.py $demDerived_streamPixels $outputHucDataDir/flows_points_pixels.gpkg featureID
+if step_begin gw_reaches $outputHucDataDir/gw_catchments_reaches.tif; then
+  $srcDir/gage_watershed.py -f $flowdir_d8_burned_filled $gw_reaches_seeds -o $outputHucDataDir/gw_catchments_reaches.tif -j $ncores_gw
+  step_end gw_reaches
+fi
 Tcount
 
 ## GAGE WATERSHED FOR PIXELS ##
 echo -e $startDiv"Gage Watershed for Pixels $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/gw_catchments_pixels.tif ] && \
-mpiexec -n $ncores_gw $taudemDir/gagewatershed -p $flowdir_d8_burned_filled -gw $outputHucDataDir/gw_catchments_pixels.tif -o $outputHucDataDir/flows_points_pixels.gpkg -id $outputHucDataDir/idFile.txt
+if step_begin gw_pixels $outputHucDataDir/gw_catchments_pixels.tif; then
+  # every stream pixel is a gage, numbered 1..N in row-major order (formerly the featureID points of reachID_grid_to_vector_points.py)
+  $srcDir/gage_watershed.py -f $flowdir_d8_burned_filled -s $demDerived_streamPixels -n -o $outputHucDataDir/gw_catchments_pixels.tif -j $ncores_gw
+  step_end gw_pixels
+fi
 Tcount
 
 # D8 REM ##
 echo -e $startDiv"D8 REM $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/rem.tif ] && \
-$srcDir/rem.py -d $dem_thalwegCond -w $outputHucDataDir/gw_catchments_pixels.tif -o $outputHucDataDir/rem.tif -t $demDerived_streamPixels -i $outputHucDataDir/gw_catchments_reaches.tif -s $outputHucDataDir/demDerived_reaches_split.gpkg
+if step_begin rem $outputHucDataDir/rem.tif; then
+  $srcDir/rem.py -d $dem_thalwegCond -w $outputHucDataDir/gw_catchments_pixels.tif -o $outputHucDataDir/rem.tif -t $demDerived_streamPixels -i $outputHucDataDir/gw_catchments_reaches.tif -s $outputHucDataDir/demDerived_reaches_split.gpkg
+  step_end rem
+fi
 Tcount
 
 ## DINF DISTANCE DOWN ##
@@ -307,24 +377,30 @@ Tcount
 echo -e $startDiv"Zero out negative values in distance down grid $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/rem_zeroed.tif ] && \
-gdal_calc.py --quiet --type=Float32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $outputHucDataDir/rem.tif --calc="(A*(A>=0))" --NoDataValue=$ndv --outfile=$outputHucDataDir/"rem_zeroed.tif"
+if step_begin rem_zeroed $outputHucDataDir/rem_zeroed.tif; then
+  gdal_calc.py --quiet --type=Float32 --overwrite "${intermediate_calc_co[@]}" -A $outputHucDataDir/rem.tif --calc="(A*(A>=0))" --NoDataValue=$ndv --outfile=$outputHucDataDir/"rem_zeroed.tif"
+  step_end rem_zeroed
+fi
 Tcount
 
 ## POLYGONIZE REACH WATERSHEDS ##
 echo -e $startDiv"Polygonize Reach Watersheds $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/gw_catchments_reaches.gpkg ] && \
-gdal_polygonize.py -8 -f GPKG $outputHucDataDir/gw_catchments_reaches.tif $outputHucDataDir/gw_catchments_reaches.gpkg catchments HydroID
+if step_begin polygonize_reaches $outputHucDataDir/gw_catchments_reaches.gpkg; then
+  gdal_polygonize.py -8 -f GPKG $outputHucDataDir/gw_catchments_reaches.tif $outputHucDataDir/gw_catchments_reaches.gpkg catchments HydroID
+  step_end polygonize_reaches
+fi
 Tcount
 
 ## PROCESS CATCHMENTS AND MODEL STREAMS STEP 1 ##
 echo -e $startDiv"Process catchments and model streams step 1 $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg ] && \
-$srcDir/filter_catchments_and_add_attributes.py $outputHucDataDir/gw_catchments_reaches.gpkg $outputHucDataDir/demDerived_reaches_split.gpkg $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg $outputHucDataDir/demDerived_reaches_split_filtered.gpkg $outputHucDataDir/wbd8_clp.gpkg $hucNumber
+if step_begin filter_catchments $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg $outputHucDataDir/demDerived_reaches_split_filtered.gpkg; then
+  $srcDir/filter_catchments_and_add_attributes.py $outputHucDataDir/gw_catchments_reaches.gpkg $outputHucDataDir/demDerived_reaches_split.gpkg $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg $outputHucDataDir/demDerived_reaches_split_filtered.gpkg $outputHucDataDir/wbd8_clp.gpkg $hucNumber
+  step_end filter_catchments
+fi
 
 if [[ ! -f $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg ]] ; then
   echo "No relevant streams within HUC $hucNumber boundaries. Aborting run_by_unit.sh"
@@ -340,74 +416,85 @@ Tstart
 read fsize ncols nrows ndv_clipped xmin ymin xmax ymax cellsize_resx cellsize_resy<<<$($srcDir/getRasterInfoNative.py $outputHucDataDir/gw_catchments_reaches.tif)
 Tcount
 
-## RASTERIZE NEW CATCHMENTS AGAIN ##
-echo -e $startDiv"Rasterize filtered catchments $hucNumber"$stopDiv
+## RASTERIZE NEW CATCHMENTS AGAIN AND LANDSEA (OCEAN AREA) POLYGON (IF APPLICABLE) ##
+echo -e $startDiv"Rasterize filtered catchments and filtered/dissolved ocean/Glake polygon $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif ] && \
-gdal_rasterize -ot Int32 -a HydroID -a_nodata 0 -init 0 -co "COMPRESS=LZW" -co "BIGTIFF=YES" -co "TILED=YES" -te $xmin $ymin $xmax $ymax -ts $ncols $nrows $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif
-Tcount
-
-## RASTERIZE LANDSEA (OCEAN AREA) POLYGON (IF APPLICABLE) ##
-echo -e $startDiv"Rasterize filtered/dissolved ocean/Glake polygon $hucNumber"$stopDiv
-date -u
-Tstart
-[ -f $outputHucDataDir/LandSea_subset.gpkg ] && [ ! -f $outputHucDataDir/LandSea_subset.tif ] && \
-gdal_rasterize -ot Int32 -burn $ndv -a_nodata $ndv -init 1 -co "COMPRESS=LZW" -co "BIGTIFF=YES" -co "TILED=YES" -te $xmin $ymin $xmax $ymax -ts $ncols $nrows $outputHucDataDir/LandSea_subset.gpkg $outputHucDataDir/LandSea_subset.tif
+if step_begin rasterize_filtered_catchments $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif $outputHucDataDir/LandSea_subset.tif; then
+  $srcDir/rasterize_layers.py -g $outputHucDataDir/gw_catchments_reaches.tif \
+    -l "vector=$outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg,output=$outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif,attribute=HydroID,dtype=int32,nodata=0,init=0" \
+    -l "vector=$outputHucDataDir/LandSea_subset.gpkg,output=$outputHucDataDir/LandSea_subset.tif,burn=$ndv,dtype=int32,nodata=$ndv,init=1"
+  step_end rasterize_filtered_catchments
+fi
 Tcount
 
 ## MASK SLOPE RASTER ##
 echo -e $startDiv"Masking Slope Raster to HUC $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/slopes_d8_dem_meters_masked.tif ] && \
-gdal_calc.py --quiet --type=Float32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $slopes_d8_dem_meters -B $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif --calc="(A*(B>0))+((B<=0)*-1)" --NoDataValue=-1 --outfile=$outputHucDataDir/"slopes_d8_dem_meters_masked.tif"
+if step_begin mask_slopes $outputHucDataDir/slopes_d8_dem_meters_masked.tif; then
+  gdal_calc.py --quiet --type=Float32 --overwrite "${intermediate_calc_co[@]}" -A $slopes_d8_dem_meters -B $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif --calc="(A*(B>0))+((B<=0)*-1)" --NoDataValue=-1 --outfile=$outputHucDataDir/"slopes_d8_dem_meters_masked.tif"
+  step_end mask_slopes
+fi
 Tcount
 
-## MASK REM RASTER ##
-echo -e $startDiv"Masking REM Raster to HUC $hucNumber"$stopDiv
-date -u
-Tstart
-[ ! -f $outputHucDataDir/rem_zeroed_masked.tif ] && \
-gdal_calc.py --quiet --type=Float32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $outputHucDataDir/rem_zeroed.tif -B $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif --calc="(A*(B>0))" --NoDataValue=$ndv --outfile=$outputHucDataDir/"rem_zeroed_masked.tif"
-Tcount
+# the ocean/Glake masking rewrites rem_zeroed_masked.tif, so both masks are one step and rerun together
+if step_begin mask_rem $outputHucDataDir/rem_zeroed_masked.tif; then
+  ## MASK REM RASTER ##
+  echo -e $startDiv"Masking REM Raster to HUC $hucNumber"$stopDiv
+  date -u
+  Tstart
+  gdal_calc.py --quiet --type=Float32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $outputHucDataDir/rem_zeroed.tif -B $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif --calc="(A*(B>0))" --NoDataValue=$ndv --outfile=$outputHucDataDir/"rem_zeroed_masked.tif"
+  Tcount
 
-## MASK REM RASTER TO REMOVE OCEAN AREAS ##
-echo -e $startDiv"Additional masking to REM raster to remove ocean/Glake areas in HUC $hucNumber"$stopDiv
-date -u
-Tstart
-[ -f $outputHucDataDir/LandSea_subset.tif ] && \
-gdal_calc.py --quiet --type=Float32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $outputHucDataDir/rem_zeroed_masked.tif -B $outputHucDataDir/LandSea_subset.tif --calc="(A*B)" --NoDataValue=$ndv --outfile=$outputHucDataDir/"rem_zeroed_masked.tif"
-Tcount
+  ## MASK REM RASTER TO REMOVE OCEAN AREAS ##
+  echo -e $startDiv"Additional masking to REM raster to remove ocean/Glake areas in HUC $hucNumber"$stopDiv
+  date -u
+  Tstart
+  [ -f $outputHucDataDir/LandSea_subset.tif ] && \
+  gdal_calc.py --quiet --type=Float32 --overwrite --co "COMPRESS=LZW" --co "BIGTIFF=YES" --co "TILED=YES" -A $outputHucDataDir/rem_zeroed_masked.tif -B $outputHucDataDir/LandSea_subset.tif --calc="(A*B)" --NoDataValue=$ndv --outfile=$outputHucDataDir/"rem_zeroed_masked.tif"
+  Tcount
+  step_end mask_rem
+fi
 
 ## MAKE CATCHMENT AND STAGE FILES ##
 echo -e $startDiv"Generate Catchment List and Stage List Files $hucNumber"$stopDiv
 date -u
 Tstart
-$srcDir/make_stages_and_catchlist.py $outputHucDataDir/demDerived_reaches_split_filtered.gpkg $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg $outputHucDataDir/stage.txt $outputHucDataDir/catchment_list.txt $stage_min_meters $stage_interval_meters $stage_max_meters
+if step_begin stages_catchlist $outputHucDataDir/stage.txt $outputHucDataDir/catchment_list.txt; then
+  $srcDir/make_stages_and_catchlist.py $outputHucDataDir/demDerived_reaches_split_filtered.gpkg $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg $outputHucDataDir/stage.txt $outputHucDataDir/catchment_list.txt $stage_min_meters $stage_interval_meters $stage_max_meters
+  step_end stages_catchlist
+fi
 Tcount
 
 ## HYDRAULIC PROPERTIES ##
 echo -e $startDiv"Hydraulic Properties $hucNumber"$stopDiv
 date -u
 Tstart
-[ ! -f $outputHucDataDir/src_base.csv ] && \
-$taudemDir/catchhydrogeo -hand $outputHucDataDir/rem_zeroed_masked.tif -catch $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif -catchlist $outputHucDataDir/catchment_list.txt -slp $outputHucDataDir/slopes_d8_dem_meters_masked.tif -h $outputHucDataDir/stage.txt -table $outputHucDataDir/src_base.csv
+if step_begin hydraulic_properties $outputHucDataDir/src_base.csv; then
+  $srcDir/catchment_hydraulic_geometry.py -r $outputHucDataDir/rem_zeroed_masked.tif -c $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif -l $outputHucDataDir/catchment_list.txt -s $outputHucDataDir/slopes_d8_dem_meters_masked.tif -t $outputHucDataDir/stage.txt -o $outputHucDataDir/src_base.csv
+  step_end hydraulic_properties
+fi
 Tcount
 
 ## FINALIZE CATCHMENTS AND MODEL STREAMS ##
 echo -e $startDiv"Finalize catchments and model streams $hucNumber"$stopDiv output_bathy_thalweg_fileName,output_bathy_xs_lookup_fileName,
 date -u
 Tstart
-[ ! -f $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes_crosswalked.gpkg ] && \
-$srcDir/add_crosswalk.py -d $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg -a $outputHucDataDir/demDerived_reaches_split_filtered.gpkg -s $outputHucDataDir/src_base.csv -u $inputDataDir/bathymetry/BANKFULL_CONUS.txt -v $outputHucDataDir/bathy_crosswalk_calcs.csv -e $outputHucDataDir/bathy_stream_order_calcs.csv -g $outputHucDataDir/bathy_thalweg_flag.csv -i $outputHucDataDir/bathy_xs_area_hydroid_lookup.csv -l $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes_crosswalked.gpkg -f $outputHucDataDir/demDerived_reaches_split_filtered_addedAttributes_crosswalked.gpkg -r $outputHucDataDir/src_full_crosswalked.csv -j $outputHucDataDir/src.json -x $outputHucDataDir/crosswalk_table.csv -t $outputHucDataDir/hydroTable.csv -w $outputHucDataDir/wbd8_clp.gpkg -b $outputHucDataDir/nwm_subset_streams.gpkg -y $outputHucDataDir/nwm_catchments_proj_subset.tif -m $manning_n -z $input_nwm_catchments -p $extent -k $outputHucDataDir/small_segments.csv
+if step_begin add_crosswalk $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes_crosswalked.gpkg $outputHucDataDir/demDerived_reaches_split_filtered_addedAttributes_crosswalked.gpkg $outputHucDataDir/src_full_crosswalked.csv $outputHucDataDir/src.json $outputHucDataDir/crosswalk_table.csv $outputHucDataDir/hydroTable.csv $outputHucDataDir/small_segments.csv; then
+  $srcDir/add_crosswalk.py -d $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.gpkg -a $outputHucDataDir/demDerived_reaches_split_filtered.gpkg -s $outputHucDataDir/src_base.csv -u $inputDataDir/bathymetry/BANKFULL_CONUS.txt -v $outputHucDataDir/bathy_crosswalk_calcs.csv -e $outputHucDataDir/bathy_stream_order_calcs.csv -g $outputHucDataDir/bathy_thalweg_flag.csv -i $outputHucDataDir/bathy_xs_area_hydroid_lookup.csv -l $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes_crosswalked.gpkg -f $outputHucDataDir/demDerived_reaches_split_filtered_addedAttributes_crosswalked.gpkg -r $outputHucDataDir/src_full_crosswalked.csv -j $outputHucDataDir/src.json -x $outputHucDataDir/crosswalk_table.csv -t $outputHucDataDir/hydroTable.csv -w $outputHucDataDir/wbd8_clp.gpkg -b $outputHucDataDir/nwm_subset_streams.gpkg -y $outputHucDataDir/nwm_catchments_proj_subset.tif -n $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes.tif -m $manning_n -z $input_nwm_catchments -p $extent -k $outputHucDataDir/small_segments.csv
+  step_end add_crosswalk
+fi
 Tcount
 
 ## USGS CROSSWALK ##
 echo -e $startDiv"USGS Crosswalk $hucNumber"$stopDiv
 date -u
 Tstart
-$srcDir/usgs_gage_crosswalk.py -gages $inputDataDir/usgs_gages/usgs_gages.gpkg -dem $outputHucDataDir/dem_meters.tif -flows $outputHucDataDir/demDerived_reaches_split_filtered_addedAttributes_crosswalked.gpkg -cat $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes_crosswalked.gpkg -wbd $outputHucDataDir/wbd_buffered.gpkg -dem_adj $dem_thalwegCond -outtable $outputHucDataDir/usgs_elev_table.csv -e $extent
+if step_begin usgs_crosswalk $outputHucDataDir/usgs_elev_table.csv; then
+  $srcDir/usgs_gage_crosswalk.py -gages $inputDataDir/usgs_gages/usgs_gages.gpkg -dem $outputHucDataDir/dem_meters.tif -flows $outputHucDataDir/demDerived_reaches_split_filtered_addedAttributes_crosswalked.gpkg -cat $outputHucDataDir/gw_catchments_reaches_filtered_addedAttributes_crosswalked.gpkg -wbd $outputHucDataDir/wbd_buffered.gpkg -dem_adj $dem_thalwegCond -outtable $outputHucDataDir/usgs_elev_table.csv -e $extent
+  step_end usgs_crosswalk
+fi
 Tcount
 
 ## CLEANUP OUTPUTS ##
@@ -418,5 +505,8 @@ args=()
 (( viz == 1 )) && args+=( '-v' )
 date -u
 Tstart
-$srcDir/output_cleanup.py $hucNumber $outputHucDataDir "${args[@]}"
+if step_begin cleanup; then
+  $srcDir/output_cleanup.py $hucNumber $outputHucDataDir "${args[@]}"
+  step_end cleanup
+fi
 Tcount
@@ -6,25 +6,82 @@ Description:
     2) calculate channel slope, manning's n, and LengthKm for each segment
     3) create unique ids using HUC8 boundaries (and unique FIM_ID column)
     4) create network traversal attribute columns (To_Node, From_Node, NextDownID)
-    5) create points layer with segment verticies encoded with HydroID's (used for catchment delineation in next step)
+    5) create points layer with segment verticies encoded with HydroID's (used for catchment delineation in next step),
+       or a seed raster of them on the DEM grid when the split points file is a .tif
 '''
 
 import sys
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point, LineString, MultiPoint
+from shapely.geometry import LineString, MultiPoint
 import rasterio
 import numpy as np
+from numba import njit
 import argparse
 from tqdm import tqdm
 import time
-from os.path import isfile
+from os.path import isfile, splitext
 from os import remove,environ
-from collections import OrderedDict
 import build_stream_traversal
-from utils.shared_functions import getDriver
+from utils.shared_functions import getDriver, intermediate_raster_profile
+from utils.point_sampling import sample_points, xy_to_rowcol
+from utils.line_splitting import split_line
 from utils.shared_variables import FIM_ID
 
+
+@njit
+def resolve_split_point_ids(vertex_points, hydro_ids, next_down_ids, number_of_points):
+    """
+    HydroID of each split point from its occurrences sorted by point (segment order within a point). The first
+    segment through a vertex sets it, and each later segment replaces it unless it flows into the current one.
+
+    """
+
+    point_ids = np.empty(number_of_points, dtype=np.int64)
+    for k in range(len(vertex_points)):
+        point = vertex_points[k]
+        if k == 0 or vertex_points[k - 1] != point or next_down_ids[k] != point_ids[point]:
+            point_ids[point] = hydro_ids[k]
+
+    return(point_ids)
+
+
+def write_split_point_seeds(xs, ys, ids, dem, seeds_fileName):
+    """
+    Writes the split points as a seed raster of HydroIDs on the DEM grid (0 elsewhere), as gage_watershed.py places
+    the points of the split points layer. The last point of a cell is kept.
+
+    """
+
+    profile = dem.profile.copy()
+    profile.update(driver='GTiff', count=1, dtype='int32', nodata=0)
+    profile.update(intermediate_raster_profile())
+
+    rows, cols = xy_to_rowcol(dem.transform, xs, ys)
+    inside = (rows >= 0) & (rows < dem.height) & (cols >= 0) & (cols < dem.width)
+    cells = rows[inside] * dem.width + cols[inside]
+    ids = ids[inside]
+
+    # last point of each cell
+    cells, last = np.unique(cells[::-1], return_index=True)
+    ids = ids[::-1][last]
+    rows, cols = cells // dem.width, cells % dem.width
+
+    # points sorted by output block
+    blocks_per_row = -(-dem.width // profile['blockxsize'])
+    blocks = (rows // profile['blockysize']) * blocks_per_row + cols // profile['blockxsize']
+    order = np.argsort(blocks, kind='stable')
+    rows, cols, ids, blocks = rows[order], cols[order], ids[order], blocks[order]
+
+    with rasterio.open(seeds_fileName, 'w', **profile) as seeds:
+        for (block_row, block_col), window in seeds.block_windows(1):
+            block = block_row * blocks_per_row + block_col
+            first, stop = np.searchsorted(blocks, [block, block + 1])
+            seeds_window = np.zeros((window.height, window.width), dtype=np.int32)
+            seeds_window[rows[first:stop] - window.row_off, cols[first:stop] - window.col_off] = ids[first:stop]
+            seeds.write(seeds_window, indexes=1, window=window)
+
+
 flows_fileName         = sys.argv[1]
 dem_fileName           = sys.argv[2]
 split_flows_fileName   = sys.argv[3]
@@ -61,8 +118,6 @@ flows = flows.explode()
 # temp
 flows = flows.to_crs(wbd8.crs)
 
-split_flows = []
-slopes = []
 hydro_id = 'HydroID'
 
 # split at HUC8 boundaries
@@ -85,6 +140,8 @@ print ('splitting ' + str(len(flows)) + ' stream segments based on ' + str(max_l
 # remove empty geometries
 flows = flows.loc[~flows.is_empty,:]
 
+split_flows = []
+split_lengths = []
 for i,lineString in tqdm(enumerate(flows.geometry),total=len(flows.geometry)):
     # Reverse geometry order (necessary for BurnLines)
     lineString = LineString(lineString.coords[::-1])
@@ -95,71 +152,25 @@ for i,lineString in tqdm(enumerate(flows.geometry),total=len(flows.geometry)):
 
     # existing reaches of less than max_length
     if lineString.length < max_length:
-        split_flows = split_flows + [lineString]
-        line_points = [point for point in zip(*lineString.coords.xy)]
-
-        # Calculate channel slope
-        start_point = line_points[0]; end_point = line_points[-1]
-        start_elev,end_elev = [i[0] for i in rasterio.sample.sample_gen(dem,[start_point,end_point])]
-        slope = float(abs(start_elev - end_elev) / lineString.length)
-        if slope < slope_min:
-            slope = slope_min
-        slopes = slopes + [slope]
+        split_flows.append(lineString)
+        split_lengths.append(lineString.length)
         continue
 
     splitLength = lineString.length / np.ceil(lineString.length / max_length)
 
-    cumulative_line = []
-    line_points = []
-    last_point = []
-
-    last_point_in_entire_lineString = list(zip(*lineString.coords.xy))[-1]
-
-    for point in zip(*lineString.coords.xy):
-
-        cumulative_line = cumulative_line + [point]
-        line_points = line_points + [point]
-        numberOfPoints_in_cumulative_line = len(cumulative_line)
-
-        if last_point:
-            cumulative_line = [last_point] + cumulative_line
-            numberOfPoints_in_cumulative_line = len(cumulative_line)
-        elif numberOfPoints_in_cumulative_line == 1:
-            continue
-
-        cumulative_length = LineString(cumulative_line).length
-
-        if cumulative_length >= splitLength:
-
-            splitLineString = LineString(cumulative_line)
-            split_flows = split_flows + [splitLineString]
+    for splitLineString, length in zip(*split_line(lineString, splitLength)):
+        split_flows.append(splitLineString)
+        split_lengths.append(length)
 
-            # Calculate channel slope
-            start_point = cumulative_line[0]; end_point = cumulative_line[-1]
-            start_elev,end_elev = [i[0] for i in rasterio.sample.sample_gen(dem,[start_point,end_point])]
-            slope = float(abs(start_elev - end_elev) / splitLineString.length)
-            if slope < slope_min:
-                slope = slope_min
-            slopes = slopes + [slope]
-
-            last_point = end_point
-
-            if (last_point == last_point_in_entire_lineString):
-                continue
-
-            cumulative_line = []
-            line_points = []
-
-    splitLineString = LineString(cumulative_line)
-    split_flows = split_flows + [splitLineString]
-
-    # Calculate channel slope
-    start_point = cumulative_line[0]; end_point = cumulative_line[-1]
-    start_elev,end_elev = [i[0] for i in rasterio.sample.sample_gen(dem,[start_point,end_point])]
-    slope = float(abs(start_elev - end_elev) / splitLineString.length)
+# Calculate channel slope from the start and end elevations of all segments at once
+end_points = np.array([[lineString.coords[0][:2], lineString.coords[-1][:2]] for lineString in split_flows]).reshape(-1, 2)
+elevations = sample_points(dem, end_points[:, 0], end_points[:, 1])
+slopes = []
+for start_elev, end_elev, length in zip(elevations[0::2], elevations[1::2], split_lengths):
+    slope = float(abs(start_elev - end_elev) / length)
     if slope < slope_min:
         slope = slope_min
-    slopes = slopes + [slope]
+    slopes.append(slope)
 
 split_flows_gdf = gpd.GeoDataFrame({'S0' : slopes ,'geometry':split_flows}, crs=flows.crs, geometry='geometry')
 split_flows_gdf['LengthKm'] = split_flows_gdf.geometry.length * toMetersConversion
@@ -189,24 +200,22 @@ else:
 #hydroIDs_points = [hidp for hidp in outlet.values()]
 #split_points = [Point(*point) for point in outlet]
 
-# Get all vertices
-split_points = OrderedDict()
-for row in split_flows_gdf[['geometry',hydro_id, 'NextDownID']].iterrows():
-    lineString = row[1][0]
+# Get all vertices, in order of first appearance, with the HydroID resolved over the segments sharing them
+vertex_coords = [np.array(lineString.coords)[:, :2] for lineString in split_flows_gdf.geometry]
+vertices = np.concatenate(vertex_coords)
+vertex_segments = np.repeat(np.arange(len(vertex_coords)), [len(coords) for coords in vertex_coords])
 
-    for point in zip(*lineString.coords.xy):
-        if point in split_points:
-            if row[1][2] == split_points[point]:
-                pass
-            else:
-                split_points[point] = row[1][1]
-        else:
-            split_points[point] = row[1][1]
+_, first_index, vertex_points = np.unique(vertices, axis=0, return_index=True, return_inverse=True)
+vertex_points = vertex_points.reshape(-1)
+occurrences = np.argsort(vertex_points, kind='stable')
+point_hydroIDs = resolve_split_point_ids(vertex_points[occurrences],
+                                         split_flows_gdf[hydro_id].values.astype(np.int64)[vertex_segments[occurrences]],
+                                         split_flows_gdf['NextDownID'].values.astype(np.int64)[vertex_segments[occurrences]],
+                                         len(first_index))
 
-hydroIDs_points = [hidp for hidp in split_points.values()]
-split_points = [Point(*point) for point in split_points]
-
-split_points_gdf = gpd.GeoDataFrame({'id': hydroIDs_points , 'geometry':split_points}, crs=flows.crs, geometry='geometry')
+appearance = np.argsort(first_index)
+split_points_xy = vertices[first_index[appearance]]
+hydroIDs_points = point_hydroIDs[appearance]
 
 print('Writing outputs ...')
 
@@ -216,4 +225,8 @@ split_flows_gdf.to_file(split_flows_fileName,driver=getDriver(split_flows_fileNa
 
 if isfile(split_points_fileName):
     remove(split_points_fileName)
-split_points_gdf.to_file(split_points_fileName,driver=getDriver(split_points_fileName),index=False)
+if splitext(split_points_fileName)[1] == '.tif':
+    write_split_point_seeds(split_points_xy[:, 0], split_points_xy[:, 1], hydroIDs_points, dem, split_points_fileName)
+else:
+    split_points_gdf = gpd.GeoDataFrame({'id': hydroIDs_points}, geometry=gpd.points_from_xy(split_points_xy[:, 0], split_points_xy[:, 1]), crs=flows.crs)
+    split_points_gdf.to_file(split_points_fileName,driver=getDriver(split_points_fileName),index=False)
@@ -7,11 +7,12 @@ Created on Fri Oct 16 07:51:56 2020
 import rasterio
 import numpy as np
 import argparse
-from r_grow_distance import r_grow_distance
+from grow_distance import grow_distance
+from utils.shared_functions import intermediate_raster_profile
 
-def stream_pixel_zones(stream_pixels, unique_stream_pixels, grass_workspace):
+def stream_pixel_zones(stream_pixels, unique_stream_pixels):
     '''
-    This function will assign a unique ID for each stream pixel and writes to file. It then uses this raster to run GRASS r.grow.distance tool to create the allocation and proximity rasters required to complete the lateral thalweg conditioning. 
+    This function will assign a unique ID for each stream pixel and writes to file. It then uses this raster to run grow_distance (native r.grow.distance) to create the allocation and proximity rasters required to complete the lateral thalweg conditioning. 
     
     Parameters
     ----------
@@ -19,8 +20,6 @@ def stream_pixel_zones(stream_pixels, unique_stream_pixels, grass_workspace):
         Path to stream raster with value of 1. For example, demDerived_streamPixels.tif.
     unique_stream_pixels : STR
         Output path of raster containing unique ids for each stream pixel.
-    grass_workspace : STR
-        Path to temporary GRASS directory which is deleted.
 
     Returns
     -------
@@ -36,22 +35,21 @@ def stream_pixel_zones(stream_pixels, unique_stream_pixels, grass_workspace):
         streams_profile = temp.profile
         streams = temp.read(1)  
     
-    # Create array that matches shape of streams raster with unique values for each cell. Dataype is float64.
-    unique_vals = np.arange(streams.size, dtype = 'float64').reshape(*streams.shape)
+    # Number the stream pixels contiguously from 1 in row-major order (0 elsewhere). The ids index the zone arrays of
+    # adjust_thalweg_lateral.py, so they are int32 (an order preserving relabeling of the former cell indices).
+    stream_cells = (streams == 1)
+    stream_pixel_values = np.where(stream_cells, np.cumsum(stream_cells, dtype = 'int64').reshape(streams.shape), 0).astype('int32')
+
+    streams_profile.update(dtype = 'int32', nodata = 0)
+    streams_profile.update(intermediate_raster_profile())
 
-    # At streams return the unique array value otherwise return NODATA value from input streams layer. NODATA value for demDerived_streamPixels.tif is -32768.
-    stream_pixel_values = np.where(streams == 1, unique_vals, streams_profile['nodata'])
-    
-    # Reassign dtype to be float64 (needs to be float64)
-    streams_profile.update(dtype = 'float64')
-    
     # Output to raster 
     with rasterio.Env():
         with rasterio.open(unique_stream_pixels, 'w', **streams_profile) as raster:
             raster.write(stream_pixel_values,1)
     
-    # Compute allocation and proximity grid using r.grow.distance. Output distance grid in meters. Set datatype for output allocation (needs to be float64) and proximity grids (float32).
-    distance_grid, allocation_grid = r_grow_distance(unique_stream_pixels, grass_workspace, 'Float32', 'Float64')
+    # Compute allocation and proximity grid using grow_distance. Output distance grid in meters. Set datatype for output allocation (int32 stream pixel ids) and proximity grids (float32).
+    distance_grid, allocation_grid = grow_distance(unique_stream_pixels, 'Float32', 'Int32')
 
     return distance_grid, allocation_grid
 
@@ -61,7 +59,6 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description = 'Produce unique stream pixel values and allocation/proximity grids')
     parser.add_argument('-s', '--stream', help = 'raster to perform r.grow.distance', required = True)
     parser.add_argument('-o', '--out', help = 'output raster of unique ids for each stream pixel', required = True)
-    parser.add_argument('-g', '--grass_workspace', help = 'Temporary GRASS workspace', required = True)
 
     # Extract to dictionary and assign to variables.
     args = vars(parser.parse_args())
@@ -69,10 +66,9 @@ if __name__ == '__main__':
     # Rename variable inputs
     stream_pixels = args['stream']
     unique_stream_pixels = args['out']
-    grass_workspace = args['grass_workspace']
     
     # Run stream_pixel_zones
-    stream_pixel_zones(stream_pixels, unique_stream_pixels, grass_workspace)
+    stream_pixel_zones(stream_pixels, unique_stream_pixels)
 
 
 
@@ -7,7 +7,8 @@ import numpy as np
 import rasterio
 import argparse
 import pygeos
-from shapely.wkb import dumps, loads
+from shapely.wkb import dumps
+from utils.point_sampling import sample_points
 import warnings
 warnings.simplefilter("ignore")
 
@@ -32,6 +33,61 @@ warnings.simplefilter("ignore")
 '''
 
 
+def gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj):
+    '''
+    Snaps the gages to the stream of their catchment and samples the DEMs there. Returns the usgs_elev_table.csv rows,
+    in gage order.
+
+    Parameters
+    ----------
+    usgs_gages : geopandas.GeoDataFrame
+        Gages within a catchment.
+    closest_hydro_id : pandas.DataFrame
+        location_id, HydroID, thalweg elevations and order_ of the catchment of each gage.
+    input_flows : geopandas.GeoDataFrame
+        Streams with int HydroIDs.
+    dem_m, dem_adj : rasterio datasets
+        DEM and thalweg adjusted DEM.
+
+    '''
+
+    columns = ['location_id','HydroID','dem_elevation','dem_adj_elevation','min_thal_elev', 'med_thal_elev','max_thal_elev','str_order']
+
+    if len(usgs_gages) == 0:
+        return(pd.DataFrame(columns=columns))
+
+    # Get stream attributes of every gage (one catchment per gage)
+    if closest_hydro_id.location_id.duplicated().any():
+        raise ValueError('USGS gages within more than one catchment: {}'.format(list(closest_hydro_id.location_id[closest_hydro_id.location_id.duplicated()])))
+    gage_attributes = usgs_gages[['location_id']].merge(closest_hydro_id, on='location_id', how='left')
+
+    # Closest segment to each gage (HydroIDs are unique in the streams)
+    flow_rows = pd.Index(input_flows.HydroID.values.astype(np.float64)).get_indexer(gage_attributes.HydroID.values.astype(np.float64))
+    if (flow_rows < 0).any():
+        raise ValueError('No stream for HydroIDs {}'.format(list(gage_attributes.HydroID[flow_rows < 0])))
+
+    # Create pygeos gage and stream geometries from WKB representation
+    gage_bin_geom = pygeos.io.from_wkb(np.array([dumps(geometry) for geometry in usgs_gages.geometry], dtype=object))
+    stream_bin_geom = pygeos.io.from_wkb(np.array([dumps(input_flows.geometry.iloc[row]) for row in flow_rows], dtype=object))
+
+    # Linear reference all gages to their closest stream segment
+    gage_distance_to_line = pygeos.linear.line_locate_point(stream_bin_geom, gage_bin_geom)
+    referenced_gages = pygeos.linear.line_interpolate_point(stream_bin_geom, gage_distance_to_line)
+    referenced_x, referenced_y = pygeos.get_x(referenced_gages), pygeos.get_y(referenced_gages)
+
+    # Sample rasters at all adjusted gages at once
+    dem_m_elevs = sample_points(dem_m, referenced_x, referenced_y).tolist()
+    dem_adj_elevs = sample_points(dem_adj, referenced_x, referenced_y).tolist()
+
+    # Append hydro_id, and gage number to table
+    gage_data = [[str(location_id), str(hydro_id), round(dem_m_elev,2), round(dem_adj_elev,2), round(min_thal_elev,2), round(med_thal_elev,2), round(max_thal_elev,2), str(int(order))]
+                 for location_id, hydro_id, dem_m_elev, dem_adj_elev, min_thal_elev, med_thal_elev, max_thal_elev, order in
+                 zip(usgs_gages.location_id.tolist(), gage_attributes.HydroID.tolist(), dem_m_elevs, dem_adj_elevs, gage_attributes.min_thal_elev.tolist(),
+                     gage_attributes.med_thal_elev.tolist(), gage_attributes.max_thal_elev.tolist(), gage_attributes.order_.tolist())]
+
+    return(pd.DataFrame(gage_data, columns=columns))
+
+
 def crosswalk_usgs_gage(usgs_gages_filename,dem_filename,input_flows_filename,input_catchment_filename,wbd_buffer_filename,dem_adj_filename,output_table_filename,extent):
 
     wbd_buffer = gpd.read_file(wbd_buffer_filename)
@@ -59,50 +115,7 @@ def crosswalk_usgs_gage(usgs_gages_filename,dem_filename,input_flows_filename,in
     # Get USGS gages that are within catchment boundaries
     usgs_gages = usgs_gages.loc[usgs_gages.location_id.isin(list(closest_hydro_id.location_id))]
 
-    columns = ['location_id','HydroID','dem_elevation','dem_adj_elevation','min_thal_elev', 'med_thal_elev','max_thal_elev','str_order']
-    gage_data = []
-
-    # Move USGS gage to stream
-    for index, gage in usgs_gages.iterrows():
-
-        # Get stream attributes
-        hydro_id = closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].HydroID.item()
-        str_order = str(int(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].order_.item()))
-        min_thal_elev = round(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].min_thal_elev.item(),2)
-        med_thal_elev = round(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].med_thal_elev.item(),2)
-        max_thal_elev = round(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].max_thal_elev.item(),2)
-
-        # Convert headwater point geometries to WKB representation
-        wkb_gages = dumps(gage.geometry)
-
-        # Create pygeos headwater point geometries from WKB representation
-        gage_bin_geom = pygeos.io.from_wkb(wkb_gages)
-
-        # Closest segment to headwater
-        closest_stream = input_flows.loc[input_flows.HydroID==hydro_id]
-        wkb_closest_stream = dumps(closest_stream.geometry.item())
-        stream_bin_geom = pygeos.io.from_wkb(wkb_closest_stream)
-
-        # Linear reference headwater to closest stream segment
-        gage_distance_to_line = pygeos.linear.line_locate_point(stream_bin_geom, gage_bin_geom)
-        referenced_gage = pygeos.linear.line_interpolate_point(stream_bin_geom, gage_distance_to_line)
-
-        # Convert geometries to wkb representation
-        bin_referenced_gage = pygeos.io.to_wkb(referenced_gage)
-
-        # Convert to shapely geometries
-        shply_referenced_gage = loads(bin_referenced_gage)
-
-        # Sample rasters at adjusted gage
-        dem_m_elev = round(list(rasterio.sample.sample_gen(dem_m,shply_referenced_gage.coords))[0].item(),2)
-        dem_adj_elev = round(list(rasterio.sample.sample_gen(dem_adj,shply_referenced_gage.coords))[0].item(),2)
-
-        # Append dem_m_elev, dem_adj_elev, hydro_id, and gage number to table
-        site_elevations = [str(gage.location_id), str(hydro_id), dem_m_elev, dem_adj_elev, min_thal_elev, med_thal_elev, max_thal_elev,str(str_order)]
-        gage_data.append(site_elevations)
-
-
-    elev_table = pd.DataFrame(gage_data, columns=columns)
+    elev_table = gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj)
 
     if not elev_table.empty:
         elev_table.to_csv(output_table_filename,index=False)
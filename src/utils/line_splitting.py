@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from numba import njit
+from shapely.geometry import LineString
+
+
+@njit
+def split_line_indices(segment_lengths, split_length):
+    """
+    Start and end vertex indices and lengths of the segments of a line split at the first vertex where the cumulative
+    length of a segment reaches split_length. As the cumulative line loop this replaces, the last segment is repeated
+    when the line ends exactly at a split.
+
+    """
+
+    starts, ends, lengths = [0], [0], [0.0]
+    number_of_vertices = len(segment_lengths) + 1
+    start, length = 0, 0.0
+    for j in range(1, number_of_vertices):
+        length += segment_lengths[j - 1]
+        if length >= split_length:
+            starts.append(start); ends.append(j); lengths.append(length)
+            if j == number_of_vertices - 1:
+                starts.append(start); ends.append(j); lengths.append(length)
+                return(starts[1:], ends[1:], lengths[1:])
+            start, length = j, 0.0
+
+    starts.append(start); ends.append(number_of_vertices - 1); lengths.append(length)
+    return(starts[1:], ends[1:], lengths[1:])
+
+
+def split_line_coords(coords, start, end):
+    """ Coordinates of a split segment. Segments after the first repeat their start vertex once per added vertex, as the cumulative line loop did. """
+
+    if start == 0:
+        return(coords[:end + 1])
+
+    return(np.concatenate([np.repeat(coords[start:start + 1], end - start, axis=0), coords[start + 1:end + 1]]))
+
+
+def split_line_reference(lineString, splitLength):
+    """ Cumulative line loop, used for lines with a vertex before the end at the coordinates of the last vertex """
+
+    split_lines = []
+    cumulative_line = []
+    last_point = []
+
+    last_point_in_entire_lineString = list(zip(*lineString.coords.xy))[-1]
+
+    for point in zip(*lineString.coords.xy):
+
+        cumulative_line = cumulative_line + [point]
+        numberOfPoints_in_cumulative_line = len(cumulative_line)
+
+        if last_point:
+            cumulative_line = [last_point] + cumulative_line
+            numberOfPoints_in_cumulative_line = len(cumulative_line)
+        elif numberOfPoints_in_cumulative_line == 1:
+            continue
+
+        cumulative_length = LineString(cumulative_line).length
+
+        if cumulative_length >= splitLength:
+
+            split_lines.append(LineString(cumulative_line))
+
+            last_point = cumulative_line[-1]
+
+            if (last_point == last_point_in_entire_lineString):
+                continue
+
+            cumulative_line = []
+
+    split_lines.append(LineString(cumulative_line))
+
+    return(split_lines)
+
+
+def split_line(lineString, splitLength):
+    """
+    Splits a line into segments at the first vertex where the cumulative length of a segment reaches splitLength.
+    Returns the segments and their lengths, the same as split_line_reference and the LineString lengths of its output.
+
+    """
+
+    coords = np.array(lineString.coords)[:, :2]
+
+    # a vertex before the end at the coordinates of the last vertex stops the reset of the cumulative line (rare loops)
+    if (np.all(coords[:-1] == coords[-1], axis=1)).any():
+        split_lines = split_line_reference(lineString, splitLength)
+        return(split_lines, [splitLineString.length for splitLineString in split_lines])
+
+    # same floating point sum as the LineString lengths of the cumulative lines
+    segment_lengths = np.sqrt(np.diff(coords[:, 0])**2 + np.diff(coords[:, 1])**2)
+    starts, ends, lengths = split_line_indices(segment_lengths, splitLength)
+
+    return([LineString(split_line_coords(coords, start, end)) for start, end in zip(starts, ends)], list(lengths))
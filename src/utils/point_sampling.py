@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import sys
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+def xy_to_rowcol(transform, xs, ys):
+    ''' Vectorized rasterio.transform.rowcol (floor, same epsilon) for arrays of coordinates '''
+
+    eps = sys.float_info.epsilon
+    cols, rows = ~transform * (np.asarray(xs, dtype='float64') + eps, np.asarray(ys, dtype='float64') - eps)
+
+    return(np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64))
+
+
+class BlockSampler:
+
+    '''
+    Samples a raster band at arrays of points. Points are grouped by internal block and each block is read once. The
+    most recently used blocks are kept for later calls. Values match rasterio.sample.sample_gen: points off the raster
+    get the nodata value (0 without nodata).
+
+    Parameters
+    ----------
+    raster : str or rasterio dataset
+        Raster to sample. A filename is opened (and closed by close()).
+    band : int
+        Band to sample.
+    cache_blocks : int
+        Number of blocks kept in the LRU cache.
+
+    '''
+
+    def __init__(self, raster, band=1, cache_blocks=16):
+
+        self._owned = isinstance(raster, str)
+        self.dataset = rasterio.open(raster) if self._owned else raster
+        self.band = band
+        self.cache_blocks = cache_blocks
+        self.block_rows, self.block_cols = self.dataset.block_shapes[band - 1]
+        self.blocks_per_row = -(-self.dataset.width // self.block_cols)
+        self.dtype = self.dataset.dtypes[band - 1]
+        self.fill_value = self.dataset.nodata if self.dataset.nodata is not None else 0
+        self._cache = OrderedDict()
+
+
+    def _block(self, block):
+        ''' Values and offsets of an internal block, from the cache when possible '''
+
+        if block in self._cache:
+            self._cache.move_to_end(block)
+            return(self._cache[block])
+
+        row_off = (block // self.blocks_per_row) * self.block_rows
+        col_off = (block % self.blocks_per_row) * self.block_cols
+        window = Window(col_off, row_off, min(self.block_cols, self.dataset.width - col_off), min(self.block_rows, self.dataset.height - row_off))
+        self._cache[block] = (self.dataset.read(self.band, window=window), row_off, col_off)
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+
+        return(self._cache[block])
+
+
+    def sample(self, xs, ys):
+        '''
+        Returns the values at the points (x, y arrays in the raster CRS) as an array of the band dtype.
+
+        '''
+
+        values = np.full(len(xs), self.fill_value, dtype=self.dtype)
+        if len(xs) == 0:
+            return(values)
+
+        rows, cols = xy_to_rowcol(self.dataset.transform, xs, ys)
+        inside = np.flatnonzero((rows >= 0) & (rows < self.dataset.height) & (cols >= 0) & (cols < self.dataset.width))
+        if len(inside) == 0:
+            return(values)
+        blocks = (rows[inside] // self.block_rows) * self.blocks_per_row + cols[inside] // self.block_cols
+
+        # points sorted by block, one read per block
+        order = np.argsort(blocks, kind='stable')
+        inside, blocks = inside[order], blocks[order]
+        block_starts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]])
+        for start, stop in zip(block_starts, np.r_[block_starts[1:], len(blocks)]):
+            block_values, row_off, col_off = self._block(int(blocks[start]))
+            points = inside[start:stop]
+            values[points] = block_values[rows[points] - row_off, cols[points] - col_off]
+
+        return(values)
+
+
+    def close(self):
+        self._cache.clear()
+        if self._owned:
+            self.dataset.close()
+
+
+    def __enter__(self):
+        return(self)
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def sample_points(raster, xs, ys, band=1):
+    ''' Values of a raster band at arrays of points (see BlockSampler) '''
+
+    with BlockSampler(raster, band) as sampler:
+        return(sampler.sample(xs, ys))
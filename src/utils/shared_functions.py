@@ -14,6 +14,48 @@ def getDriver(fileName):
 
     return(driver)
 
+def intermediate_raster_profile():
+    """
+    This helper function returns the rasterio creation options used for intermediate (non deliverable) rasters.
+
+    The codec is set with the intermediate_compress environment variable (NONE, LZW, DEFLATE, ZSTD, LERC or LERC_ZSTD; default LZW)
+    and its level with intermediate_compress_level. LERC codecs use intermediate_max_z_error (default 0, lossless).
+
+    Returns:
+        profile (dict): Creation options to update a rasterio profile with.
+    """
+
+    compress = os.environ.get('intermediate_compress', 'LZW').upper()
+    level = os.environ.get('intermediate_compress_level', '')
+
+    profile = {'tiled' : True, 'blockxsize' : 512, 'blockysize' : 512, 'compress' : compress.lower()}
+
+    if level != '':
+        if compress in ('ZSTD', 'LERC_ZSTD'):
+            profile['zstd_level'] = int(level)
+        elif compress == 'DEFLATE':
+            profile['zlevel'] = int(level)
+
+    if compress.startswith('LERC'):
+        profile['max_z_error'] = float(os.environ.get('intermediate_max_z_error', 0))
+
+    return(profile)
+
+
+def intermediate_raster_creation_options():
+    """
+    This helper function returns the intermediate raster creation options as a list of GDAL KEY=VALUE strings (e.g. for r.out.gdal createopt).
+    """
+
+    creation_options = []
+    for key, value in intermediate_raster_profile().items():
+        if isinstance(value, bool):
+            value = 'YES' if value else 'NO'
+        creation_options.append('{}={}'.format(key.upper(), str(value).upper()))
+
+    return(creation_options)
+
+
 def pull_file(url, full_pulled_filepath):
     """
     This helper function pulls a file and saves it to a specified path.
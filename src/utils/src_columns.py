@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+
+def segments(keys):
+    '''
+    Groups rows by key as HydroID-style segments: returns the row positions sorted by key (table order within a key,
+    null keys left out), the unique keys and the offsets of their rows in the sorted positions.
+
+    '''
+
+    keys = np.asarray(keys)
+    positions = np.flatnonzero(~pd.isnull(keys))
+    positions = positions[np.argsort(keys[positions], kind='stable')]
+    sorted_keys = keys[positions]
+
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(sorted_keys) > 0 else np.zeros(0, dtype=np.int64)
+
+    return(positions, sorted_keys[starts], np.r_[starts, len(sorted_keys)].astype(np.int64))
+
+
+def key_rows(left_keys, right_keys):
+    ''' Row of each left key in the (unique) right keys, -1 where it is missing '''
+
+    left_keys, right_keys = np.asarray(left_keys), np.asarray(right_keys)
+    if left_keys.dtype != right_keys.dtype:
+        left_keys, right_keys = left_keys.astype(np.float64), right_keys.astype(np.float64)
+
+    return(pd.Index(right_keys).get_indexer(left_keys))
+
+
+def take_rows(values, rows):
+    ''' values[rows] with NaN at -1 rows (integer columns become float when any row is missing, as in a left merge) '''
+
+    return(pd.Series(values).reindex(rows).values)
+
+
+def left_join_columns(frame, right, on, columns):
+    '''
+    frame.merge(right[[on] + columns], how='left', on=on) with the right columns assigned through one index lookup
+    when the right keys are unique (the frame keeps its rows and gets a new RangeIndex, as with merge).
+
+    '''
+
+    right = right.loc[:, [on] + columns]
+    if frame[on].isnull().any() or not right[on].is_unique or any(column in frame.columns for column in columns):
+        return(frame.merge(right, how='left', on=on))
+
+    rows = key_rows(frame[on].values, right[on].values)
+
+    joined = frame.reset_index(drop=True)
+    for column in columns:
+        joined[column] = take_rows(right[column].values, rows)
+
+    return(joined)
+
+
+class SrcColumns(object):
+    '''
+    A synthetic rating curve table held as typed NumPy columns sorted by HydroID (table order within a HydroID). The
+    rows of the i-th HydroID are offsets[i]:offsets[i+1], so per-HydroID selections are segmented reductions over
+    contiguous rows. Columns are read and assigned in this sorted order; to_frame returns the table in its original
+    row order.
+
+    '''
+
+    def __init__(self, frame, key='HydroID'):
+
+        self.positions, self.keys, self.offsets = segments(frame[key].values)
+        if len(self.positions) != len(frame):
+            raise ValueError('SRC table has rows without a {}'.format(key))
+
+        self.segment_ids = np.repeat(np.arange(len(self.keys)), np.diff(self.offsets))
+
+        # sorted row of each table row
+        self.inverse = np.empty(len(self.positions), dtype=np.int64)
+        self.inverse[self.positions] = np.arange(len(self.positions))
+
+        self.columns = {column : frame[column].values[self.positions] for column in frame.columns}
+
+    def __len__(self):
+        return(len(self.positions))
+
+    def __getitem__(self, column):
+        return(self.columns[column])
+
+    def __setitem__(self, column, values):
+        self.columns[column] = values
+
+    def rename(self, columns):
+        ''' Renames columns in place (keeping their position) '''
+
+        self.columns = {columns.get(column, column) : values for column, values in self.columns.items()}
+
+    def shift(self, column):
+        ''' Value of the row above in table order (the column of frame[column].shift(1)), as float '''
+
+        above = self.positions - 1
+        shifted = np.full(len(self), np.nan)
+        shifted[above >= 0] = self.columns[column][self.inverse[above[above >= 0]]]
+
+        return(shifted)
+
+    def _segment_arg(self, values, valid, largest):
+
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values) if valid is None else valid & ~np.isnan(values)
+        if not valid.any():
+            return(np.zeros(0, dtype=np.int64))
+
+        # segments with a valid row; invalid rows sort last
+        starts = self.offsets[:-1]
+        has_valid = np.logical_or.reduceat(valid, starts) & (np.diff(self.offsets) > 0)
+        filled = np.where(valid, -values if largest else values, np.inf)
+
+        segment_best = np.minimum.reduceat(filled, starts)
+        rows = np.arange(len(filled))
+        first = np.minimum.reduceat(np.where(valid & (filled == segment_best[self.segment_ids]), rows, len(rows)), starts)
+
+        return(first[has_valid])
+
+    def segment_argmin(self, values, valid=None):
+        '''
+        Sorted row of the first minimum of each HydroID over its valid non-NaN values, by ascending HydroID (the rows of
+        groupby('HydroID')[column].idxmin() on the valid rows). HydroIDs without such a value are left out.
+
+        '''
+
+        return(self._segment_arg(values, valid, largest=False))
+
+    def segment_argmax(self, values, valid=None):
+        ''' As segment_argmin, for the first maximum '''
+
+        return(self._segment_arg(values, valid, largest=True))
+
+    def broadcast(self, rows, values):
+        ''' Per row, the value given for the selected row of its HydroID (NaN for HydroIDs without one) '''
+
+        segment_values = np.full(len(self.keys), np.nan)
+        segment_values[self.segment_ids[rows]] = values
+
+        return(segment_values[self.segment_ids])
+
+    def join(self, on, table, columns):
+        ''' Adds columns of a table with unique keys in column on (a left merge on on) '''
+
+        rows = key_rows(self.columns[on], table[on].values)
+        for column in columns:
+            self.columns[column] = take_rows(table[column].values, rows)
+
+    def rows(self, rows, columns):
+        ''' Frame of the given sorted rows and columns, with a new RangeIndex '''
+
+        return(pd.DataFrame({column : self.columns[column][rows] for column in columns}, columns=columns))
+
+    def to_frame(self):
+        ''' The table in its original row order, with a new RangeIndex '''
+
+        return(pd.DataFrame({column : values[self.inverse] for column, values in self.columns.items()}, columns=list(self.columns)))
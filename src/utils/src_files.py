@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import json
+import numpy as np
+from utils.src_columns import segments
+
+
+def src_groups(hydro_ids, stages, discharges):
+    '''
+    Splits the synthetic rating curve rows by HydroID with one stable sort. Returns the unique HydroIDs (ascending),
+    the offsets of their rows (rows of the i-th HydroID are offsets[i]:offsets[i+1]) and the stages and discharges
+    sorted by HydroID, in table order within a HydroID.
+
+    '''
+
+    positions, unique_ids, offsets = segments(hydro_ids)
+
+    return(unique_ids, offsets, np.asarray(stages, dtype=float)[positions], np.asarray(discharges, dtype=float)[positions])
+
+
+def write_src_json(output_src, src_json_fileName):
+    '''
+    Writes the src.json rating curves ({HydroID: {'q_list': [...], 'stage_list': [...]}}) one HydroID at a time. The
+    file is the same as json.dump(..., sort_keys=True, indent=2) of the whole dictionary.
+
+    '''
+
+    unique_ids, offsets, stages, discharges = src_groups(output_src['HydroID'].values, output_src['Stage'].values, output_src['Discharge (m3s-1)'].values)
+    keys = [str(hid) for hid in unique_ids]
+
+    with open(src_json_fileName, 'w') as f:
+        f.write('{')
+        for count, index in enumerate(sorted(range(len(keys)), key=keys.__getitem__)):
+            rows = slice(offsets[index], offsets[index + 1])
+            rating_curve = json.dumps({'q_list' : discharges[rows].tolist(), 'stage_list' : stages[rows].tolist()}, sort_keys=True, indent=2)
+            f.write('{}\n  {}: {}'.format(',' if count else '', json.dumps(keys[index]), rating_curve.replace('\n', '\n  ')))
+        f.write('\n}' if keys else '}')
+
+
+def write_src_binary(output_src, src_binary_fileName):
+    '''
+    Writes the rating curves as an uncompressed .npz of hydro_ids, offsets, stages and discharges (see src_groups), a
+    compact sibling of src.json that is read without parsing text.
+
+    '''
+
+    unique_ids, offsets, stages, discharges = src_groups(output_src['HydroID'].values, output_src['Stage'].values, output_src['Discharge (m3s-1)'].values)
+
+    with open(src_binary_fileName, 'wb') as f:
+        np.savez(f, hydro_ids=unique_ids, offsets=offsets, stages=stages, discharges=discharges)
+
+
+def read_src_binary(src_binary_fileName):
+    ''' Reads a write_src_binary file as the dictionary json.load returns for the src.json of the same rating curves '''
+
+    with np.load(src_binary_fileName) as src:
+        hydro_ids, offsets = src['hydro_ids'], src['offsets']
+        stages, discharges = src['stages'], src['discharges']
+
+    # keys in the (text) order of src.json
+    keys = [str(hid) for hid in hydro_ids]
+
+    return({keys[i] : {'q_list' : discharges[offsets[i]:offsets[i + 1]].tolist(), 'stage_list' : stages[offsets[i]:offsets[i + 1]].tolist()}
+            for i in sorted(range(len(keys)), key=keys.__getitem__)})
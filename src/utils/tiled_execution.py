@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import rasterio
+
+# Datasets opened by the workers, one cache per thread (or per worker process). All datasets opened in this process
+# are also listed so the calling thread can close them once the blocks are done.
+_datasets = threading.local()
+_opened_datasets = []
+_opened_datasets_lock = threading.Lock()
+
+
+def tiled_number_of_jobs(number_of_jobs=None):
+    ''' Returns number_of_jobs, defaulting to the ncores_tiled environment variable (1 if not set) '''
+
+    if number_of_jobs is None:
+        number_of_jobs = int(os.environ.get('ncores_tiled') or 1)
+
+    return(max(number_of_jobs, 1))
+
+
+def block_windows(raster_filename):
+    ''' Returns the internal block windows of a raster in row-major order '''
+
+    with rasterio.open(raster_filename) as raster:
+        return([window for ji, window in raster.block_windows(1)])
+
+
+def _read_sources(sources, window):
+    '''
+    Reads one window of each source. A source is either a raster filename (band 1 is read through a dataset cached by
+    the calling thread) or an array (sliced).
+
+    '''
+
+    if not hasattr(_datasets, 'cache'):
+        _datasets.cache = {}
+
+    arrays = []
+    for source in sources:
+        if isinstance(source, np.ndarray):
+            arrays.append(np.asarray(source[window.toslices()]))
+        else:
+            if source not in _datasets.cache:
+                _datasets.cache[source] = rasterio.open(source)
+                with _opened_datasets_lock:
+                    _opened_datasets.append(_datasets.cache[source])
+            arrays.append(_datasets.cache[source].read(1, window = window))
+
+    return(arrays)
+
+
+def _run_block(kernel, sources, window, window_argument):
+    if window_argument:
+        return(kernel(*_read_sources(sources, window), window = window))
+    return(kernel(*_read_sources(sources, window)))
+
+
+def _close_datasets():
+    with _opened_datasets_lock:
+        for dataset in _opened_datasets:
+            dataset.close()
+        _opened_datasets.clear()
+    _datasets.cache = {}
+
+
+def _ordered_results(kernel, sources, windows, number_of_jobs, executor, window_argument):
+    ''' Yields (window, kernel result) in window order with at most twice number_of_jobs blocks in flight '''
+
+    if number_of_jobs == 1:
+        try:
+            for window in windows:
+                yield window, _run_block(kernel, sources, window, window_argument)
+        finally:
+            _close_datasets()
+        return
+
+    # worker threads exit with the pool, their datasets are closed afterwards (worker processes close theirs on exit)
+    executor_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    try:
+        with executor_class(max_workers = number_of_jobs) as pool:
+            pending = deque()
+            for window in windows:
+                pending.append((window, pool.submit(_run_block, kernel, sources, window, window_argument)))
+                if len(pending) >= 2 * number_of_jobs:
+                    window, future = pending.popleft()
+                    yield window, future.result()
+
+            while pending:
+                window, future = pending.popleft()
+                yield window, future.result()
+    finally:
+        _close_datasets()
+
+
+def map_blocks(kernel, sources, windows, write_block, number_of_jobs=None, executor='thread', window_argument=False):
+    '''
+    Maps kernel over blocks and hands the results to write_block in window order.
+
+    Parameters
+    ----------
+    kernel : FUNCTION
+        Called with one array per source for each window. Numba kernels should be compiled with nogil=True to run
+        concurrently in the thread pool. With the process pool kernel must be picklable (a module level function or a
+        functools.partial of one).
+    sources : LIST
+        Raster filenames (band 1) or arrays with the shape of the raster grid. Arrays are only shared with the thread pool.
+    windows : LIST
+        Windows to process (see block_windows).
+    write_block : FUNCTION
+        Called as write_block(window, result) in the calling thread, in window order. For example a rasterio write.
+    number_of_jobs : INT
+        Number of workers. Defaults to the ncores_tiled environment variable. 1 runs serially.
+    executor : STR
+        'thread' or 'process'.
+    window_argument : BOOL
+        Also pass the window to kernel as the window keyword argument (e.g. for kernels using global cell indices).
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    for window, result in _ordered_results(kernel, sources, windows, tiled_number_of_jobs(number_of_jobs), executor, window_argument):
+        write_block(window, result)
+
+
+def reduce_blocks(kernel, sources, windows, merge, initial, number_of_jobs=None, executor='thread', window_argument=False):
+    '''
+    Maps kernel over blocks and merges the partial results (e.g. zone minima) into initial in window order, so the
+    reduction is the same for any number of jobs. merge(accumulated, partial) returns the new accumulated value.
+
+    See map_blocks for the other parameters.
+
+    Returns
+    -------
+    accumulated : OBJECT
+        Merged partial results.
+
+    '''
+
+    accumulated = initial
+    for window, partial in _ordered_results(kernel, sources, windows, tiled_number_of_jobs(number_of_jobs), executor, window_argument):
+        accumulated = merge(accumulated, partial)
+
+    return(accumulated)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# the pipeline modules import each other (and utils) from src, as they do under /foss_fim/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# bathy_rc_adjust (imported by add_crosswalk) reads its thresholds at import, as set by params_template.env
+for name, value in [('surf_area_thalweg_ratio_flag', '10'), ('thalweg_stg_search_max_limit', '3'), ('bankful_xs_area_ratio_flag', '10'),
+                    ('bathy_xs_area_chg_flag', '5'), ('thalweg_hyd_radius_flag', '10')]:
+    os.environ.setdefault(name, value)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from add_crosswalk import short_segment_updates, update_short_rating_curves
+
+
+def baseline_short_segment_updates(output_flows, min_catchment_area, min_stream_length):
+    '''
+    The short segment loop of add_crosswalk before the network was indexed. The no upstream, multiple downstream
+    branch indexes the order_ column (it indexed a HydroID Series with 'order_', a KeyError).
+
+    '''
+
+    sml_segs = []
+
+    for stream_index in output_flows.index:
+
+        if output_flows["areasqkm"][stream_index] < min_catchment_area and output_flows["LengthKm"][stream_index] < min_stream_length and output_flows["LakeID"][stream_index] < 0:
+
+            short_id = output_flows['HydroID'][stream_index]
+            to_node = output_flows['To_Node'][stream_index]
+            from_node = output_flows['From_Node'][stream_index]
+
+            if len(output_flows.loc[output_flows['NextDownID'] == short_id]['HydroID']) > 1:
+                max_order = max(output_flows.loc[output_flows['NextDownID'] == short_id]['order_'])
+
+                if len(output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID']) == 1:
+                    update_id = output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID'].item()
+                else:
+                    update_id = output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID'].values[0]
+
+            elif len(output_flows.loc[output_flows['NextDownID'] == short_id]['HydroID']) == 1:
+                update_id = output_flows.loc[output_flows.To_Node==from_node]['HydroID'].item()
+
+            elif len(output_flows.loc[output_flows.From_Node==to_node]['HydroID']) > 1:
+                max_order = max(output_flows.loc[output_flows.From_Node==to_node]['order_'])
+
+                if len(output_flows.loc[(output_flows['NextDownID'] == short_id) & (output_flows['order_'] == max_order)]['HydroID']) == 1:
+                    update_id = output_flows.loc[(output_flows.From_Node==to_node) & (output_flows['order_'] == max_order)]['HydroID'].item()
+                else:
+                    update_id = output_flows.loc[(output_flows.From_Node==to_node) & (output_flows['order_'] == max_order)]['HydroID'].values[0]
+
+            elif len(output_flows.loc[output_flows.From_Node==to_node]['HydroID']) == 1:
+                update_id = output_flows.loc[output_flows.From_Node==to_node]['HydroID'].item()
+
+            else:
+                update_id = output_flows.loc[output_flows.HydroID==short_id]['HydroID'].item()
+
+            str_order = output_flows.loc[output_flows.HydroID==short_id]['order_'].item()
+            sml_segs.append({'short_id':short_id, 'update_id':update_id, 'str_order':str_order})
+
+    return(pd.DataFrame(sml_segs))
+
+
+def baseline_update_short_rating_curves(output_src, sml_segs):
+    ''' The nested iterrows discharge substitution of add_crosswalk '''
+
+    for index, segment in sml_segs.iterrows():
+
+        short_id = segment.iloc[0]
+        update_id= segment.iloc[1]
+        new_values = output_src.loc[output_src['HydroID'] == update_id][['Stage', 'Discharge (m3s-1)']]
+
+        for src_index, src_stage in new_values.iterrows():
+            output_src.loc[(output_src['HydroID']== short_id) & (output_src['Stage']== src_stage.iloc[0]),['Discharge (m3s-1)']] = src_stage.iloc[1]
+
+    return(output_src)
+
+
+def synthetic_flows():
+    '''
+    A network of 14 segments. Node 3 joins two tributaries of equal order (ties) and node 6 three; 20 and 21 split at
+    node 10 below 22, which has no NextDownID; 30 is isolated; 13 -> 12 -> 11 is a chain of short segments; 14 is in a
+    lake.
+
+    '''
+
+    segments = [# HydroID, From_Node, To_Node, NextDownID, short
+                (1, 1, 3, 4, True), (2, 2, 3, 4, False), (4, 3, 6, 7, True), (5, 5, 6, 7, False), (8, 8, 6, 7, False), (7, 6, 9, -1, True),
+                (20, 10, 11, -1, True), (21, 10, 12, -1, False), (22, 13, 10, -1, True),
+                (30, 40, 41, -1, True),
+                (13, 50, 51, 12, True), (12, 51, 52, 11, True), (11, 52, 53, -1, True),
+                (14, 60, 61, -1, True)]
+    orders = {1 : 1, 2 : 1, 4 : 2, 5 : 2, 8 : 1, 7 : 3, 20 : 2, 21 : 2, 22 : 1, 30 : 1, 13 : 1, 12 : 1, 11 : 2, 14 : 1}
+
+    flows = pd.DataFrame(segments, columns=['HydroID', 'From_Node', 'To_Node', 'NextDownID', 'short'])
+    flows['order_'] = flows['HydroID'].map(orders)
+    flows['areasqkm'] = np.where(flows['short'], 0.1, 2.0)
+    flows['LengthKm'] = np.where(flows['short'], 0.2, 1.5)
+    flows['LakeID'] = np.where(flows['HydroID'] == 14, 3, -999)
+
+    return(flows.drop(columns=['short']))
+
+
+def test_short_segment_updates_match_baseline():
+    flows = synthetic_flows()
+
+    sml_segs = short_segment_updates(flows, 0.25, 0.5)
+    expected = baseline_short_segment_updates(flows, 0.25, 0.5)
+
+    pd.testing.assert_frame_equal(sml_segs, expected)
+    assert dict(zip(sml_segs['short_id'], sml_segs['update_id'])) == {1 : 4, 4 : 1, 7 : 4, 20 : 20, 22 : 20, 30 : 30, 13 : 12, 12 : 13, 11 : 12}
+
+
+def test_update_short_rating_curves_matches_baseline():
+    flows = synthetic_flows()
+    sml_segs = short_segment_updates(flows, 0.25, 0.5)
+
+    rng = np.random.default_rng(0)
+    stages = [0.0, 0.3048, 0.6096, 0.9144]
+    output_src = pd.DataFrame([(hydro_id, stage) for stage in stages for hydro_id in flows['HydroID']], columns=['HydroID', 'Stage'])
+    output_src['Discharge (m3s-1)'] = rng.uniform(0, 100, len(output_src))
+    # a repeated stage of an update segment (the last row wins) and a stage missing from a short segment
+    output_src = pd.concat([output_src, pd.DataFrame({'HydroID' : [4], 'Stage' : [0.3048], 'Discharge (m3s-1)' : [55.5]})], ignore_index=True)
+    output_src = output_src.loc[~((output_src['HydroID'] == 12) & (output_src['Stage'] == 0.9144))].reset_index(drop=True)
+
+    updated = update_short_rating_curves(output_src.copy(), sml_segs)
+    expected = baseline_update_short_rating_curves(output_src.copy(), sml_segs)
+
+    pd.testing.assert_frame_equal(updated, expected)
+    assert (updated.loc[updated['HydroID'].isin([1, 4, 7]) & (updated['Stage'] == 0.3048), 'Discharge (m3s-1)'] == 55.5).all()
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+from agreedem import agreedem
+
+
+def write_inputs(tmp_path, shape=(600, 600)):
+    ''' Constant DEM with a nodata corner and two rivers, so AGREE values do not depend on which of equally near cells is allocated '''
+
+    profile = {'driver' : 'GTiff', 'width' : shape[1], 'height' : shape[0], 'count' : 1, 'crs' : 'EPSG:5070', 'transform' : Affine(10, 0, 0, 0, -10, shape[0] * 10)}
+
+    dem = np.full(shape, 100, dtype='float32')
+    dem[:50, :50] = -999999
+    rivers = np.zeros(shape, dtype='int32')
+    rivers[300, 20:580] = 1
+    rivers[20:580, 450] = 1
+
+    with rasterio.open(tmp_path / 'dem_meters.tif', 'w', dtype='float32', nodata=-999999, **profile) as raster:
+        raster.write(dem, 1)
+    with rasterio.open(tmp_path / 'flows_grid_boolean.tif', 'w', dtype='int32', **profile) as raster:
+        raster.write(rivers, 1)
+
+
+def run_agreedem(tmp_path, name, max_memory_mb):
+
+    output = tmp_path / '{}.tif'.format(name)
+    agreedem(str(tmp_path / 'flows_grid_boolean.tif'), str(tmp_path / 'dem_meters.tif'), str(output), str(tmp_path / name), 70, 10, 1000, max_memory_mb, number_of_jobs=2)
+
+    with rasterio.open(output) as raster:
+        return(raster.read(1))
+
+
+def test_memory_limit_gives_same_dem(tmp_path):
+    write_inputs(tmp_path)
+
+    in_memory = run_agreedem(tmp_path, 'in_memory', None)
+    limited = run_agreedem(tmp_path, 'limited', 20)
+
+    assert np.array_equal(in_memory, limited)
+    assert (in_memory[300, 100] < 0) and (in_memory[200, 100] == 100)
+
+
+def test_memory_limit_is_not_exceeded(tmp_path):
+    write_inputs(tmp_path)
+
+    with pytest.raises(MemoryError):
+        run_agreedem(tmp_path, 'too_small', 4)
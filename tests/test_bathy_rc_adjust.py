@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+import bathy_rc_adjust
+from bathy_rc_adjust import bathy_rc_lookup
+from utils.src_columns import SrcColumns
+
+
+def baseline_bathy_rc_lookup(input_src_base, input_bathy_fileName):
+    '''
+    bathy_rc_lookup before the SRC was held as columns, returning its four tables and the SRC (column masks are
+    assignments rather than inplace masks of a column, which are the same in the pinned pandas)
+
+    '''
+
+    sa_ratio_flag, thal_stg_limit = bathy_rc_adjust.sa_ratio_flag, bathy_rc_adjust.thal_stg_limit
+    bankful_xs_ratio_flag, bathy_xsarea_flag = bathy_rc_adjust.bankful_xs_ratio_flag, bathy_rc_adjust.bathy_xsarea_flag
+    thal_hyd_radius_flag = bathy_rc_adjust.thal_hyd_radius_flag
+
+    input_bathy = pd.read_csv(input_bathy_fileName, dtype= {'COMID': int})
+    input_bathy = input_bathy.rename(columns={'COMID':'feature_id','BANKFULL_WIDTH':'BANKFULL_WIDTH (m)','BANKFULL_XSEC_AREA':'BANKFULL_XSEC_AREA (m2)'})
+    modified_src_base = input_src_base.merge(input_bathy.loc[:,['feature_id','BANKFULL_WIDTH (m)','BANKFULL_XSEC_AREA (m2)']],how='left',on='feature_id')
+
+    modified_src_base['SA_div'] = modified_src_base['SurfaceArea (m2)'].div(modified_src_base['SurfaceArea (m2)'].shift(1))
+    modified_src_base['SA_div'] = modified_src_base['SA_div'].mask((modified_src_base['Stage']==0) | (modified_src_base['SA_div']<sa_ratio_flag) | (modified_src_base['SurfaceArea (m2)']==0))
+    find_thalweg_notch = modified_src_base[['HydroID','Stage','SurfaceArea (m2)','SA_div']]
+    find_thalweg_notch = find_thalweg_notch[find_thalweg_notch['Stage']<thal_stg_limit]
+    find_thalweg_notch = find_thalweg_notch[find_thalweg_notch['SA_div'].notnull()]
+    find_thalweg_notch = find_thalweg_notch.loc[find_thalweg_notch.groupby('HydroID')['Stage'].idxmax()].reset_index(drop=True)
+    find_thalweg_notch['Thalweg_burn_elev'] = find_thalweg_notch['Stage']
+    modified_src_base = modified_src_base.merge(find_thalweg_notch.loc[:,['HydroID','Thalweg_burn_elev']],how='left',on='HydroID')
+
+    modified_src_base['Top Width Diff (m)'] = (modified_src_base['TopWidth (m)'] - modified_src_base['BANKFULL_WIDTH (m)']).abs()
+    modified_src_base['XS Area (m2)'] = modified_src_base['Volume (m3)'] / (modified_src_base['LENGTHKM'] * 1000)
+
+    output_bathy = modified_src_base[['feature_id','HydroID','order_','Stage','SurfaceArea (m2)','Thalweg_burn_elev','BANKFULL_WIDTH (m)','TopWidth (m)','XS Area (m2)','BANKFULL_XSEC_AREA (m2)','Top Width Diff (m)']]
+    output_bathy = output_bathy[output_bathy['Stage'] > 0].copy()
+    output_bathy['Top Width Diff (m)'] = output_bathy['Top Width Diff (m)'].mask(output_bathy['Stage'] <= output_bathy['Thalweg_burn_elev'])
+    output_bathy = output_bathy[output_bathy['BANKFULL_XSEC_AREA (m2)'].notnull()]
+    output_bathy = output_bathy[output_bathy['SurfaceArea (m2)'] > 0]
+    output_bathy = output_bathy.loc[output_bathy.groupby('HydroID')['Top Width Diff (m)'].idxmin()].reset_index(drop=True)
+
+    output_bathy['XS Area Diff (m2)'] = (output_bathy['BANKFULL_XSEC_AREA (m2)'] - output_bathy['XS Area (m2)'])
+    output_bathy['XS Bankfull Area Ratio'] = (output_bathy['BANKFULL_XSEC_AREA (m2)'] / output_bathy['XS Area (m2)']).round(2)
+    output_bathy['XS Bankfull Area Ratio'] = output_bathy['XS Bankfull Area Ratio'].mask((output_bathy['XS Area Diff (m2)']<0) | (output_bathy['XS Area (m2)'] == 0))
+    output_bathy['XS Area Diff (m2)'] = output_bathy['XS Area Diff (m2)'].mask((output_bathy['XS Area Diff (m2)']<0) | (output_bathy['XS Area (m2)'] == 0))
+    output_bathy['XS Area Diff (m2)'] = output_bathy['XS Area Diff (m2)'].mask(output_bathy['XS Bankfull Area Ratio']>bankful_xs_ratio_flag)
+    output_bathy['XS Bankfull Area Ratio'] = output_bathy['XS Bankfull Area Ratio'].mask(output_bathy['XS Bankfull Area Ratio']>bankful_xs_ratio_flag)
+
+    stream_order_bathy_ratio = output_bathy[['order_','Stage','XS Bankfull Area Ratio']].copy()
+    stream_order_bathy_ratio['Stage'] = stream_order_bathy_ratio['Stage'].mask(stream_order_bathy_ratio['XS Bankfull Area Ratio'].isnull())
+    stream_order_bathy_ratio = stream_order_bathy_ratio.groupby('order_').agg(count=('XS Bankfull Area Ratio','count'),mean_xs_area_ratio=('XS Bankfull Area Ratio','mean'),median_stage_bankfull=('Stage','median'))
+    stream_order_bathy_ratio = (stream_order_bathy_ratio.ffill()+stream_order_bathy_ratio.bfill())/2
+    stream_order_bathy_ratio = stream_order_bathy_ratio.bfill().ffill()
+    stream_order_bathy_ratio_count = output_bathy.groupby('order_').agg(count_total=('Stage','count'))
+    stream_order_bathy_ratio = stream_order_bathy_ratio.merge(stream_order_bathy_ratio_count,how='left',on='order_')
+    stream_order_bathy_ratio['mean_xs_area_ratio'] = stream_order_bathy_ratio['mean_xs_area_ratio'].mask(stream_order_bathy_ratio['mean_xs_area_ratio'].isnull(),1)
+    stream_order_bathy_ratio['median_stage_bankfull'] = stream_order_bathy_ratio['median_stage_bankfull'].mask(stream_order_bathy_ratio['median_stage_bankfull'].isnull(),0)
+
+    output_bathy = output_bathy.merge(stream_order_bathy_ratio,how='left',on='order_')
+    modified_src_base = modified_src_base.merge(stream_order_bathy_ratio,how='left',on='order_')
+
+    modified_src_base['lookup_stage_diff'] = (modified_src_base[['median_stage_bankfull','Thalweg_burn_elev']].max(axis=1) - modified_src_base['Stage']).abs()
+    modified_src_base['lookup_stage_diff'] = modified_src_base['lookup_stage_diff'].mask((modified_src_base['Stage'] == 0) & (modified_src_base['median_stage_bankfull'].isnull()),999)
+
+    xs_area_hydroid_lookup = modified_src_base[['HydroID','BANKFULL_XSEC_AREA (m2)','XS Area (m2)','Stage','Thalweg_burn_elev','median_stage_bankfull','lookup_stage_diff','mean_xs_area_ratio']]
+    xs_area_hydroid_lookup = xs_area_hydroid_lookup.loc[xs_area_hydroid_lookup.groupby('HydroID')['lookup_stage_diff'].idxmin()].reset_index(drop=True)
+    xs_area_hydroid_lookup['bathy_calc_xs_area'] = (xs_area_hydroid_lookup['XS Area (m2)'] * xs_area_hydroid_lookup['mean_xs_area_ratio']) - xs_area_hydroid_lookup['XS Area (m2)']
+    xs_area_hydroid_lookup['bankfull_XS_ratio_flag'] = (xs_area_hydroid_lookup['bathy_calc_xs_area'] / xs_area_hydroid_lookup['BANKFULL_XSEC_AREA (m2)'])
+    xs_area_hydroid_lookup['bathy_calc_xs_area'] = xs_area_hydroid_lookup['bathy_calc_xs_area'].mask((xs_area_hydroid_lookup['bankfull_XS_ratio_flag']>bathy_xsarea_flag) | (xs_area_hydroid_lookup['bankfull_XS_ratio_flag'].isnull()),0)
+    modified_src_base = modified_src_base.merge(xs_area_hydroid_lookup.loc[:,['HydroID','bathy_calc_xs_area']],how='left',on='HydroID')
+
+    modified_src_base = modified_src_base.rename(columns={'Discharge (m3s-1)':'Discharge (m3s-1)_nobathy'})
+    modified_src_base['XS Area (m2)_bathy_adj'] = modified_src_base['XS Area (m2)'] + modified_src_base['bathy_calc_xs_area']
+    modified_src_base['Volume (m3)_bathy_adj'] = modified_src_base['XS Area (m2)_bathy_adj'] * modified_src_base['LENGTHKM'] * 1000
+    modified_src_base['WetArea (m2)_bathy_adj'] = modified_src_base['Volume (m3)_bathy_adj']/modified_src_base['LENGTHKM']/1000
+    modified_src_base['HydraulicRadius (m)_bathy_adj'] = modified_src_base['WetArea (m2)_bathy_adj']/modified_src_base['WettedPerimeter (m)']
+    modified_src_base['HydraulicRadius (m)_bathy_adj'] = modified_src_base['HydraulicRadius (m)_bathy_adj'].fillna(0)
+    modified_src_base['HydraulicRadius (m)_bathy_adj'] = modified_src_base['HydraulicRadius (m)_bathy_adj'].mask((modified_src_base['HydraulicRadius (m)_bathy_adj']>thal_hyd_radius_flag) & (modified_src_base['Stage']<thal_stg_limit),0)
+    modified_src_base['Discharge (m3s-1)'] = modified_src_base['WetArea (m2)_bathy_adj']* \
+    pow(modified_src_base['HydraulicRadius (m)_bathy_adj'],2.0/3)* \
+    pow(modified_src_base['SLOPE'],0.5)/modified_src_base['ManningN']
+    modified_src_base['Discharge (m3s-1)'] = modified_src_base['Discharge (m3s-1)'].mask(modified_src_base['Stage'] == 0,0)
+    modified_src_base['Discharge (m3s-1)'] = modified_src_base['Discharge (m3s-1)'].mask(modified_src_base['Stage'] == modified_src_base['Thalweg_burn_elev'],0)
+    modified_src_base['Discharge (m3s-1)'] = modified_src_base['Discharge (m3s-1)'].mask(modified_src_base['Stage'] < modified_src_base['Thalweg_burn_elev'],-999)
+
+    output_bathy = output_bathy[['HydroID','order_','Stage','SurfaceArea (m2)','TopWidth (m)','BANKFULL_WIDTH (m)','Top Width Diff (m)','XS Area (m2)','BANKFULL_XSEC_AREA (m2)','XS Area Diff (m2)','XS Bankfull Area Ratio','count','median_stage_bankfull','mean_xs_area_ratio']]
+
+    return(output_bathy, stream_order_bathy_ratio, find_thalweg_notch, xs_area_hydroid_lookup, modified_src_base)
+
+
+def synthetic_src(seed, interleaved):
+    ''' SRC rows of 40 HydroIDs with a thalweg notch in most of them, some without a bankfull lookup '''
+
+    rng = np.random.default_rng(seed)
+    stages = np.round(np.arange(0, 20) * 0.3048, 4)
+
+    rows = []
+    for hydro_id in range(1001, 1041):
+        feature_id = 5000 + hydro_id % 30
+        order = int(rng.integers(1, 5))
+        length_km = float(rng.uniform(0.2, 3))
+        notch = int(rng.integers(0, 6))
+        surface_area = np.cumsum(rng.uniform(1, 5, len(stages))) * 1000 * length_km
+        surface_area[:notch] = rng.uniform(1, 20, notch)
+        surface_area[0] = 0.0
+        volume = np.cumsum(surface_area) * 0.3048
+        bed_area = surface_area * rng.uniform(1.0, 1.2, len(stages))
+        for stage, area, vol, bed in zip(stages, surface_area, volume, bed_area):
+            rows.append({'Stage' : stage, 'Number of Cells' : int(area // 100), 'SurfaceArea (m2)' : area, 'BedArea (m2)' : bed, 'Volume (m3)' : vol,
+                         'SLOPE' : float(rng.uniform(0.001, 0.01)), 'LENGTHKM' : length_km, 'AREASQKM' : 1.5, 'ManningN' : 0.06, 'HydroID' : hydro_id,
+                         'order_' : order, 'feature_id' : feature_id})
+
+    src = pd.DataFrame(rows)
+    if interleaved:
+        src = src.sort_values('Stage', kind='stable').reset_index(drop=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        src['TopWidth (m)'] = src['SurfaceArea (m2)']/src['LENGTHKM']/1000
+        src['WettedPerimeter (m)'] = src['BedArea (m2)']/src['LENGTHKM']/1000
+        src['WetArea (m2)'] = src['Volume (m3)']/src['LENGTHKM']/1000
+        src['HydraulicRadius (m)'] = (src['WetArea (m2)']/src['WettedPerimeter (m)']).fillna(0)
+        src['Discharge (m3s-1)'] = src['WetArea (m2)']*pow(src['HydraulicRadius (m)'],2.0/3)*pow(src['SLOPE'],0.5)/src['ManningN']
+
+    return(src)
+
+
+def write_bathy(path, seed):
+
+    rng = np.random.default_rng(seed)
+    # COMIDs 5025-5029 have no bankfull geometry
+    comids = np.arange(5000, 5025)
+    pd.DataFrame({'COMID' : comids, 'BANKFULL_WIDTH' : rng.uniform(5, 60, len(comids)), 'BANKFULL_XSEC_AREA' : rng.uniform(5, 300, len(comids))}).to_csv(path, index=False)
+
+
+def test_segment_argmin_matches_groupby_idxmin():
+
+    rng = np.random.default_rng(3)
+    frame = pd.DataFrame({'HydroID' : rng.integers(0, 12, 300), 'value' : rng.choice([0.0, 1.0, 2.0, np.nan], 300)})
+    frame.loc[frame['HydroID'] == 5, 'value'] = np.nan
+    src = SrcColumns(frame)
+
+    rows = src.segment_argmin(src['value'])
+    selected = frame[frame['HydroID'] != 5]
+    expected = selected.groupby('HydroID')['value'].idxmin()
+    assert (src.positions[rows] == expected.values).all()
+
+    rows = src.segment_argmax(src['value'], src['HydroID'] % 2 == 0)
+    selected = selected[selected['HydroID'] % 2 == 0]
+    assert (src.positions[rows] == selected.groupby('HydroID')['value'].idxmax().values).all()
+
+    pd.testing.assert_frame_equal(src.to_frame(), frame)
+
+
+def test_bathy_rc_lookup_matches_baseline(tmp_path):
+
+    for seed, interleaved in [(0, False), (1, True), (2, False)]:
+        bathy_fileName = str(tmp_path / 'bathy.csv')
+        write_bathy(bathy_fileName, seed)
+        src = synthetic_src(seed, interleaved)
+
+        outputs = [str(tmp_path / '{}_{}.csv'.format(name, seed)) for name in ['bathy', 'streamorder', 'thalweg', 'xs_lookup']]
+        modified_src_base = bathy_rc_lookup(src.copy(), bathy_fileName, *outputs)
+        expected = baseline_bathy_rc_lookup(src.copy(), bathy_fileName)
+
+        pd.testing.assert_frame_equal(modified_src_base, expected[-1])
+        for output, table, index in zip(outputs, expected, [False, True, True, True]):
+            with open(output) as f:
+                assert f.read() == table.to_csv(index=index)
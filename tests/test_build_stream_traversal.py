@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import LineString
+from build_stream_traversal import build_stream_traversal_columns, from_node, to_node, next_down_id
+
+
+def baseline_traversal_columns(streams, hydro_id):
+    ''' The From_Node, To_Node and NextDownID loops of build_stream_traversal before they were vectorized '''
+
+    streams = streams.sort_values(by=[hydro_id], ascending=True).copy()
+    # empty text columns are object columns in the pandas the pipeline pins
+    streams[from_node] = pd.Series('', index=streams.index, dtype=object)
+    streams[to_node] = pd.Series('', index=streams.index, dtype=object)
+
+    xy_dict = {}
+    for index, geometry in zip(streams.index, streams.geometry):
+        if geometry:
+            from_key = '{},{}'.format(round(geometry.coords.xy[0][0], 7), round(geometry.coords.xy[1][0], 7))
+            if from_key not in xy_dict:
+                xy_dict[from_key] = len(xy_dict) + 1
+            streams.at[index, from_node] = xy_dict[from_key]
+
+            to_key = '{},{}'.format(round(geometry.coords.xy[0][-1], 7), round(geometry.coords.xy[1][-1], 7))
+            if to_key not in xy_dict:
+                xy_dict[to_key] = len(xy_dict) + 1
+            streams.at[index, to_node] = xy_dict[to_key]
+
+    streams[next_down_id] = pd.Series('', index=streams.index, dtype=object)
+
+    dnodes = dict()
+    for node, hid in zip(streams[from_node], streams[hydro_id]):
+        dnodes.setdefault(node, []).append(hid)
+
+    for node, hid in zip(streams[to_node], streams[hydro_id]):
+        next_down_ids = dnodes.get(node, [])
+        streams.loc[streams[hydro_id] == hid, [next_down_id]] = next_down_ids[0] if next_down_ids else -1
+
+    return(streams)
+
+
+def test_traversal_columns_match_baseline():
+    lines = [(101, [(0, 0), (1, 0)]),
+             (102, [(1, 0), (2, 0)]),
+             (103, [(0, 1), (0.5, 0.5), (1, 0)]),        # confluence with 101 at (1, 0)
+             (105, [(2, 0), (2, -1)]),                   # divergence with 104 at (2, 0)
+             (104, [(2, 0), (3, 0)]),
+             (106, [(3, 0), (4, 0)]),                    # two segments sharing a HydroID
+             (106, [(4, 0), (5, 0)]),
+             (107, [(5, 0), (0.1 + 0.2 + 5.7, 0)]),       # end node equal after rounding to 7 decimals
+             (108, [(6.0000000001, 0), (7, 1)]),
+             (109, [(7, 1), (6, 0)]),                    # loop back onto 108
+             (110, [(10, 10), (11, 11)])]                # isolated segment
+    streams = gpd.GeoDataFrame({'HydroID' : [hid for hid, coords in lines]}, geometry=[LineString(coords) for hid, coords in lines], crs='EPSG:5070')
+    streams.index = np.arange(len(streams))[::-1]
+
+    expected = baseline_traversal_columns(streams, 'HydroID')
+    result = build_stream_traversal_columns().execute(streams, None, 'HydroID')
+
+    assert result[0] == 'OK'
+    rebuilt = result[1]
+    assert list(rebuilt.index) == list(expected.index)
+    for column in [from_node, to_node, next_down_id]:
+        assert list(rebuilt[column]) == list(expected[column]), column
+    assert rebuilt[next_down_id].dtype == object
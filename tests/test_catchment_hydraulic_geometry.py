@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from affine import Affine
+from catchment_hydraulic_geometry import catchment_hydraulic_geometry, read_stages, read_catchment_list, SRC_BASE_COLUMNS
+
+# a synthetic HUC and its TauDEM catchhydrogeo table, written by tools/src_base_comparison.py -f tests/data/catchhydrogeo
+CATCHHYDROGEO_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'catchhydrogeo')
+
+
+def write_inputs(tmp_path, shape=(90, 70)):
+    ''' HAND on the stage grid (cells exactly at a stage are dry at that stage), nodata HAND and slope cells, and catchments outside the list '''
+
+    rng = np.random.default_rng(0)
+    profile = {'driver' : 'GTiff', 'width' : shape[1], 'height' : shape[0], 'count' : 1, 'crs' : 'EPSG:5070',
+               'transform' : Affine(10, 0, 0, 0, -10, shape[0] * 10), 'tiled' : True, 'blockxsize' : 16, 'blockysize' : 16}
+
+    hand = (rng.integers(0, 30, shape) * 0.25).astype('float32')
+    hand[rng.random(shape) < 0.05] = -999999
+    catchments = rng.integers(1, 9, shape).astype('int32')
+    slopes = rng.uniform(0, 0.5, shape).astype('float32')
+    slopes[rng.random(shape) < 0.05] = -1
+
+    for name, values, nodata in [('hand', hand, -999999), ('catchments', catchments, 0), ('slopes', slopes, -1)]:
+        with rasterio.open(tmp_path / '{}.tif'.format(name), 'w', dtype=values.dtype, nodata=nodata, **profile) as raster:
+            raster.write(values, 1)
+
+    return(hand, catchments, slopes)
+
+
+def baseline_src_base(hand, catchments, slopes, stages, catchment_list, cell_area):
+    ''' The catchhydrogeo table one catchment and stage at a time '''
+
+    rows = []
+    for catchment in catchment_list.itertuples():
+        in_catchment = (catchments == catchment.CatchId) & (hand != -999999) & (slopes != -1)
+        for stage in stages:
+            wet = in_catchment & (hand < stage)
+            rows.append([catchment.CatchId, stage, int(wet.sum()), wet.sum() * cell_area,
+                         np.sqrt(1 + slopes[wet].astype('float64')**2).sum() * cell_area,
+                         (stage - hand[wet].astype('float64')).sum() * cell_area,
+                         catchment.SLOPE, catchment.LENGTHKM, catchment.AREASQKM])
+
+    return(pd.DataFrame(rows, columns=SRC_BASE_COLUMNS))
+
+
+def test_src_base_matches_cell_by_cell_table(tmp_path):
+    hand, catchments, slopes = write_inputs(tmp_path)
+    stages = np.arange(0, 21) * 0.25
+    # catchment list order is not sorted; catchments 7 and 8 are not listed
+    catchment_list = pd.DataFrame({'CatchId' : [4, 1, 6, 2, 5, 3], 'SLOPE' : np.linspace(0.001, 0.01, 6),
+                                   'LENGTHKM' : np.linspace(0.5, 3, 6), 'AREASQKM' : np.linspace(1, 4, 6)})
+
+    expected = baseline_src_base(hand, catchments, slopes, stages, catchment_list, 100.0)
+
+    for number_of_jobs in [1, 3]:
+        src_base = catchment_hydraulic_geometry(str(tmp_path / 'hand.tif'), str(tmp_path / 'catchments.tif'), str(tmp_path / 'slopes.tif'),
+                                                stages, catchment_list, number_of_jobs)
+
+        assert (src_base['Number of Cells'].values == expected['Number of Cells'].values).all()
+        pd.testing.assert_frame_equal(src_base, expected, check_exact=False, rtol=1e-9)
+
+
+@pytest.mark.skipif(not os.path.isfile(os.path.join(CATCHHYDROGEO_FIXTURE, 'src_base.csv')), reason='no catchhydrogeo fixture (tools/src_base_comparison.py -f)')
+def test_src_base_matches_catchhydrogeo_fixture():
+    fixture = lambda fileName: os.path.join(CATCHHYDROGEO_FIXTURE, fileName)
+
+    expected = pd.read_csv(fixture('src_base.csv')).rename(columns=lambda x: x.strip(' '))
+    src_base = catchment_hydraulic_geometry(fixture('rem_zeroed_masked.tif'), fixture('gw_catchments_reaches_filtered_addedAttributes.tif'),
+                                            fixture('slopes_d8_dem_meters_masked.tif'), read_stages(fixture('stage.txt')),
+                                            read_catchment_list(fixture('catchment_list.txt')), 1)
+
+    assert list(src_base.columns) == list(expected.columns)
+    # cells at HAND == stage change the counts and the areas of every stage
+    assert (src_base[['CatchId', 'Number of Cells']].values == expected[['CatchId', 'Number of Cells']].values).all()
+    pd.testing.assert_frame_equal(src_base, expected, check_dtype=False, check_exact=False, rtol=1e-5)
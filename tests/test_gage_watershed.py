@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+from gage_watershed import gage_watershed, D8_ROW_OFFSETS, D8_COL_OFFSETS, GAGE_WATERSHED_NODATA
+
+
+def naive_labels(flowdir, seeds, flowdir_ndv):
+    ''' Follows the flow directions from every cell until a seed, nodata, the raster edge or a loop '''
+
+    height, width = flowdir.shape
+    labels = np.full(flowdir.shape, GAGE_WATERSHED_NODATA, dtype=np.int64)
+    for row in range(height):
+        for col in range(width):
+            r, c, visited = row, col, set()
+            while 0 <= r < height and 0 <= c < width and (r, c) not in visited:
+                direction = flowdir[r, c]
+                if direction == flowdir_ndv or not 1 <= direction <= 8:
+                    break
+                if seeds[r, c] > 0:
+                    labels[row, col] = seeds[r, c]
+                    break
+                visited.add((r, c))
+                r, c = r + D8_ROW_OFFSETS[direction], c + D8_COL_OFFSETS[direction]
+
+    return(labels)
+
+
+@pytest.mark.parametrize('tile_size', [7, 16, None])
+def test_tiled_labels_match_naive_walk(tmp_path, monkeypatch, tile_size):
+    random = np.random.RandomState(0)
+    shape = (45, 60)
+    flowdir = random.randint(1, 9, shape).astype('int16')
+    flowdir[random.rand(*shape) < 0.02] = -32768
+    seeds = np.where(random.rand(*shape) < 0.03, random.randint(1, 1000, shape), 0).astype('int32')
+
+    profile = {'driver' : 'GTiff', 'width' : shape[1], 'height' : shape[0], 'count' : 1, 'crs' : 'EPSG:5070', 'transform' : Affine(10, 0, 0, 0, -10, 450)}
+    with rasterio.open(tmp_path / 'flowdir.tif', 'w', dtype='int16', nodata=-32768, **profile) as raster:
+        raster.write(flowdir, 1)
+    with rasterio.open(tmp_path / 'seeds.tif', 'w', dtype='int32', **profile) as raster:
+        raster.write(seeds, 1)
+
+    # None uses the default tile size, larger than the raster
+    monkeypatch.delenv('gage_watershed_tile_size', raising=False)
+    gage_watershed(str(tmp_path / 'flowdir.tif'), str(tmp_path / 'labels.tif'), seed_raster=str(tmp_path / 'seeds.tif'), tile_size=tile_size, number_of_jobs=2)
+
+    with rasterio.open(tmp_path / 'labels.tif') as raster:
+        labels = raster.read(1)
+
+    assert np.array_equal(labels, naive_labels(flowdir, seeds, -32768))
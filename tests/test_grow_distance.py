@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from grow_distance import euclidean_allocation, grow_distance_tiled, TILE_BYTES_PER_CELL, SOURCE_BYTES, FAR_CHUNK_CELLS
+
+
+def sparse_sources(shape, seed):
+    ''' Random sources (with unique values) in the left third of the grid, leaving a large area without sources '''
+
+    random = np.random.RandomState(seed)
+    sources = np.zeros(shape, dtype=bool)
+    sources[:, :shape[1] // 3] = random.rand(shape[0], shape[1] // 3) < 0.01
+    values = np.arange(sources.size, dtype=np.float64).reshape(shape)
+
+    return(sources, values)
+
+
+def run_tiled(sources, values, sampling, tile_size, halo=None, max_memory_mb=None):
+
+    windows = []
+
+    def read_window(window):
+        windows.append(window)
+        cells = window.toslices()
+        return(sources[cells], values[cells])
+
+    distance = np.full(sources.shape, -1.0)
+    allocation = np.full(sources.shape, -1.0)
+    for window, tile_distance, tile_allocation in grow_distance_tiled(read_window, sources.shape[0], sources.shape[1], sampling, tile_size, halo, max_memory_mb):
+        distance[window.toslices()] = tile_distance
+        allocation[window.toslices()] = tile_allocation
+
+    return(distance, allocation, windows)
+
+
+@pytest.mark.parametrize('tile_size', [7, 16, 50])
+def test_tiled_matches_whole_raster(tile_size):
+    sampling = (10.0, 10.0)
+    sources, values = sparse_sources((90, 120), tile_size)
+
+    expected_distance, _ = euclidean_allocation(sources, values, sampling)
+    distance, allocation, windows = run_tiled(sources, values, sampling, tile_size)
+
+    assert np.allclose(distance, expected_distance)
+
+    # the allocated source is one at the nearest distance (values identify the source cells)
+    rows, cols = np.divmod(allocation.astype(np.int64), sources.shape[1])
+    assert sources[rows, cols].all()
+    grid_rows, grid_cols = np.indices(sources.shape)
+    assert np.allclose(np.hypot((rows - grid_rows) * sampling[0], (cols - grid_cols) * sampling[1]), expected_distance)
+
+
+def test_tiles_are_not_grown_far_from_sources():
+    sources, values = sparse_sources((90, 120), 0)
+    tile_size, halo = 16, 4
+
+    _, _, windows = run_tiled(sources, values, (10.0, 10.0), tile_size, halo)
+
+    assert max(window.height for window in windows) <= tile_size + 2 * halo
+    assert max(window.width for window in windows) <= tile_size + 2 * halo
+
+
+def test_no_sources():
+    sources = np.zeros((20, 30), dtype=bool)
+
+    distance, allocation, _ = run_tiled(sources, np.zeros(sources.shape), (1.0, 1.0), 8)
+
+    assert np.isnan(distance).all() and np.isnan(allocation).all()
+
+
+def test_memory_limit_is_enforced():
+    sources, values = sparse_sources((90, 120), 0)
+
+    with pytest.raises(MemoryError):
+        run_tiled(sources, values, (10.0, 10.0), 4096, max_memory_mb=64)
+
+    # tiles fit, but not the boundary sources
+    tile_bytes = (16 + 2 * 4)**2 * TILE_BYTES_PER_CELL + FAR_CHUNK_CELLS * 48
+    with pytest.raises(MemoryError):
+        run_tiled(sources, values, (10.0, 10.0), 16, 4, max_memory_mb=(tile_bytes + 10 * SOURCE_BYTES) / 1024**2)
+
+    run_tiled(sources, values, (10.0, 10.0), 16, 4, max_memory_mb=(tile_bytes + sources.sum() * SOURCE_BYTES) / 1024**2)
@@ -0,0 +1,204 @@
+import os
+import sys
+import threading
+import huc_work_queue
+from huc_work_queue import HucWorkQueue, FINALIZE_ITEM
+
+
+def expire(queue, item, seconds=3600):
+    ''' Ages the lease on item as if its owner had stopped renewing it '''
+
+    lease_fileName = os.path.join(queue.lease_dir, item)
+    mtime = os.stat(lease_fileName).st_mtime - seconds
+    os.utime(lease_fileName, (mtime, mtime))
+
+
+def race(number_of_workers, target):
+    ''' Runs target(worker) on threads released at the same time and returns their results '''
+
+    barrier = threading.Barrier(number_of_workers)
+    results = [None] * number_of_workers
+
+    def run(worker):
+        barrier.wait()
+        results[worker] = target(worker)
+
+    threads = [threading.Thread(target=run, args=(worker,)) for worker in range(number_of_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return(results)
+
+
+def test_claim_is_exclusive(tmp_path):
+    queue = HucWorkQueue(str(tmp_path))
+
+    for attempt in range(10):
+        item = '1202000{}'.format(attempt)
+        leases = race(8, lambda worker: queue.claim(item, 'worker{}'.format(worker)))
+
+        assert sum(lease is not None for lease in leases) == 1
+
+
+def test_live_lease_is_not_taken_over(tmp_path):
+    queue = HucWorkQueue(str(tmp_path), lease_timeout=600)
+
+    lease = queue.claim('12020001', 'a')
+
+    assert queue.claim('12020001', 'b') is None
+    assert queue.renew('12020001', lease)
+    assert queue.lease_owner('12020001') == 'a'
+
+
+def test_expired_lease_is_taken_over_once(tmp_path):
+    queue = HucWorkQueue(str(tmp_path), lease_timeout=600)
+
+    for attempt in range(10):
+        item = '1202000{}'.format(attempt)
+        expired_lease = queue.claim(item, 'crashed')
+        expire(queue, item)
+
+        leases = race(8, lambda worker: queue.claim(item, 'worker{}'.format(worker)))
+        winners = [lease for lease in leases if lease is not None]
+
+        assert len(winners) == 1
+        assert queue.read_lease(item)[0] == winners[0]
+        assert not queue.renew(item, expired_lease)
+
+
+def test_stale_takeover_does_not_replace_new_lease(tmp_path):
+    queue = HucWorkQueue(str(tmp_path), lease_timeout=600)
+
+    expired_lease = queue.claim('12020001', 'crashed')
+    expire(queue, '12020001')
+
+    # b takes over first; a acts on the expired lease it read before that and must not replace b's lease
+    new_lease = queue.claim('12020001', 'b')
+    stale_lease = 'a 0123456789abcdef'
+
+    assert new_lease is not None
+    assert not queue._retire('12020001', expired_lease, stale_lease)
+    assert queue.read_lease('12020001')[0] == new_lease
+
+    # nor can a release of the expired lease remove it
+    queue.release('12020001', expired_lease)
+    assert queue.read_lease('12020001')[0] == new_lease
+
+
+def test_release_frees_the_item(tmp_path):
+    queue = HucWorkQueue(str(tmp_path))
+
+    lease = queue.claim('12020001', 'a')
+    queue.release('12020001', lease)
+
+    assert queue.lease_owner('12020001') is None
+    assert queue.claim('12020001', 'b') is not None
+
+
+def test_run_huc_moves_previous_attempt_aside(tmp_path):
+    queue = HucWorkQueue(str(tmp_path))
+    os.makedirs(os.path.join(str(tmp_path), '12020001', 'partial'))
+
+    lease = queue.claim('12020001', 'a')
+    command = [sys.executable, '-c', 'import os, sys; os.makedirs(os.path.join({!r}, sys.argv[1]))'.format(str(tmp_path))]
+    exit_status = huc_work_queue.run_huc(queue, '12020001', lease, command)
+
+    assert exit_status == 0
+    assert queue.is_done('12020001')
+    assert queue.lease_owner('12020001') is None
+    assert not os.path.isdir(os.path.join(str(tmp_path), '12020001', 'partial'))
+    assert [os.listdir(os.path.join(queue.abandoned_dir, name)) for name in os.listdir(queue.abandoned_dir)] == [['partial']]
+
+
+def test_run_huc_stops_when_lease_is_lost(tmp_path):
+    queue = HucWorkQueue(str(tmp_path), lease_timeout=600, heartbeat_interval=0.2)
+
+    lease = queue.claim('12020001', 'a')
+    expire(queue, '12020001')
+    assert queue.claim('12020001', 'b') is not None
+
+    exit_status = huc_work_queue.run_huc(queue, '12020001', lease, [sys.executable, '-c', 'import time; time.sleep(30)'])
+
+    assert exit_status is None
+    assert not queue.is_done('12020001') and not queue.is_failed('12020001')
+    assert queue.lease_owner('12020001') == 'b'
+
+
+def test_workers_run_every_huc_once(tmp_path):
+    hucs = ['120200{:02d}'.format(i) for i in range(12)]
+    ran_fileName = os.path.join(str(tmp_path), 'ran.txt')
+    command = [sys.executable, '-c', 'import sys; open({!r}, "a").write(sys.argv[1] + "\\n")'.format(ran_fileName)]
+
+    statuses = race(3, lambda worker: huc_work_queue.huc_work_queue(str(tmp_path), hucs, command, number_of_jobs=2, lease_timeout=60, heartbeat_interval=1, poll_interval=0.1))
+
+    with open(ran_fileName) as f:
+        ran = f.read().split()
+
+    assert sorted(ran) == hucs
+    assert all(status['done'] == len(hucs) for status in statuses)
+
+
+def finalize_command(tmp_path):
+
+    return([sys.executable, '-c', 'open({!r}, "a").write("finalized\\n")'.format(os.path.join(str(tmp_path), 'finalized.txt'))])
+
+
+def finalized_count(tmp_path):
+
+    try:
+        with open(os.path.join(str(tmp_path), 'finalized.txt')) as f:
+            return(len(f.read().split()))
+    except FileNotFoundError:
+        return(0)
+
+
+def test_finalize_runs_once_per_set_of_done_hucs(tmp_path):
+    queue = HucWorkQueue(str(tmp_path))
+    queue.initialize(['12020001', '12020002'])
+    queue.mark('12020001', 0, 'a')
+
+    # not all HUCs have finished
+    assert huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path)) == 0
+    assert finalized_count(tmp_path) == 0
+
+    queue.mark('12020002', 1, 'a')
+    assert race(4, lambda worker: huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path))) == [0, 0, 0, 0]
+    assert finalized_count(tmp_path) == 1
+    assert queue.lease_owner(FINALIZE_ITEM) is None
+
+    # rerun with nothing new
+    huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path))
+    assert finalized_count(tmp_path) == 1
+
+    # a failed HUC completes on a retry
+    os.remove(os.path.join(queue.failed_dir, '12020002'))
+    queue.mark('12020002', 0, 'b')
+    huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path))
+    assert finalized_count(tmp_path) == 2
+
+
+def test_finalize_is_taken_over_from_a_crashed_node(tmp_path):
+    queue = HucWorkQueue(str(tmp_path), lease_timeout=600)
+    queue.initialize(['12020001'])
+    queue.mark('12020001', 0, 'a')
+
+    # a node claimed finalize and died
+    queue.claim(FINALIZE_ITEM, 'crashed.finalize')
+    assert huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path)) == 0
+    assert finalized_count(tmp_path) == 0
+
+    expire(queue, FINALIZE_ITEM)
+    assert huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path)) == 0
+    assert finalized_count(tmp_path) == 1
+
+
+def test_failed_finalize_is_retried(tmp_path):
+    queue = HucWorkQueue(str(tmp_path))
+    queue.initialize(['12020001'])
+    queue.mark('12020001', 0, 'a')
+
+    assert huc_work_queue.finalize(str(tmp_path), [sys.executable, '-c', 'raise SystemExit(3)']) == 3
+    assert huc_work_queue.finalize(str(tmp_path), finalize_command(tmp_path)) == 0
+    assert finalized_count(tmp_path) == 1
@@ -0,0 +1,37 @@
+import numpy as np
+from shapely.geometry import LineString
+from utils.line_splitting import split_line, split_line_reference
+
+
+def assert_same_split(lineString, splitLength):
+
+    split_lines, lengths = split_line(lineString, splitLength)
+    expected = split_line_reference(lineString, splitLength)
+
+    assert len(split_lines) == len(expected)
+    for splitLineString, length, expected_line in zip(split_lines, lengths, expected):
+        assert np.array_equal(np.array(splitLineString.coords), np.array(expected_line.coords))
+        assert length == expected_line.length
+
+
+def test_split_line_matches_cumulative_line_loop():
+
+    rng = np.random.default_rng(0)
+    for number_of_vertices in [2, 3, 10, 200]:
+        for _ in range(20):
+            coords = np.cumsum(rng.normal(0, 100, (number_of_vertices, 2)), axis=0) + [400000, 3000000]
+            lineString = LineString(coords)
+            for max_length in [50, 300, 1500]:
+                assert_same_split(lineString, lineString.length / np.ceil(lineString.length / max_length))
+
+
+def test_split_line_special_lines():
+
+    # ends exactly at a split (the last segment is repeated)
+    assert_same_split(LineString([(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)]), 2.0)
+    # repeated vertices
+    assert_same_split(LineString([(0, 0), (1, 0), (1, 0), (2, 0), (2, 1), (2, 1), (5, 1)]), 1.5)
+    # loops back through its last vertex
+    assert_same_split(LineString([(0, 0), (3, 0), (3, 3), (0, 3), (3, 0), (6, 0)]), 2.5)
+    # 3D coordinates split in the plane
+    assert_same_split(LineString([(0, 0, 5), (2, 0, 4), (2, 3, 3), (6, 3, 1)]), 2.0)
@@ -0,0 +1,81 @@
+import numpy as np
+import rasterio
+import rasterio.sample
+from affine import Affine
+from utils.point_sampling import BlockSampler, sample_points
+
+
+def write_raster(path, nodata, shape=(50, 45), dtype='float32', transform=Affine(10, 0, 1000, 0, -10, 2500)):
+    ''' A tiled raster of 16 x 16 blocks with partial blocks on the right and bottom '''
+
+    rng = np.random.default_rng(0)
+    profile = {'driver' : 'GTiff', 'width' : shape[1], 'height' : shape[0], 'count' : 1, 'crs' : 'EPSG:5070', 'dtype' : dtype,
+               'nodata' : nodata, 'transform' : transform, 'tiled' : True, 'blockxsize' : 16, 'blockysize' : 16}
+    with rasterio.open(path, 'w', **profile) as raster:
+        raster.write(rng.uniform(1, 100, shape).astype(dtype), 1)
+
+
+def edge_and_off_raster_points(transform, shape=(50, 45)):
+    ''' Cell corners, edges and centers (on and inside the raster bounds), the raster corners and points off the raster '''
+
+    columns, rows = np.meshgrid(np.arange(-2, 2 * shape[1] + 3) / 2, np.arange(-2, 2 * shape[0] + 3) / 2)
+    xs, ys = transform * (columns.ravel(), rows.ravel())
+    width, height = shape[1] * transform.a, shape[0] * transform.e
+    xs = np.r_[xs, transform.c + width, transform.c - 1e6, transform.c + 1e6, transform.c + width / 2]
+    ys = np.r_[ys, transform.f + height, transform.f + height / 2, transform.f + height / 2, transform.f - 1e6 * transform.e]
+
+    return(xs, ys)
+
+
+def sample_gen_values(raster, xs, ys):
+    return(np.array([value[0] for value in rasterio.sample.sample_gen(raster, zip(xs, ys))]))
+
+
+def test_sample_points_match_sample_gen(tmp_path):
+    rng = np.random.default_rng(1)
+
+    # with a fractional cell size, most cell edges are not exact floating point values
+    for nodata, dtype, transform in [(-9999, 'float32', Affine(10, 0, 1000, 0, -10, 2500)), (None, 'float32', Affine(10, 0, 1000, 0, -10, 2500)),
+                                     (None, 'int16', Affine(10, 0, 1000, 0, -10, 2500)), (-9999, 'float32', Affine(0.1, 0, 0, 0, -0.1, 5))]:
+        write_raster(tmp_path / 'raster.tif', nodata, dtype=dtype, transform=transform)
+
+        with rasterio.open(tmp_path / 'raster.tif') as raster:
+            xs, ys = edge_and_off_raster_points(transform)
+            columns, rows = rng.uniform(-5, 50, 1000), rng.uniform(-5, 55, 1000)
+            xs = np.r_[transform.c + columns * transform.a, xs]
+            ys = np.r_[transform.f + rows * transform.e, ys]
+
+            values = sample_points(raster, xs, ys)
+            expected = sample_gen_values(raster, xs, ys)
+
+        assert values.dtype == expected.dtype
+        assert np.array_equal(values, expected)
+        # points off the raster get the nodata value, 0 without nodata
+        assert (values[-3:] == (nodata if nodata is not None else 0)).all()
+
+
+def test_block_sampler_evicts_least_recently_used_blocks(tmp_path):
+    write_raster(tmp_path / 'raster.tif', -9999)
+    rng = np.random.default_rng(2)
+
+    with rasterio.open(tmp_path / 'raster.tif') as raster, rasterio.open(tmp_path / 'raster.tif') as reference:
+        reads = []
+        read = raster.read
+        raster.read = lambda *args, **kwargs: reads.append(kwargs['window']) or read(*args, **kwargs)
+
+        # the points of each call touch all 12 blocks, more than the cache holds
+        with BlockSampler(raster, cache_blocks=3) as sampler:
+            for _ in range(4):
+                xs, ys = rng.uniform(1000, 1450, 500), rng.uniform(2000, 2500, 500)
+                assert np.array_equal(sampler.sample(xs, ys), sample_gen_values(reference, xs, ys))
+                assert len(sampler._cache) == 3
+
+        # each block is read once per call: blocks are visited in order, so the cached last blocks are evicted before reuse
+        assert len(reads) == 4 * 12
+
+        # repeated points hit the cache, and the least recently used block is evicted first
+        reads.clear()
+        with BlockSampler(raster, cache_blocks=2) as sampler:
+            for x in [1005.0, 1165.0, 1005.0, 1325.0, 1005.0, 1165.0]:
+                assert np.array_equal(sampler.sample([x], [2495.0]), sample_gen_values(reference, [x], [2495.0]))
+        assert [window.col_off for window in reads] == [0, 16, 32, 16]
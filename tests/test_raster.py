@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+from raster import Raster
+
+
+def write_geotiff(fileName, array, ndv=-9999):
+
+    dataset = gdal.GetDriverByName('GTiff').Create(fileName, array.shape[1], array.shape[0], 1, gdal.GDT_Int16)
+    dataset.SetGeoTransform((1000, 10, 0, 2000, 0, -10))
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(ndv)
+    band.WriteArray(array)
+    band, dataset = None, None
+
+
+def test_lazy_array_matches_loaded_array(tmp_path):
+    array = np.arange(35, dtype=np.int16).reshape(5, 7)
+    write_geotiff(str(tmp_path / 'raster.tif'), array)
+
+    lazy = Raster(str(tmp_path / 'raster.tif'), loadArray=False, dtype=np.float32)
+    assert not lazy.isLoaded
+    assert (lazy.nrows, lazy.ncols, lazy.ndv, lazy.dt) == (5, 7, -9999, 6)
+
+    loaded = Raster(str(tmp_path / 'raster.tif'), dtype=np.float32)
+    assert lazy.array.dtype == loaded.array.dtype == np.float32
+    assert np.array_equal(lazy.array, loaded.array)
+    assert lazy.isLoaded
+
+
+def test_copy_of_lazy_raster(tmp_path):
+    array = np.arange(35, dtype=np.int16).reshape(5, 7)
+    write_geotiff(str(tmp_path / 'raster.tif'), array)
+
+    lazy = Raster(str(tmp_path / 'raster.tif'), loadArray=False)
+    copied = lazy.copy()
+    assert not copied.isLoaded
+    assert np.array_equal(copied.array, array)
+
+    # assignments are kept by copies and not read over
+    lazy.array = np.zeros_like(array)
+    assert not lazy.copy().array.any()
+    assert np.array_equal(copied.array, array)
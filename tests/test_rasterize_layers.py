@@ -0,0 +1,72 @@
+import numpy as np
+import geopandas as gpd
+import rasterio
+from affine import Affine
+from shapely.geometry import LineString, MultiLineString
+from rasterize_layers import line_cells, rasterize_layers, parse_layer_spec
+
+
+def sampled_cells(line, transform, samples=200001):
+    ''' Cells of a line found by sampling it densely (reference for line_cells) '''
+
+    cells = set()
+    for start, end in zip(line.coords[:-1], line.coords[1:]):
+        fractions = np.linspace(0, 1, samples)
+        cols, rows = ~transform * (start[0] + fractions * (end[0] - start[0]), start[1] + fractions * (end[1] - start[1]))
+        cells.update(zip(np.floor(rows).astype(int), np.floor(cols).astype(int)))
+
+    return(cells)
+
+
+def test_line_cells_touch_every_crossed_cell():
+    transform = Affine(10, 0, 1000, 0, -10, 2000)
+    random = np.random.RandomState(0)
+
+    for _ in range(20):
+        coords = np.column_stack([1000 + random.uniform(0, 200, 4), 2000 - random.uniform(0, 200, 4), random.uniform(0, 50, 4)])
+        line = LineString(coords)
+        rows, cols, z = line_cells([line], transform)
+
+        assert set(zip(rows, cols)) == sampled_cells(line, transform)
+        assert ((z >= coords[:, 2].min()) & (z <= coords[:, 2].max())).all()
+
+
+def test_line_cells_burn_cells_clipped_at_a_corner():
+    transform = Affine(1, 0, 0, 0, -1, 10)
+
+    # crosses only the lower right corner of the cell at row 0, column 0 (between 1/7 and 4/10 of its length)
+    rows, cols, z = line_cells([LineString([(0.8, 8.9, 0), (1.3, 9.6, 70)])], transform)
+
+    corner = (rows == 0) & (cols == 0)
+    assert list(zip(rows, cols)) == [(1, 0), (0, 0), (0, 1)]
+    assert 10 < z[corner][0] < 28
+
+
+def test_line_cells_interpolate_z_and_skip_2d_lines():
+    transform = Affine(1, 0, 0, 0, -1, 10)
+    lines = [LineString([(0, 5.5), (10, 5.5)]), MultiLineString([[(0.5, 4.5, 0), (3.5, 4.5, 30)]])]
+
+    rows, cols, z = line_cells(lines, transform)
+
+    assert list(rows) == [5, 5, 5, 5]
+    assert list(cols) == [0, 1, 2, 3]
+    assert np.allclose(z, [2.5, 10, 20, 27.5])
+
+
+def test_rasterize_layers_burns_levees_without_gaps(tmp_path):
+    transform = Affine(10, 0, 0, 0, -10, 300)
+    with rasterio.open(tmp_path / 'dem.tif', 'w', driver='GTiff', width=30, height=30, count=1, dtype='float32', crs='EPSG:5070', transform=transform) as dem:
+        dem.write(np.zeros((1, 30, 30), dtype='float32'))
+
+    levee = LineString([(3, 297, 100), (151, 160, 120), (297, 4, 140)])
+    gpd.GeoDataFrame(geometry=[levee], crs='EPSG:5070').to_file(tmp_path / 'levees.gpkg', driver='GPKG')
+
+    spec = parse_layer_spec('vector={},output={},burn=z,dtype=float32,nodata=-999999,all_touched'.format(tmp_path / 'levees.gpkg', tmp_path / 'levees.tif'))
+    rasterize_layers(str(tmp_path / 'dem.tif'), [spec], blocksize=16)
+
+    with rasterio.open(tmp_path / 'levees.tif') as raster:
+        burned = raster.read(1)
+
+    burned_cells = set(zip(*np.nonzero(burned != -999999)))
+    assert burned_cells == sampled_cells(levee, transform)
+    assert ((burned[burned != -999999] >= 100) & (burned[burned != -999999] <= 140)).all()
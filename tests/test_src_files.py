@@ -0,0 +1,55 @@
+import json
+import numpy as np
+import pandas as pd
+from utils.src_files import write_src_json, write_src_binary, read_src_binary
+
+
+def baseline_src_json(output_src):
+    ''' The src.json dictionary add_crosswalk built one HydroID at a time '''
+
+    output_src_json = dict()
+    for hid in np.unique(output_src['HydroID']):
+        indices_of_hid = output_src['HydroID'] == hid
+        stage_list = output_src['Stage'][indices_of_hid].astype(float).tolist()
+        q_list = output_src['Discharge (m3s-1)'][indices_of_hid].astype(float).tolist()
+        output_src_json[str(hid)] = { 'q_list' : q_list , 'stage_list' : stage_list }
+
+    return(output_src_json)
+
+
+def synthetic_src():
+    ''' Interleaved HydroIDs whose text order differs from their numeric order (9 < 10 < 100), with -999 discharges '''
+
+    rng = np.random.default_rng(0)
+    hydro_ids = [100, 9, 10, 1000, 25]
+    stages = np.round(np.arange(0, 8) * 0.3048, 4)
+
+    output_src = pd.DataFrame([(hydro_id, stage) for stage in stages for hydro_id in hydro_ids], columns=['HydroID', 'Stage'])
+    output_src['Discharge (m3s-1)'] = rng.uniform(0, 1000, len(output_src))
+    output_src.loc[output_src['Stage'] == 0, 'Discharge (m3s-1)'] = 0
+    output_src.loc[(output_src['HydroID'] == 25) & (output_src['Stage'] < 1), 'Discharge (m3s-1)'] = -999
+
+    return(output_src)
+
+
+def test_src_json_matches_json_dump(tmp_path):
+
+    for output_src in [synthetic_src(), synthetic_src().iloc[:0]]:
+        write_src_json(output_src, str(tmp_path / 'src.json'))
+
+        with open(tmp_path / 'src.json') as f:
+            assert f.read() == json.dumps(baseline_src_json(output_src), sort_keys=True, indent=2)
+
+
+def test_src_binary_reads_as_src_json(tmp_path):
+    output_src = synthetic_src()
+
+    write_src_json(output_src, str(tmp_path / 'src.json'))
+    write_src_binary(output_src, str(tmp_path / 'src.npz'))
+
+    with open(tmp_path / 'src.json') as f:
+        src_json = json.load(f)
+    src_binary = read_src_binary(str(tmp_path / 'src.npz'))
+
+    assert src_binary == src_json
+    assert list(src_binary) == list(src_json)
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+import geopandas as gpd
+import rasterio
+from affine import Affine
+from shapely.geometry import Point, LineString
+from shapely.wkb import dumps, loads
+
+pygeos = pytest.importorskip('pygeos', exc_type=ImportError)
+from usgs_gage_crosswalk import gage_elevations
+
+
+def baseline_gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj):
+    ''' The per gage loop of crosswalk_usgs_gage '''
+
+    columns = ['location_id','HydroID','dem_elevation','dem_adj_elevation','min_thal_elev', 'med_thal_elev','max_thal_elev','str_order']
+    gage_data = []
+
+    for index, gage in usgs_gages.iterrows():
+
+        hydro_id = closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].HydroID.item()
+        str_order = str(int(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].order_.item()))
+        min_thal_elev = round(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].min_thal_elev.item(),2)
+        med_thal_elev = round(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].med_thal_elev.item(),2)
+        max_thal_elev = round(closest_hydro_id.loc[closest_hydro_id.location_id==gage.location_id].max_thal_elev.item(),2)
+
+        gage_bin_geom = pygeos.io.from_wkb(dumps(gage.geometry))
+        closest_stream = input_flows.loc[input_flows.HydroID==hydro_id]
+        stream_bin_geom = pygeos.io.from_wkb(dumps(closest_stream.geometry.item()))
+
+        gage_distance_to_line = pygeos.linear.line_locate_point(stream_bin_geom, gage_bin_geom)
+        referenced_gage = pygeos.linear.line_interpolate_point(stream_bin_geom, gage_distance_to_line)
+        shply_referenced_gage = loads(pygeos.io.to_wkb(referenced_gage))
+
+        dem_m_elev = round(list(rasterio.sample.sample_gen(dem_m,shply_referenced_gage.coords))[0].item(),2)
+        dem_adj_elev = round(list(rasterio.sample.sample_gen(dem_adj,shply_referenced_gage.coords))[0].item(),2)
+
+        gage_data.append([str(gage.location_id), str(hydro_id), dem_m_elev, dem_adj_elev, min_thal_elev, med_thal_elev, max_thal_elev,str(str_order)])
+
+    return(pd.DataFrame(gage_data, columns=columns))
+
+
+def synthetic_inputs(tmp_path):
+    '''
+    Streams and DEMs on a 10 m grid and gages in unsorted order. Gages 04 and 05 lie beyond the ends of their streams
+    and snap onto the line endpoints, which are cell corners.
+
+    '''
+
+    rng = np.random.default_rng(0)
+    profile = {'driver' : 'GTiff', 'width' : 40, 'height' : 30, 'count' : 1, 'crs' : 'EPSG:5070', 'dtype' : 'float32',
+               'nodata' : -9999, 'transform' : Affine(10, 0, 1000, 0, -10, 2300), 'tiled' : True, 'blockxsize' : 16, 'blockysize' : 16}
+    for name in ['dem_meters', 'dem_thalwegCond']:
+        with rasterio.open(tmp_path / '{}.tif'.format(name), 'w', **profile) as raster:
+            raster.write(rng.uniform(100, 200, (30, 40)).astype('float32'), 1)
+
+    input_flows = gpd.GeoDataFrame({'HydroID' : [101, 102, 103]},
+                                   geometry=[LineString([(1010, 2290), (1125.3, 2180.7), (1200, 2150)]),
+                                             LineString([(1200, 2150), (1300, 2150)]),
+                                             LineString([(1250.5, 2050.5), (1390, 2010)])], crs='EPSG:5070')
+
+    usgs_gages = gpd.GeoDataFrame({'location_id' : ['03', '01', '05', '02', '04']},
+                                  geometry=[Point(1320, 2040), Point(1060, 2230), Point(1310, 2140), Point(1210, 2160), Point(995, 2300)], crs='EPSG:5070')
+
+    # the HydroIDs are floats, as after the left sjoin and dropna of crosswalk_usgs_gage
+    closest_hydro_id = pd.DataFrame({'location_id' : ['01', '02', '03', '04', '05', '06'],
+                                     'HydroID' : [101, 102, 103, 101, 102, np.nan],
+                                     'min_thal_elev' : [101.234, 99.995, 120.5, 101.234, 99.995, 1.0],
+                                     'med_thal_elev' : [105.675, 102.125, 121.004, 105.675, 102.125, 1.0],
+                                     'max_thal_elev' : [110.0, 104.444, 125.555, 110.0, 104.444, 1.0],
+                                     'order_' : [1.0, 2.0, 3.0, 1.0, 2.0, np.nan]}).dropna().sample(frac=1, random_state=0)
+
+    return(usgs_gages, closest_hydro_id, input_flows)
+
+
+def test_gage_elevations_match_gage_loop(tmp_path):
+    usgs_gages, closest_hydro_id, input_flows = synthetic_inputs(tmp_path)
+
+    with rasterio.open(tmp_path / 'dem_meters.tif') as dem_m, rasterio.open(tmp_path / 'dem_thalwegCond.tif') as dem_adj:
+        elev_table = gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj)
+        expected = baseline_gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj)
+
+    pd.testing.assert_frame_equal(elev_table, expected)
+    assert elev_table['location_id'].tolist() == ['03', '01', '05', '02', '04']
+    assert elev_table['HydroID'].tolist() == ['103.0', '101.0', '102.0', '102.0', '101.0']
+    assert elev_table['str_order'].tolist() == ['3', '1', '2', '2', '1']
+    assert elev_table['max_thal_elev'].tolist() == [125.56, 110.0, 104.44, 104.44, 110.0]
+
+
+def test_gage_elevations_without_gages(tmp_path):
+    usgs_gages, closest_hydro_id, input_flows = synthetic_inputs(tmp_path)
+    usgs_gages = usgs_gages.iloc[:0]
+
+    with rasterio.open(tmp_path / 'dem_meters.tif') as dem_m, rasterio.open(tmp_path / 'dem_thalwegCond.tif') as dem_adj:
+        elev_table = gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj)
+        expected = baseline_gage_elevations(usgs_gages, closest_hydro_id, input_flows, dem_m, dem_adj)
+
+    assert elev_table.empty
+    pd.testing.assert_frame_equal(elev_table, expected)
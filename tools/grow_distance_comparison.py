@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import rasterio
+sys.path.append('/foss_fim/src')
+from r_grow_distance import r_grow_distance
+from grow_distance import grow_distance
+
+
+def grow_distance_comparison(input_raster, allocation_dtype='Float32', tile_size=None, tolerance=1e-3, scratch_dir=None):
+    '''
+    Runs GRASS r.grow.distance and the native grow_distance on the same raster and compares the outputs. Allocation
+    differences are only expected where a cell is equidistant from several sources, so differing cells whose
+    proximities agree are counted as ties.
+
+    Parameters
+    ----------
+    input_raster : STR
+        Raster to compute proximity and allocation for. For example, agree_smogrid.tif or demDerived_streamPixels_ids.tif.
+    allocation_dtype : STR
+        Allocation data type ('Float32' for AGREE, 'Int32' for the stream pixel ids).
+    tile_size : INT
+        Tile size of the native run. None processes the whole raster at once.
+    tolerance : FLOAT
+        Proximity tolerance in map units.
+    scratch_dir : STR
+        Directory for the outputs of both runs.
+
+    Returns
+    -------
+    results : DICT
+        Run times, maximum proximity difference and allocation mismatch counts.
+
+    '''
+
+    workspace = tempfile.mkdtemp(dir = scratch_dir)
+    try:
+        grass_input = os.path.join(workspace, 'grass', os.path.basename(input_raster))
+        native_input = os.path.join(workspace, 'native', os.path.basename(input_raster))
+        for copy in (grass_input, native_input):
+            os.makedirs(os.path.dirname(copy))
+            shutil.copy(input_raster, copy)
+
+        grass_start = time.perf_counter()
+        grass_dist, grass_allo = r_grow_distance(grass_input, os.path.join(workspace, 'grass_workspace'), 'Float32', allocation_dtype)
+        grass_sec = time.perf_counter() - grass_start
+
+        native_start = time.perf_counter()
+        native_dist, native_allo = grow_distance(native_input, 'Float32', allocation_dtype, tile_size)
+        native_sec = time.perf_counter() - native_start
+
+        with rasterio.open(grass_dist) as grass, rasterio.open(native_dist) as native:
+            grass_distance, native_distance = grass.read(1), native.read(1)
+        with rasterio.open(grass_allo) as grass, rasterio.open(native_allo) as native:
+            grass_allocation, native_allocation = grass.read(1), native.read(1)
+    finally:
+        shutil.rmtree(workspace)
+
+    distance_difference = np.abs(grass_distance.astype('float64') - native_distance)
+    allocation_mismatch = grass_allocation != native_allocation
+    ties = allocation_mismatch & (distance_difference <= tolerance)
+
+    results = {'grass_sec' : round(grass_sec, 2), 'native_sec' : round(native_sec, 2),
+               'max_proximity_difference' : float(np.nanmax(distance_difference)),
+               'proximity_cells_over_tolerance' : int(np.sum(distance_difference > tolerance)),
+               'allocation_mismatches' : int(allocation_mismatch.sum()),
+               'allocation_mismatches_at_ties' : int(ties.sum()),
+               'cells' : int(grass_distance.size)}
+
+    for key, value in results.items():
+        print('{} : {}'.format(key, value))
+
+    return(results)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Compare GRASS r.grow.distance with the native grow_distance')
+    parser.add_argument('-i', '--in_raster', help = 'Raster to compute proximity and allocation for', required = True)
+    parser.add_argument('-a', '--allo_dtype', help = 'Allocation data type. Default is Float32', required = False, default = 'Float32')
+    parser.add_argument('-t', '--tile_size', help = 'Tile size of the native run', required = False, default = None, type = int)
+    parser.add_argument('-e', '--tolerance', help = 'Proximity tolerance in map units. Default is 0.001', required = False, default = 1e-3, type = float)
+    parser.add_argument('-s', '--scratch_dir', help = 'Directory for the outputs of both runs', required = False, default = None)
+
+    args = vars(parser.parse_args())
+
+    grow_distance_comparison(args['in_raster'], args['allo_dtype'], args['tile_size'], args['tolerance'], args['scratch_dir'])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import rasterio
+import pandas as pd
+
+# Rasters kept as deliverables (see src/output_cleanup.py). These always use LZW and are excluded.
+DELIVERABLE_RASTERS = ['rem_zeroed_masked.tif', 'gw_catchments_reaches_filtered_addedAttributes.tif']
+
+
+def codec_profile(codec, level=None, max_z_error=0):
+    ''' Returns rasterio creation options for a codec name (NONE, LZW, DEFLATE, ZSTD, LERC, LERC_ZSTD) '''
+
+    codec = codec.upper()
+    profile = {'tiled' : True, 'blockxsize' : 512, 'blockysize' : 512, 'compress' : codec.lower(), 'BIGTIFF' : 'YES'}
+
+    if level is not None:
+        if codec in ('ZSTD', 'LERC_ZSTD'):
+            profile['zstd_level'] = level
+        elif codec == 'DEFLATE':
+            profile['zlevel'] = level
+
+    if codec.startswith('LERC'):
+        profile['max_z_error'] = max_z_error
+
+    return(profile)
+
+
+def benchmark_raster(raster_filename, codecs, level, max_z_error, scratch_dir):
+    '''
+    Writes and reads back one raster with each codec and records the CPU time spent and the file size.
+
+    Parameters
+    ----------
+    raster_filename : STR
+        Path to an intermediate raster from a HUC output directory.
+    codecs : LIST
+        Codec names to compare.
+    level : INT
+        Codec level (ZSTD, LERC_ZSTD or DEFLATE). None uses the GDAL default.
+    max_z_error : FLOAT
+        LERC max error.
+    scratch_dir : STR
+        Directory to write the test rasters to.
+
+    Returns
+    -------
+    records : LIST
+        One dictionary per codec.
+
+    '''
+
+    with rasterio.open(raster_filename) as src:
+        profile = src.profile.copy()
+        data = src.read(1)
+
+    records = []
+    for codec in codecs:
+        test_filename = os.path.join(scratch_dir, '{}_{}.tif'.format(os.path.splitext(os.path.basename(raster_filename))[0], codec.lower()))
+        profile.update(codec_profile(codec, level, max_z_error))
+
+        write_start = time.process_time()
+        with rasterio.open(test_filename, 'w', **profile) as dst:
+            dst.write(data, indexes = 1)
+        write_cpu = time.process_time() - write_start
+
+        read_start = time.process_time()
+        with rasterio.open(test_filename) as dst:
+            dst.read(1)
+        read_cpu = time.process_time() - read_start
+
+        records.append({'raster' : os.path.basename(raster_filename), 'codec' : codec,
+                        'write_cpu_sec' : round(write_cpu, 3), 'read_cpu_sec' : round(read_cpu, 3),
+                        'size_mb' : round(os.path.getsize(test_filename) / 1024**2, 2)})
+        os.remove(test_filename)
+
+    return(records)
+
+
+def intermediate_compression_benchmark(huc_directory, codecs, level=None, max_z_error=0, output_csv=None, scratch_dir=None):
+    '''
+    Estimates the per-HUC CPU time spent compressing and decompressing intermediate rasters for each codec. Compare the LZW rows (current) with the candidate codec rows.
+
+    '''
+
+    raster_list = sorted(f for f in os.listdir(huc_directory) if f.endswith('.tif') and f not in DELIVERABLE_RASTERS)
+
+    scratch_dir = tempfile.mkdtemp(dir = scratch_dir)
+    records = []
+    try:
+        for raster in raster_list:
+            records += benchmark_raster(os.path.join(huc_directory, raster), codecs, level, max_z_error, scratch_dir)
+    finally:
+        shutil.rmtree(scratch_dir)
+
+    results = pd.DataFrame(records)
+    if results.empty:
+        print('No intermediate rasters found in {}'.format(huc_directory))
+        return(results)
+
+    summary = results.groupby('codec')[['write_cpu_sec', 'read_cpu_sec', 'size_mb']].sum()
+    summary['total_cpu_sec'] = summary.write_cpu_sec + summary.read_cpu_sec
+    print(summary.loc[codecs].round(2).to_string())
+
+    if output_csv is not None:
+        results.to_csv(output_csv, index=False)
+
+    return(results)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare CPU time and size of intermediate rasters of one HUC across GeoTIFF codecs')
+    parser.add_argument('-d', '--huc-directory', help='HUC output directory (run with production mode off so intermediates are kept)', required=True)
+    parser.add_argument('-c', '--codecs', help='Codecs to compare. Default is "LZW NONE ZSTD LERC_ZSTD"', required=False, nargs='+', default=['LZW', 'NONE', 'ZSTD', 'LERC_ZSTD'])
+    parser.add_argument('-l', '--level', help='Codec level for ZSTD, LERC_ZSTD and DEFLATE', required=False, default=None, type=int)
+    parser.add_argument('-z', '--max-z-error', help='LERC max error. Default is 0 (lossless)', required=False, default=0, type=float)
+    parser.add_argument('-o', '--output-csv', help='Per raster results', required=False, default=None)
+    parser.add_argument('-s', '--scratch-dir', help='Directory for test rasters. Use the disk the pipeline writes intermediates to.', required=False, default=None)
+
+    args = vars(parser.parse_args())
+
+    intermediate_compression_benchmark(args['huc_directory'], [codec.upper() for codec in args['codecs']], args['level'], args['max_z_error'], args['output_csv'], args['scratch_dir'])
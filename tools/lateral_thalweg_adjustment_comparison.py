@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import rasterio
+sys.path.append('/foss_fim/src')
+from unique_pixel_and_allocation import stream_pixel_zones
+from adjust_thalweg_lateral import adjust_thalweg_laterally
+
+
+def lateral_thalweg_adjustment_comparison(dem_meters, stream_pixels, reference_adjusted_dem, cost_distance_tolerance=50, number_of_jobs=None, scratch_dir=None):
+    '''
+    Reruns the lateral thalweg adjustment of a HUC (stream pixel ids, allocation and the zonal minimum) and compares the
+    output with a dem_lateral_thalweg_adj.tif produced by an earlier version, for example the float64 allocation ids and
+    typed dictionary zonal minimum.
+
+    Parameters
+    ----------
+    dem_meters : STR
+        Elevation raster of the HUC (dem_meters.tif).
+    stream_pixels : STR
+        Stream pixel raster of the HUC (demDerived_streamPixels.tif).
+    reference_adjusted_dem : STR
+        Reference output (dem_lateral_thalweg_adj.tif).
+    cost_distance_tolerance : FLOAT
+        Tolerance used by run_by_unit.sh.
+    number_of_jobs : INT
+        Number of threads processing blocks.
+    scratch_dir : STR
+        Directory for the outputs of the rerun.
+
+    Returns
+    -------
+    results : DICT
+        Run time, differing cells and maximum elevation difference.
+
+    '''
+
+    workspace = tempfile.mkdtemp(dir = scratch_dir)
+    try:
+        start = time.perf_counter()
+        distance_grid, allocation_grid = stream_pixel_zones(stream_pixels, os.path.join(workspace, 'demDerived_streamPixels_ids.tif'))
+        allocation_sec = time.perf_counter() - start
+
+        adjusted_dem = os.path.join(workspace, 'dem_lateral_thalweg_adj.tif')
+        start = time.perf_counter()
+        adjust_thalweg_laterally(dem_meters, stream_pixels, allocation_grid, distance_grid, cost_distance_tolerance, adjusted_dem, number_of_jobs)
+        adjustment_sec = time.perf_counter() - start
+
+        with rasterio.open(reference_adjusted_dem) as reference, rasterio.open(adjusted_dem) as adjusted:
+            reference_elevation, adjusted_elevation = reference.read(1), adjusted.read(1)
+    finally:
+        shutil.rmtree(workspace)
+
+    differing = ~((reference_elevation == adjusted_elevation) | (np.isnan(reference_elevation) & np.isnan(adjusted_elevation)))
+
+    results = {'allocation_sec' : round(allocation_sec, 2), 'adjustment_sec' : round(adjustment_sec, 2),
+               'differing_cells' : int(differing.sum()),
+               'max_elevation_difference' : float(np.abs(reference_elevation[differing] - adjusted_elevation[differing]).max()) if differing.any() else 0.0,
+               'cells' : int(reference_elevation.size)}
+
+    for key, value in results.items():
+        print('{} : {}'.format(key, value))
+
+    return(results)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Compare the lateral thalweg adjustment with a reference dem_lateral_thalweg_adj.tif')
+    parser.add_argument('-e', '--dem_meters', help = 'Elevation raster (dem_meters.tif)', required = True)
+    parser.add_argument('-s', '--stream_pixels', help = 'Stream pixel raster (demDerived_streamPixels.tif)', required = True)
+    parser.add_argument('-r', '--reference', help = 'Reference dem_lateral_thalweg_adj.tif', required = True)
+    parser.add_argument('-t', '--cost_distance_tolerance', help = 'Tolerance in meters. Default is 50', required = False, default = 50, type = float)
+    parser.add_argument('-j', '--number_of_jobs', help = 'Number of threads processing blocks', required = False, default = None, type = int)
+    parser.add_argument('-d', '--scratch_dir', help = 'Directory for the outputs of the rerun', required = False, default = None)
+
+    args = vars(parser.parse_args())
+
+    lateral_thalweg_adjustment_comparison(args['dem_meters'], args['stream_pixels'], args['reference'], args['cost_distance_tolerance'], args['number_of_jobs'], args['scratch_dir'])
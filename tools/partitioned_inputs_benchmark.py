@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+import geopandas as gpd
+sys.path.append('/foss_fim/src')
+from partition_vector_inputs import read_partitioned_vector, has_partitions
+
+
+def partitioned_inputs_benchmark(hucs, wbd_filename, vector_filenames, partition_dir, wbd_buffer_distance=5000, output_csv=None):
+    '''
+    Compares the per-HUC read time of the national vector layers (gpd.read_file with a mask, as clip_vectors_to_wbd.py
+    did) with reads from the partitioned store. Feature counts of both reads are reported so mismatches show up.
+
+    '''
+
+    records = []
+    for huc in hucs:
+        huc_level = len(huc)
+        wbd = gpd.read_file(wbd_filename, layer='WBDHU{}'.format(huc_level))
+        wbd = wbd.loc[wbd['HUC{}'.format(huc_level)] == huc]
+        wbd_buffer = wbd[['geometry']].copy()
+        wbd_buffer.geometry = wbd.geometry.buffer(wbd_buffer_distance, resolution=32)
+
+        for vector_filename in vector_filenames:
+            if not has_partitions(partition_dir, vector_filename):
+                print('{} is not in {}. Skipping'.format(vector_filename, partition_dir))
+                continue
+
+            national_start = time.perf_counter()
+            national = gpd.read_file(vector_filename, mask=wbd_buffer)
+            national_sec = time.perf_counter() - national_start
+
+            partitioned_start = time.perf_counter()
+            partitioned = read_partitioned_vector(partition_dir, vector_filename, wbd_buffer, huc, wbd_buffer_distance)
+            partitioned_sec = time.perf_counter() - partitioned_start
+
+            records.append({'huc' : huc, 'layer' : os.path.basename(vector_filename),
+                            'national_sec' : round(national_sec, 3), 'partitioned_sec' : round(partitioned_sec, 3),
+                            'national_features' : len(national), 'partitioned_features' : len(partitioned)})
+
+    results = pd.DataFrame(records)
+    if results.empty:
+        return(results)
+
+    results['speedup'] = (results.national_sec / results.partitioned_sec).round(2)
+    print(results.to_string(index=False))
+
+    mismatches = results.loc[results.national_features != results.partitioned_features]
+    if not mismatches.empty:
+        print('Feature counts differ for {} HUC/layer pairs'.format(len(mismatches)))
+
+    if output_csv is not None:
+        results.to_csv(output_csv, index=False)
+
+    return(results)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare per-HUC read time of national vector inputs and the partitioned store')
+    parser.add_argument('-u', '--hucs', help='HUCs to read', required=True, nargs='+')
+    parser.add_argument('-w', '--wbd', help='WBD_National.gpkg', required=True)
+    parser.add_argument('-v', '--vectors', help='National vector layers', required=True, nargs='+')
+    parser.add_argument('-p', '--partition-dir', help='Partitioned store (see src/partition_vector_inputs.py)', required=True)
+    parser.add_argument('-b', '--wbd-buffer-distance', help='WBD buffer distance. Default is 5000', required=False, default=5000, type=float)
+    parser.add_argument('-o', '--output-csv', help='Per HUC and layer results', required=False, default=None)
+
+    args = vars(parser.parse_args())
+
+    partitioned_inputs_benchmark(args['hucs'], args['wbd'], args['vectors'], args['partition_dir'], args['wbd_buffer_distance'], args['output_csv'])
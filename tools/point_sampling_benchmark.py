@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import argparse
+import numpy as np
+import rasterio
+import rasterio.sample
+sys.path.append('/foss_fim/src')
+from utils.point_sampling import sample_points
+
+
+def point_sampling_benchmark(raster_filename, number_of_points=100000, seed=0):
+    '''
+    Samples random points of a raster with rasterio.sample.sample_gen (one read per point) and with the batched
+    sample_points, and reports points per second and the number of differing values.
+
+    Parameters
+    ----------
+    raster_filename : STR
+        Raster to sample. For example, dem_meters.tif.
+    number_of_points : INT
+        Number of random points within the raster bounds.
+    seed : INT
+        Random seed.
+
+    Returns
+    -------
+    results : DICT
+        Points per second of both methods and differing values.
+
+    '''
+
+    with rasterio.open(raster_filename) as raster:
+        bounds = raster.bounds
+        random = np.random.RandomState(seed)
+        xs = random.uniform(bounds.left, bounds.right, number_of_points)
+        ys = random.uniform(bounds.bottom, bounds.top, number_of_points)
+
+        sample_gen_start = time.perf_counter()
+        sample_gen_values = np.array([value[0] for value in rasterio.sample.sample_gen(raster, zip(xs, ys))])
+        sample_gen_sec = time.perf_counter() - sample_gen_start
+
+        batched_start = time.perf_counter()
+        batched_values = sample_points(raster, xs, ys)
+        batched_sec = time.perf_counter() - batched_start
+
+    differing = ~((sample_gen_values == batched_values) | (np.isnan(sample_gen_values.astype('float64')) & np.isnan(batched_values.astype('float64'))))
+
+    results = {'points' : number_of_points,
+               'sample_gen_points_per_sec' : round(number_of_points / sample_gen_sec),
+               'batched_points_per_sec' : round(number_of_points / batched_sec),
+               'differing_values' : int(differing.sum())}
+
+    for key, value in results.items():
+        print('{} : {}'.format(key, value))
+
+    return(results)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Benchmark batched raster point sampling against rasterio sample_gen')
+    parser.add_argument('-r', '--raster', help = 'Raster to sample', required = True)
+    parser.add_argument('-n', '--number_of_points', help = 'Number of random points. Default is 100000', required = False, default = 100000, type = int)
+    parser.add_argument('-s', '--seed', help = 'Random seed. Default is 0', required = False, default = 0, type = int)
+
+    args = vars(parser.parse_args())
+
+    point_sampling_benchmark(args['raster'], args['number_of_points'], args['seed'])
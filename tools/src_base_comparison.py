@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import rasterio
+from affine import Affine
+sys.path.append('/foss_fim/src')
+from catchment_hydraulic_geometry import catchment_hydraulic_geometry, read_stages, read_catchment_list
+
+
+def src_base_comparison(huc_dir, taudem_dir=os.environ.get('taudemDir'), number_of_jobs=None, scratch_dir=None):
+    '''
+    Runs TauDEM catchhydrogeo and catchment_hydraulic_geometry on the outputs of a HUC and compares the src_base tables.
+
+    Parameters
+    ----------
+    huc_dir : STR
+        HUC output directory (kept with the rem_zeroed_masked.tif, catchment, slope, stage and catchment list files).
+    taudem_dir : STR
+        Directory of the TauDEM executables. Defaults to the taudemDir environment variable of the container.
+    number_of_jobs : INT
+        Number of threads of catchment_hydraulic_geometry.
+    scratch_dir : STR
+        Directory for the TauDEM table.
+
+    Returns
+    -------
+    results : DICT
+        Run times and maximum absolute difference of each column.
+
+    '''
+
+    hand = os.path.join(huc_dir, 'rem_zeroed_masked.tif')
+    catchments = os.path.join(huc_dir, 'gw_catchments_reaches_filtered_addedAttributes.tif')
+    slopes = os.path.join(huc_dir, 'slopes_d8_dem_meters_masked.tif')
+    stages = os.path.join(huc_dir, 'stage.txt')
+    catchlist = os.path.join(huc_dir, 'catchment_list.txt')
+
+    workspace = tempfile.mkdtemp(dir = scratch_dir)
+    try:
+        taudem_table = os.path.join(workspace, 'src_base.csv')
+        taudem_start = time.perf_counter()
+        subprocess.run([os.path.join(taudem_dir, 'catchhydrogeo'), '-hand', hand, '-catch', catchments, '-catchlist', catchlist,
+                        '-slp', slopes, '-h', stages, '-table', taudem_table], check = True)
+        taudem_sec = time.perf_counter() - taudem_start
+        taudem_src_base = pd.read_csv(taudem_table).rename(columns = lambda x: x.strip(' '))
+    finally:
+        shutil.rmtree(workspace)
+
+    native_start = time.perf_counter()
+    native_src_base = catchment_hydraulic_geometry(hand, catchments, slopes, read_stages(stages), read_catchment_list(catchlist), number_of_jobs)
+    native_sec = time.perf_counter() - native_start
+
+    results = {'taudem_sec' : round(taudem_sec, 2), 'native_sec' : round(native_sec, 2),
+               'rows' : len(native_src_base), 'taudem_rows' : len(taudem_src_base)}
+    if len(native_src_base) == len(taudem_src_base):
+        for column in native_src_base.columns:
+            difference = np.abs(native_src_base[column].values.astype('float64') - taudem_src_base[column].values.astype('float64'))
+            results['max_difference {}'.format(column)] = float(difference.max())
+
+    for key, value in results.items():
+        print('{} : {}'.format(key, value))
+
+    return(results)
+
+
+def write_synthetic_huc(huc_dir, shape=(24, 20), seed=0):
+    '''
+    Writes the catchhydrogeo inputs of a small synthetic HUC with the file names of a HUC output directory: HAND on the
+    stage grid (stages are exact in float32, so cells tie with the stages), nodata HAND and slope cells, and a catchment missing from the list.
+
+    '''
+
+    rng = np.random.default_rng(seed)
+    profile = {'driver' : 'GTiff', 'width' : shape[1], 'height' : shape[0], 'count' : 1, 'crs' : 'EPSG:5070',
+               'transform' : Affine(10, 0, 0, 0, -10, shape[0] * 10), 'tiled' : True, 'blockxsize' : 16, 'blockysize' : 16}
+
+    hand = (rng.integers(0, 12, shape) * 0.25).astype('float32')
+    hand[rng.random(shape) < 0.05] = -999999
+    catchments = rng.integers(1, 5, shape).astype('int32')
+    slopes = rng.uniform(0, 0.5, shape).astype('float32')
+    slopes[rng.random(shape) < 0.05] = -1
+
+    for fileName, values, nodata in [('rem_zeroed_masked.tif', hand, -999999), ('gw_catchments_reaches_filtered_addedAttributes.tif', catchments, 0),
+                                     ('slopes_d8_dem_meters_masked.tif', slopes, -1)]:
+        with rasterio.open(os.path.join(huc_dir, fileName), 'w', dtype=values.dtype, nodata=nodata, **profile) as raster:
+            raster.write(values, 1)
+
+    # same formats as make_stages_and_catchlist.py; catchment 4 is not listed
+    with open(os.path.join(huc_dir, 'stage.txt'), 'w') as f:
+        f.write("Stage\n")
+        for stage in np.arange(0, 10) * 0.25:
+            f.write("{}\n".format(stage))
+
+    catchlist = [(3, 0.002, 1.2, 0.02), (1, 0.0005, 0.8, 0.015), (2, 0.01, 2.5, 0.018)]
+    with open(os.path.join(huc_dir, 'catchment_list.txt'), 'w') as f:
+        f.write("{}\n".format(len(catchlist)))
+        for h, s, l, a in catchlist:
+            f.write("{} {} {} {}\n".format(h, s, l, a))
+
+
+def write_fixture(fixture_dir, taudem_dir=os.environ.get('taudemDir')):
+    '''
+    Writes a synthetic HUC and its TauDEM catchhydrogeo src_base.csv to fixture_dir (tests/data/catchhydrogeo, read
+    by tests/test_catchment_hydraulic_geometry.py).
+
+    '''
+
+    os.makedirs(fixture_dir, exist_ok = True)
+    write_synthetic_huc(fixture_dir)
+
+    subprocess.run([os.path.join(taudem_dir, 'catchhydrogeo'), '-hand', os.path.join(fixture_dir, 'rem_zeroed_masked.tif'),
+                    '-catch', os.path.join(fixture_dir, 'gw_catchments_reaches_filtered_addedAttributes.tif'),
+                    '-catchlist', os.path.join(fixture_dir, 'catchment_list.txt'), '-slp', os.path.join(fixture_dir, 'slopes_d8_dem_meters_masked.tif'),
+                    '-h', os.path.join(fixture_dir, 'stage.txt'), '-table', os.path.join(fixture_dir, 'src_base.csv')], check = True)
+
+    src_base_comparison(fixture_dir, taudem_dir)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Compare TauDEM catchhydrogeo with catchment_hydraulic_geometry')
+    parser.add_argument('-d', '--huc_dir', help = 'HUC output directory', required = False, default = None)
+    parser.add_argument('-t', '--taudem_dir', help = 'Directory of the TauDEM executables. Default is $taudemDir', required = False, default = os.environ.get('taudemDir'))
+    parser.add_argument('-j', '--number_of_jobs', help = 'Number of threads of catchment_hydraulic_geometry', required = False, default = None, type = int)
+    parser.add_argument('-s', '--scratch_dir', help = 'Directory for the TauDEM table', required = False, default = None)
+    parser.add_argument('-f', '--fixture_dir', help = 'Write a synthetic HUC and its catchhydrogeo table here instead of comparing a HUC (tests/data/catchhydrogeo)', required = False, default = None)
+
+    args = vars(parser.parse_args())
+
+    if args['fixture_dir'] is not None:
+        write_fixture(args['fixture_dir'], args['taudem_dir'])
+    else:
+        src_base_comparison(args['huc_dir'], args['taudem_dir'], args['number_of_jobs'], args['scratch_dir'])